@@ -12,6 +12,7 @@ from migen.fhdl.structure import _Fragment
 
 from litex.build.generic_platform import Pins, IOStandard, Misc
 from litex.build import tools
+from litex.build import cache
 
 
 def _format_constraint(c, signame, fmt_r):
@@ -155,7 +156,7 @@ class AlteraQuartusToolchain:
         self.false_paths = set()
 
     def build(self, platform, fragment, build_dir="build", build_name="top",
-              toolchain_path=None, run=True, **kwargs):
+              toolchain_path=None, run=True, build_cache=None, **kwargs):
         if toolchain_path is None:
             toolchain_path="/opt/Altera"
         cwd = os.getcwd()
@@ -166,9 +167,9 @@ class AlteraQuartusToolchain:
             fragment = fragment.get_fragment()
         platform.finalize(fragment)
 
-        v_output = platform.get_verilog(fragment, name=build_name, **kwargs)
-        named_sc, named_pc = platform.resolve_signals(v_output.ns)
         v_file = build_name + ".v"
+        v_output = platform.get_verilog(fragment, name=build_name, filename=v_file, **kwargs)
+        named_sc, named_pc = platform.resolve_signals(v_output.ns)
         v_output.write(v_file)
         platform.add_source(v_file)
         _build_files(platform.device,
@@ -181,7 +182,14 @@ class AlteraQuartusToolchain:
 
         _build_sdc(self.clocks, self.false_paths, v_output.ns, build_name)
         if run:
-            _run_quartus(build_name, toolchain_path, platform.create_rbf)
+            cache.run_cached(build_cache,
+                lambda: _run_quartus(build_name, toolchain_path, platform.create_rbf),
+                inputs=cache.build_inputs(platform, v_output,
+                    build_name + ".qsf", build_name + ".sdc", *platform.ips),
+                outputs=[build_name + ".sof", build_name + ".rbf", "*.rpt", "*.summary"],
+                options={"create_rbf": platform.create_rbf},
+                # the build script runs Quartus from $PATH
+                toolchain=(["quartus_sh", "--version"],))
 
         os.chdir(cwd)
 
@@ -0,0 +1,177 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import os
+import glob
+import json
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+
+def default_cache_directory():
+    directory = os.environ.get("LITEX_BUILD_CACHE", None)
+    if directory is None:
+        cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+        directory = os.path.join(cache_home, "litex", "build")
+    return directory
+
+
+def _settings_environment(settings):
+    # environment of the shell after sourcing the settings script
+    output = subprocess.run(["bash", "-c", "source \"$0\" >/dev/null 2>&1; env -0", settings],
+        stdout=subprocess.PIPE, check=True, timeout=120).stdout
+    env = dict()
+    for entry in output.decode("utf-8", errors="replace").split("\0"):
+        name, sep, value = entry.partition("=")
+        if sep:
+            env[name] = value
+    return env
+
+
+def toolchain_version(*commands, settings=None):
+    """Identifies the installed version of a toolchain
+
+    Each command is either a list, run to get its output (``["yosys", "-V"]``),
+    or the name of an executable, identified by its path, size and
+    modification time when it has no version option. Commands are looked up
+    and run in the environment set up by the ``settings`` script, when the
+    build scripts source one, and in the current environment otherwise.
+    """
+    env = None
+    if settings is not None:
+        try:
+            env = _settings_environment(settings)
+        except (OSError, subprocess.SubprocessError):
+            return settings + ": failed"
+    version = []
+    for command in commands:
+        if isinstance(command, str):
+            command = [command]
+        path = shutil.which(command[0], path=None if env is None else env.get("PATH", ""))
+        if path is None:
+            version.append(command[0] + ": not found")
+        elif len(command) > 1:
+            try:
+                output = subprocess.run([path] + command[1:], stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT, timeout=120, env=env).stdout
+                version.append(output.decode("utf-8", errors="replace"))
+            except (OSError, subprocess.SubprocessError):
+                version.append(command[0] + ": failed")
+        else:
+            st = os.stat(path)
+            version.append("{} {} {}".format(path, st.st_size, int(st.st_mtime)))
+    return "\n".join(version)
+
+
+class BuildCache:
+    """Content-addressed cache of toolchain outputs
+
+    Entries are keyed by a hash of the contents of the input files, the
+    toolchain options and the toolchain version, and hold a copy of the
+    outputs (bitstreams, reports) of the run that produced them.
+    """
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = default_cache_directory()
+        self.directory = os.path.abspath(directory)
+
+    def key(self, inputs, options=None, version=None):
+        h = hashlib.sha256()
+        def add(data):
+            h.update(str(len(data)).encode() + b":" + data)
+        for filename in sorted(set(inputs)):
+            if os.path.isdir(filename):
+                for root, dirs, files in os.walk(filename):
+                    dirs.sort()
+                    for name in sorted(files):
+                        path = os.path.join(root, name)
+                        add(os.path.relpath(path, filename).encode())
+                        with open(path, "rb") as f:
+                            add(f.read())
+            else:
+                add(os.path.basename(filename).encode())
+                with open(filename, "rb") as f:
+                    add(f.read())
+        add(json.dumps(options, sort_keys=True, default=str).encode())
+        add((version or "").encode())
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def restore(self, key, directory="."):
+        """Copies the outputs of entry ``key`` to ``directory``, returns False on a miss"""
+        entry = self._entry(key)
+        files = [os.path.join(root, name)
+            for root, dirs, names in os.walk(entry) for name in names]
+        if not files:
+            # no entry, or an entry without outputs
+            return False
+        for path in files:
+            destination = os.path.join(directory, os.path.relpath(path, entry))
+            os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+            shutil.copy2(path, destination)
+        return True
+
+    def store(self, key, outputs, directory="."):
+        """Stores the files of ``directory`` matching the ``outputs`` patterns in entry ``key``
+
+        Nothing is stored when no file matches, returns False in that case.
+        """
+        paths = [path for pattern in outputs
+            for path in glob.glob(os.path.join(directory, pattern)) if os.path.isfile(path)]
+        if not paths:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp_", dir=self.directory)
+        try:
+            for path in paths:
+                destination = os.path.join(tmp, os.path.relpath(path, directory))
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copy2(path, destination)
+            try:
+                os.rename(tmp, self._entry(key))
+            except OSError:
+                # entry stored concurrently by another build
+                pass
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return True
+
+
+def run_cached(build_cache, run, inputs, outputs, options=None, toolchain=(), settings=None):
+    """Calls ``run`` unless the outputs of a run with the same inputs are cached
+
+    ``build_cache`` is a ``BuildCache``, a cache directory, True for the
+    default cache directory, or None to always run. ``inputs`` are the files
+    (or directories) read by the toolchain, ``outputs`` the glob patterns of
+    the files to store, relative to the current directory, and ``toolchain``
+    and ``settings`` the commands and settings script passed to
+    ``toolchain_version``. Returns True when the outputs were restored from
+    the cache.
+    """
+    if build_cache is None or build_cache is False:
+        run()
+        return False
+    if isinstance(build_cache, BuildCache):
+        cache = build_cache
+    else:
+        cache = BuildCache(None if build_cache is True else build_cache)
+    key = cache.key(inputs, options, toolchain_version(*toolchain, settings=settings))
+    if cache.restore(key):
+        print("Restored build outputs from cache ({})".format(key[:16]))
+        return True
+    run()
+    cache.store(key, outputs)
+    return False
+
+
+def build_inputs(platform, v_output, *files):
+    """Lists the files read by a toolchain run: ``files``, sources, includes and data files"""
+    inputs = list(files)
+    inputs += [filename for filename, language, library in platform.sources]
+    inputs += list(v_output.data_files)
+    inputs += [path for path in platform.verilog_include_paths if os.path.isdir(path)]
+    return inputs
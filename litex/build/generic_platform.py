@@ -10,6 +10,7 @@ from migen.genlib.record import Record
 from migen.genlib.io import CRG
 
 from litex.gen.fhdl import verilog
+from litex.gen.fhdl.profiler import ConversionProfiler
 
 from litex.build import tools
 
@@ -366,11 +367,29 @@ class GenericPlatform:
 
         return named_sc, named_pc
 
-    def get_verilog(self, fragment, **kwargs):
-        return verilog.convert(
+    def get_verilog(self, fragment, profile=None, **kwargs):
+        # profile: see verilog.convert, the profile also covers get_io_signals
+        if not profile:
+            return verilog.convert(
+                fragment,
+                self.constraint_manager.get_io_signals(),
+                create_clock_domains=False, **kwargs)
+        if isinstance(profile, ConversionProfiler):
+            profiler = profile
+        else:
+            profiler = ConversionProfiler(counts=True)
+        with profiler.measure("get_io_signals"):
+            ios = self.constraint_manager.get_io_signals()
+        # verilog.convert does not dump a profiler it is given
+        r = verilog.convert(
             fragment,
-            self.constraint_manager.get_io_signals(),
-            create_clock_domains=False, **kwargs)
+            ios,
+            create_clock_domains=False, profile=profiler, **kwargs)
+        if profile is True:
+            profiler.dump()
+        elif isinstance(profile, str):
+            profiler.dump(profile)
+        return r
 
     def get_edif(self, fragment, cell_library, vendor, device, **kwargs):
         return edif.convert(
@@ -12,6 +12,7 @@ from migen.fhdl.structure import _Fragment
 
 from litex.build.generic_platform import *
 from litex.build import tools
+from litex.build import cache
 from litex.build.lattice import common
 
 
@@ -132,7 +133,7 @@ class LatticeDiamondToolchain:
     special_overrides = common.lattice_ecpx_special_overrides
 
     def build(self, platform, fragment, build_dir="build", build_name="top",
-              toolchain_path=None, run=True, **kwargs):
+              toolchain_path=None, run=True, build_cache=None, **kwargs):
         if toolchain_path is None:
             toolchain_path = "/opt/Diamond"
         os.makedirs(build_dir, exist_ok=True)
@@ -143,9 +144,9 @@ class LatticeDiamondToolchain:
             fragment = fragment.get_fragment()
         platform.finalize(fragment)
 
-        v_output = platform.get_verilog(fragment, name=build_name, **kwargs)
-        named_sc, named_pc = platform.resolve_signals(v_output.ns)
         v_file = build_name + ".v"
+        v_output = platform.get_verilog(fragment, name=build_name, filename=v_file, **kwargs)
+        named_sc, named_pc = platform.resolve_signals(v_output.ns)
         v_output.write(v_file)
         sources = platform.sources | {(v_file, "verilog", "work")}
         _build_files(platform.device, sources, platform.verilog_include_paths, build_name)
@@ -154,7 +155,11 @@ class LatticeDiamondToolchain:
 
         script = _build_script(build_name, platform.device, toolchain_path)
         if run:
-            _run_script(script)
+            cache.run_cached(build_cache, lambda: _run_script(script),
+                inputs=cache.build_inputs(platform, v_output,
+                    v_file, build_name + ".tcl", build_name + ".lpf", script),
+                outputs=[build_name + ".bit", build_name + ".jed", "impl/*.twr", "impl/*.mrp"],
+                toolchain=(os.path.join(toolchain_path, "pnmainc"),))
 
         os.chdir(cwd)
 
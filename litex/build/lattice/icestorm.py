@@ -10,6 +10,7 @@ from migen.fhdl.structure import _Fragment
 
 from litex.build.generic_platform import *
 from litex.build import tools
+from litex.build import cache
 from litex.build.lattice import common
 
 
@@ -124,7 +125,8 @@ class LatticeIceStormToolchain:
 
     # platform.device should be of the form "ice40-{lp384, hx1k, etc}-{tq144, etc}"
     def build(self, platform, fragment, build_dir="build", build_name="top",
-              toolchain_path=None, use_nextpnr=True, synth_opts="", run=True, **kwargs):
+              toolchain_path=None, use_nextpnr=True, synth_opts="", run=True,
+              build_cache=None, **kwargs):
         os.makedirs(build_dir, exist_ok=True)
         cwd = os.getcwd()
         os.chdir(build_dir)
@@ -133,9 +135,9 @@ class LatticeIceStormToolchain:
             fragment = fragment.get_fragment()
         platform.finalize(fragment)
 
-        v_output = platform.get_verilog(fragment, name=build_name, **kwargs)
-        named_sc, named_pc = platform.resolve_signals(v_output.ns)
         v_file = build_name + ".v"
+        v_output = platform.get_verilog(fragment, name=build_name, filename=v_file, **kwargs)
+        named_sc, named_pc = platform.resolve_signals(v_output.ns)
         v_output.write(v_file)
 
         if use_nextpnr:
@@ -181,7 +183,16 @@ class LatticeIceStormToolchain:
                                freq_constraint=freq_constraint)
 
         if run:
-            _run_script(script)
+            inputs = [v_file, ys_name, build_name + ".pcf", script]
+            if use_nextpnr:
+                inputs.append(build_name + "_pre_pack.py")
+                toolchain = (["yosys", "-V"], ["nextpnr-ice40", "--version"], "icepack")
+            else:
+                toolchain = (["yosys", "-V"], ["arachne-pnr", "--version"], "icetime", "icepack")
+            cache.run_cached(build_cache, lambda: _run_script(script),
+                inputs=cache.build_inputs(platform, v_output, *inputs),
+                outputs=[build_name + ".bin", build_name + ".txt", build_name + ".rpt", build_name + ".tim"],
+                toolchain=toolchain)
 
         os.chdir(cwd)
 
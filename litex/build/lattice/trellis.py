@@ -11,6 +11,7 @@ from migen.fhdl.structure import _Fragment
 
 from litex.build.generic_platform import *
 from litex.build import tools
+from litex.build import cache
 from litex.build.lattice import common
 
 # TODO:
@@ -150,7 +151,7 @@ class LatticeTrellisToolchain:
         self.freq_constraints = dict()
 
     def build(self, platform, fragment, build_dir="build", build_name="top",
-              toolchain_path=None, run=True, **kwargs):
+              toolchain_path=None, run=True, build_cache=None, **kwargs):
         if toolchain_path is None:
             toolchain_path = "/usr/share/trellis/"
         os.makedirs(build_dir, exist_ok=True)
@@ -162,9 +163,9 @@ class LatticeTrellisToolchain:
             fragment = fragment.get_fragment()
         platform.finalize(fragment)
 
-        top_output = platform.get_verilog(fragment, name=build_name, **kwargs)
-        named_sc, named_pc = platform.resolve_signals(top_output.ns)
         top_file = build_name + ".v"
+        top_output = platform.get_verilog(fragment, name=build_name, filename=top_file, **kwargs)
+        named_sc, named_pc = platform.resolve_signals(top_output.ns)
         top_output.write(top_file)
         platform.add_source(top_file)
 
@@ -191,7 +192,12 @@ class LatticeTrellisToolchain:
 
         # run scripts
         if run:
-            _run_script(script)
+            cache.run_cached(build_cache, lambda: _run_script(script),
+                inputs=cache.build_inputs(platform, top_output,
+                    yosys_script_file, build_name + ".lpf", script),
+                outputs=[build_name + ".bit", build_name + ".svf", build_name + ".config", build_name + ".rpt"],
+                # the build script runs the tools from $PATH
+                toolchain=(["yosys", "-V"], ["nextpnr-ecp5", "--version"], "ecppack"))
 
         os.chdir(cwd)
 
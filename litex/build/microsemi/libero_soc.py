@@ -230,7 +230,9 @@ class MicrosemiLiberoSoCPolarfireToolchain:
         self.additional_timing_constraints = []
 
     def build(self, platform, fragment, build_dir="build", build_name="top",
-              toolchain_path=None, run=False, **kwargs):
+              toolchain_path=None, run=False, build_cache=None, **kwargs):
+        if build_cache is not None:
+            print("[WARNING] Build cache not supported by this toolchain, ignored")
         # create build directory
         os.makedirs(build_dir, exist_ok=True)
         cwd = os.getcwd()
@@ -242,9 +244,9 @@ class MicrosemiLiberoSoCPolarfireToolchain:
         platform.finalize(fragment)
 
         # generate top module
-        top_output = platform.get_verilog(fragment, name=build_name, **kwargs)
-        named_sc, named_pc = platform.resolve_signals(top_output.ns)
         top_file = build_name + ".v"
+        top_output = platform.get_verilog(fragment, name=build_name, filename=top_file, **kwargs)
+        named_sc, named_pc = platform.resolve_signals(top_output.ns)
         top_output.write(top_file)
         platform.add_source(top_file)
 
@@ -0,0 +1,53 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import os
+import multiprocessing
+from concurrent import futures
+
+
+def run_processes(function, tasks, processes=None, memory=None, done=None):
+    """Calls ``function(*args)`` for each ``(args, task_memory)`` of ``tasks`` in its own process
+
+    Each task runs in a new process, so that no module-level state (such as
+    the name counters of migen) is shared between tasks. At most
+    ``processes`` tasks (default: the number of CPUs) run at the same time.
+    Tasks are started in order and, when ``memory`` is given, only while
+    the sum of the ``task_memory`` of the running tasks fits in it: a task
+    that does not fit waits for memory to be freed, and the following tasks
+    wait behind it (it is always started when nothing else is running).
+    ``done(index, future)`` is called as each task completes. Returns the
+    futures of the tasks, in the order of ``tasks``.
+    """
+    tasks = list(tasks)
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    results = [None]*len(tasks)
+    pending = 0
+    running = dict()
+    # fork would duplicate the threads and state of the calling process
+    context = multiprocessing.get_context("spawn")
+    try:
+        while pending < len(tasks) or running:
+            used = sum(tasks[index][1] for index, executor in running.values())
+            while pending < len(tasks) and len(running) < processes:
+                args, task_memory = tasks[pending]
+                if running and memory is not None and used + task_memory > memory:
+                    break
+                # a pool of one process per task, as workers are reused
+                executor = futures.ProcessPoolExecutor(max_workers=1, mp_context=context)
+                running[executor.submit(function, *args)] = (pending, executor)
+                used += task_memory
+                pending += 1
+            completed, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in completed:
+                index, executor = running.pop(future)
+                executor.shutdown()
+                results[index] = future
+                if done is not None:
+                    done(index, future)
+    finally:
+        for index, executor in running.values():
+            executor.shutdown(cancel_futures=True)
+    return results
@@ -9,6 +9,9 @@
 #define RC_NOENMEM -3
 #define RC_JSERROR -4
 
+/* returned by a module tick to request a checkpoint of the simulation */
+#define RC_SAVE 1
+
 #define eprintf(format, ...) fprintf (stderr, "%s:%d "format, __FILE__, __LINE__,  ##__VA_ARGS__)
 
 #endif
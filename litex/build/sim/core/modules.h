@@ -3,6 +3,7 @@
 #ifndef __MODULE_H_
 #define __MODULE_H_
 
+#include <stdio.h>
 #include "pads.h"
 
 struct interface_s {
@@ -26,6 +27,10 @@ struct ext_module_s {
   int (*add_pads)(void *, struct pad_list_s *);
   int (*close)(void*);
   int (*tick)(void*);
+  /* optional, save/restore the session state in checkpoints: sessions of
+     modules without them restart fresh when a checkpoint is restored */
+  int (*save)(void*, FILE *);
+  int (*restore)(void*, FILE *);
 };
 
 struct ext_module_list_s {
@@ -92,13 +92,26 @@ static int clocker_tick(void *sess)
   return 0;
 }
 
+/* the clock level is a pad of the model, saved with it in checkpoints */
+static int clocker_save(void *sess, FILE *f)
+{
+  return RC_OK;
+}
+
+static int clocker_restore(void *sess, FILE *f)
+{
+  return RC_OK;
+}
+
 static struct ext_module_s ext_mod = {
   "clocker",
   clocker_start,
   clocker_new,
   clocker_add_pads,
   NULL,
-  clocker_tick
+  clocker_tick,
+  clocker_save,
+  clocker_restore
 };
 
 int litex_sim_ext_module_init(int (*register_module)(struct ext_module_s *))
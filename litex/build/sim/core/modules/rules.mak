@@ -4,6 +4,8 @@ $(OBJ_DIR)/%.o: %.c
 $(OBJ_DIR)/%.so: $(OBJ_DIR)/%.o
 	$(CC) $(LDFLAGS) -Wl,-soname,$@ -o $@ $<
 
+-include $(wildcard $(OBJ_DIR)/*.d)
+
 .PHONY: clean
 clean:
-	rm -f $(OBJ_DIR)/*.o $(OBJ_DIR)/*.so
+	rm -f $(OBJ_DIR)/*.o $(OBJ_DIR)/*.d $(OBJ_DIR)/*.so
@@ -169,13 +169,41 @@ static int serial2console_tick(void *sess) {
   return RC_OK;
 }
 
+static int serial2console_save(void *sess, FILE *f)
+{
+  struct session_s *s = (struct session_s*)sess;
+  int i;
+
+  /* pending input characters */
+  fwrite(&s->datalen, sizeof(s->datalen), 1, f);
+  for(i = 0; i < s->datalen; i++)
+    fputc(s->databuf[(s->data_start + i) % 2048], f);
+  return ferror(f) ? RC_ERROR : RC_OK;
+}
+
+static int serial2console_restore(void *sess, FILE *f)
+{
+  struct session_s *s = (struct session_s*)sess;
+  int datalen;
+
+  if(1 != fread(&datalen, sizeof(datalen), 1, f) || datalen < 0 || datalen > 2048)
+    return RC_ERROR;
+  s->data_start = 0;
+  s->datalen = datalen;
+  if(datalen != fread(s->databuf, 1, datalen, f))
+    return RC_ERROR;
+  return RC_OK;
+}
+
 static struct ext_module_s ext_mod = {
   "serial2console",
   serial2console_start,
   serial2console_new,
   serial2console_add_pads,
   NULL,
-  serial2console_tick
+  serial2console_tick,
+  serial2console_save,
+  serial2console_restore
 };
 
 int litex_sim_ext_module_init(int (*register_module) (struct ext_module_s *))
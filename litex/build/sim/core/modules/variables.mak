@@ -1,5 +1,6 @@
-CC = gcc
-CFLAGS = -Wall -O3 -ggdb -fPIC -Werror
+CC = $(CCACHE) gcc
+# -MMD -MP: objects depend on the headers they include (see rules.mak)
+CFLAGS = -Wall -O3 -ggdb -fPIC -Werror -MMD -MP
 LDFLAGS = -levent -shared -fPIC
 
 OBJ_DIR ?= .
@@ -12,6 +12,8 @@
 #include <sys/socket.h>
 #endif
 #include <stdlib.h>
+#include <stdint.h>
+#include <time.h>
 #include "error.h"
 #include "modules.h"
 #include "pads.h"
@@ -34,6 +36,173 @@ struct session_list_s {
 struct session_list_s *sesslist=NULL;
 struct event_base *base=NULL;
 
+/* simulation speed report, the default clocker toggles sys_clk every tick */
+static uint64_t sim_ticks=0;
+static volatile sig_atomic_t sim_interrupted=0;
+
+static double litex_sim_now(void)
+{
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return ts.tv_sec + ts.tv_nsec*1e-9;
+}
+
+static void litex_sim_interrupt(int signum)
+{
+  sim_interrupted=1;
+}
+
+/* checkpoints
+ *
+ * A checkpoint holds the state of the Verilated model (save_file, the model
+ * must be built with --savable), which includes the pads driven by the
+ * modules, the simulated time and the state of the module sessions that
+ * implement the save/restore hooks (save_file.modules). Modules without
+ * these hooks restart from a fresh session on restore: connections (TCP,
+ * TAP) and data they had buffered are lost, a warning lists them.
+ */
+static char *save_file="dut.ckpt";
+static char *restore_file=NULL;
+static uint64_t save_at=0;
+static int save_requested=0;
+
+static int litex_sim_parse_cmdargs(int argc, char *argv[])
+{
+  char *value, *end;
+  int i;
+
+  for(i = 1; i < argc; i++)
+  {
+    if(!strncmp(argv[i], "--save=", 7))
+      save_file = argv[i] + 7;
+    else if(!strncmp(argv[i], "--save-at=", 10))
+    {
+      value = argv[i] + 10;
+      errno = 0;
+      save_at = strtoull(value, &end, 0);
+      if(!*value || *end || errno || strchr(value, '-') || !save_at)
+      {
+        eprintf("Invalid cycle in %s\n", argv[i]);
+        return RC_INVARG;
+      }
+    }
+    else if(!strncmp(argv[i], "--restore=", 10))
+      restore_file = argv[i] + 10;
+  }
+  return RC_OK;
+}
+
+static FILE *litex_sim_open_modules_file(const char *filename, const char *mode)
+{
+  char path[1024];
+
+  snprintf(path, sizeof(path), "%s.modules", filename);
+  return fopen(path, mode);
+}
+
+static void litex_sim_warn_stateless(const char *action, const char *filename)
+{
+  struct session_list_s *s;
+
+  for(s = sesslist; s; s=s->next)
+  {
+    if(!s->module->save || !s->module->restore)
+      fprintf(stderr, "[litex_sim] warning: %s %s without the state of module %s\n",
+        action, filename, s->module->name);
+  }
+}
+
+static int litex_sim_save_all(void *vdut, const char *filename)
+{
+  struct session_list_s *s;
+  FILE *f;
+  int ret;
+
+  if(RC_OK != (ret = litex_sim_save(vdut, filename)))
+    goto out;
+  f = litex_sim_open_modules_file(filename, "wb");
+  if(!f)
+  {
+    eprintf("Can't open %s.modules: %s\n", filename, strerror(errno));
+    ret = RC_ERROR;
+    goto out;
+  }
+  fwrite(&sim_ticks, sizeof(sim_ticks), 1, f);
+  for(s = sesslist; s && RC_OK == ret; s=s->next)
+  {
+    fprintf(f, "%s\n", s->module->name);
+    if(s->module->save && RC_OK != (ret = s->module->save(s->session, f)))
+      eprintf("Module %s failed to save its state\n", s->module->name);
+  }
+  if(ferror(f))
+    ret = RC_ERROR;
+  if(fclose(f) && RC_OK == ret)
+    ret = RC_ERROR;
+
+out:
+  if(RC_OK == ret)
+  {
+    litex_sim_warn_stateless("saved", filename);
+    fprintf(stderr, "\n[litex_sim] saved checkpoint %s at cycle %llu\n",
+      filename, (unsigned long long)sim_ticks/2);
+  }
+  else
+    fprintf(stderr, "\n[litex_sim] error: failed to save checkpoint %s at cycle %llu\n",
+      filename, (unsigned long long)sim_ticks/2);
+  return ret;
+}
+
+static int litex_sim_restore_all(void *vdut, const char *filename)
+{
+  struct session_list_s *s;
+  char name[256];
+  FILE *f;
+  int ret;
+
+  if(RC_OK != (ret = litex_sim_restore(vdut, filename)))
+    goto out;
+  f = litex_sim_open_modules_file(filename, "rb");
+  if(!f)
+  {
+    eprintf("Can't open %s.modules: %s\n", filename, strerror(errno));
+    ret = RC_ERROR;
+    goto out;
+  }
+  if(1 != fread(&sim_ticks, sizeof(sim_ticks), 1, f))
+    ret = RC_ERROR;
+  for(s = sesslist; s && RC_OK == ret; s=s->next)
+  {
+    /* sessions are restored in the order they were saved */
+    if(!fgets(name, sizeof(name), f) || strncmp(name, s->module->name, strlen(s->module->name)))
+    {
+      eprintf("Checkpoint %s does not match the simulation modules\n", filename);
+      ret = RC_ERROR;
+      break;
+    }
+    if(s->module->restore && RC_OK != (ret = s->module->restore(s->session, f)))
+      eprintf("Module %s failed to restore its state\n", s->module->name);
+  }
+  fclose(f);
+
+out:
+  if(RC_OK == ret)
+  {
+    litex_sim_warn_stateless("restored", filename);
+    fprintf(stderr, "[litex_sim] restored checkpoint %s at cycle %llu\n",
+      filename, (unsigned long long)sim_ticks/2);
+  }
+  else
+    fprintf(stderr, "[litex_sim] error: failed to restore checkpoint %s\n", filename);
+  return ret;
+}
+
+static void litex_sim_report_speed(double elapsed)
+{
+  uint64_t cycles = sim_ticks/2;
+  fprintf(stderr, "\n[litex_sim] %llu cycles in %.3f s (%.0f cycles/s)\n",
+    (unsigned long long)cycles, elapsed, elapsed > 0 ? cycles/elapsed : 0.0);
+}
+
 static int litex_sim_initialize_all(void **dut, void *base)
 {
   struct module_s *ml=NULL;
@@ -181,17 +350,30 @@ static void cb(int sock, short which, void *arg)
     for(s = sesslist; s; s=s->next)
     {
       if(s->tickfirst)
-	s->module->tick(s->session);
+	if(RC_SAVE == s->module->tick(s->session))
+	  save_requested = 1;
     }
     litex_sim_eval(vdut);
     litex_sim_dump();
     for(s = sesslist; s; s=s->next)
     {
       if(!s->tickfirst)
-	s->module->tick(s->session);
+	if(RC_SAVE == s->module->tick(s->session))
+	  save_requested = 1;
+    }
+
+    sim_ticks++;
+
+    if(save_at && sim_ticks == 2*save_at)
+      save_requested = 1;
+    if(save_requested)
+    {
+      if(RC_OK != litex_sim_save_all(vdut, save_file))
+        eprintf("Checkpoint failed, simulation continues\n");
+      save_requested = 0;
     }
 
-    if (litex_sim_got_finish()) {
+    if (litex_sim_got_finish() || sim_interrupted) {
         event_base_loopbreak(base);
         break;
     }
@@ -207,6 +389,7 @@ int main(int argc, char *argv[])
 {
   void *vdut=NULL;
   struct timeval tv;
+  double start;
 
   int ret;
 
@@ -225,6 +408,10 @@ int main(int argc, char *argv[])
   }
 
   litex_sim_init_cmdargs(argc, argv);
+  if(RC_OK != (ret = litex_sim_parse_cmdargs(argc, argv)))
+  {
+    goto out;
+  }
   if(RC_OK != (ret = litex_sim_initialize_all(&vdut, base)))
   {
     goto out;
@@ -235,11 +422,20 @@ int main(int argc, char *argv[])
     goto out;
   }
 
+  if(restore_file && RC_OK != (ret = litex_sim_restore_all(vdut, restore_file)))
+  {
+    goto out;
+  }
+
   tv.tv_sec = 0;
   tv.tv_usec = 0;
   ev = event_new(base, -1, EV_PERSIST, cb, vdut);
   event_add(ev, &tv);
+  signal(SIGINT, litex_sim_interrupt);
+  signal(SIGTERM, litex_sim_interrupt);
+  start = litex_sim_now();
   event_base_dispatch(base);
+  litex_sim_report_speed(litex_sim_now() - start);
 #if VM_COVERAGE
   litex_sim_coverage_dump();
 #endif
@@ -3,11 +3,15 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include "error.h"
 #include "Vdut.h"
 #include "Vdut.h"
 #include "verilated.h"
 #include "verilated_vcd_c.h"
 #include <verilated.h>
+#if VM_SAVABLE
+#include "verilated_save.h"
+#endif
 
 VerilatedVcdC* tfp;
 long tfp_start;
@@ -54,6 +58,46 @@ extern "C" int litex_sim_got_finish()
   return Verilated::gotFinish();
 }
 
+extern "C" int litex_sim_save(void *vdut, const char *filename)
+{
+#if VM_SAVABLE
+  Vdut *dut = (Vdut*)vdut;
+  VerilatedSave os;
+  os.open(filename);
+  if(!os.isOpen())
+  {
+    fprintf(stderr, "[litex_sim] can't open %s for writing\n", filename);
+    return RC_ERROR;
+  }
+  os << *dut;
+  os.close();
+  return RC_OK;
+#else
+  fprintf(stderr, "[litex_sim] model not built savable, can't save %s\n", filename);
+  return RC_ERROR;
+#endif
+}
+
+extern "C" int litex_sim_restore(void *vdut, const char *filename)
+{
+#if VM_SAVABLE
+  Vdut *dut = (Vdut*)vdut;
+  VerilatedRestore os;
+  os.open(filename);
+  if(!os.isOpen())
+  {
+    fprintf(stderr, "[litex_sim] can't open %s for reading\n", filename);
+    return RC_ERROR;
+  }
+  os >> *dut;
+  os.close();
+  return RC_OK;
+#else
+  fprintf(stderr, "[litex_sim] model not built savable, can't restore %s\n", filename);
+  return RC_ERROR;
+#endif
+}
+
 #if VM_COVERAGE
 extern "C" void litex_sim_coverage_dump()
 {
@@ -9,6 +9,8 @@ extern "C" void litex_sim_eval(void *vdut);
 extern "C" void litex_sim_init_tracer(void *vdut, long start, long end)
 extern "C" void litex_sim_tracer_dump();
 extern "C" int litex_sim_got_finish();
+extern "C" int litex_sim_save(void *vdut, const char *filename);
+extern "C" int litex_sim_restore(void *vdut, const char *filename);
 #if VM_COVERAGE
 extern "C" void litex_sim_coverage_dump();
 #endif
@@ -17,6 +19,8 @@ void litex_sim_eval(void *vdut);
 void litex_sim_init_tracer(void *vdut);
 void litex_sim_tracer_dump();
 int litex_sim_got_finish();
+int litex_sim_save(void *vdut, const char *filename);
+int litex_sim_restore(void *vdut, const char *filename);
 #if VM_COVERAGE
 void litex_sim_coverage_dump();
 #endif
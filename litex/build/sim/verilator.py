@@ -4,6 +4,8 @@
 
 import os
 import sys
+import hashlib
+import contextlib
 import subprocess
 
 from migen.fhdl.structure import _Fragment
@@ -101,14 +103,25 @@ extern "C" void litex_sim_init(void **out)
     tools.write_to_file("dut_init.cpp", content)
 
 
-def _generate_sim_variables(include_paths):
+def _generate_sim_variables(include_paths, threads, coverage, opt_level, output_split, savable):
     include = ""
     for path in include_paths:
         include += "-I"+path+" "
+    # build options are kept here rather than on the make command line: the
+    # file is only rewritten when they change, which triggers a rebuild
     content = """\
 SRC_DIR = {}
 INC_DIR = {}
-""".format(core_directory, include)
+OPT_LEVEL = {}
+THREADS = {}
+COVERAGE = {}
+OUTPUT_SPLIT = {}
+SAVABLE = {}
+""".format(core_directory, include, opt_level,
+    threads if int(threads) > 1 else "",
+    "1" if coverage else "",
+    output_split or "",
+    "1" if savable else "")
     tools.write_to_file("variables.mak", content)
 
 
@@ -117,24 +130,41 @@ def _generate_sim_config(config):
     tools.write_to_file("sim_config.js", content)
 
 
-def _build_sim(build_name, sources, threads, coverage, opt_level="O3"):
+def _build_sim(build_name, sources, jobs=None):
     makefile = os.path.join(core_directory, 'Makefile')
     cc_srcs = []
     for filename, language, library in sources:
         cc_srcs.append("--cc " + filename + " ")
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    # obj_dir is kept between builds: only what changed is rebuilt
     build_script_contents = """\
-rm -rf obj_dir/
-make -C . -f {} {} {} {} {}
+make -j{} -C . -f {} {}
 mkdir -p modules && cp obj_dir/*.so modules
-""".format(makefile,
+""".format(jobs, makefile,
     "CC_SRCS=\"{}\"".format("".join(cc_srcs)),
-    "THREADS={}".format(threads) if int(threads) > 1 else "",
-    "COVERAGE=1" if coverage else "",
-    "OPT_LEVEL={}".format(opt_level),
     )
     build_script_file = "build_" + build_name + ".sh"
     tools.write_to_file(build_script_file, build_script_contents, force_unix=True)
 
+
+@contextlib.contextmanager
+def _keep_mtime_if_unchanged(filename):
+    # regenerating an identical file must not make verilator and make rebuild
+    try:
+        with open(filename, "rb") as f:
+            old = hashlib.sha256(f.read()).digest()
+        st = os.stat(filename)
+    except OSError:
+        old = None
+    yield
+    if old is not None:
+        with open(filename, "rb") as f:
+            new = hashlib.sha256(f.read()).digest()
+        if new == old:
+            os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
 def _compile_sim(build_name, verbose):
     build_script_file = "build_" + build_name + ".sh"
     p = subprocess.Popen(["bash", build_script_file], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
@@ -149,9 +179,9 @@ def _compile_sim(build_name, verbose):
     if verbose:
         print(output)
 
-def _run_sim(build_name, as_root=False):
+def _run_sim(build_name, as_root=False, args=[]):
     run_script_contents = "sudo " if as_root else ""
-    run_script_contents += "obj_dir/Vdut"
+    run_script_contents += " ".join(["obj_dir/Vdut"] + args)
     run_script_file = "run_" + build_name + ".sh"
     tools.write_to_file(run_script_file, run_script_contents, force_unix=True)
     if sys.platform != "win32":
@@ -171,7 +201,29 @@ class SimVerilatorToolchain:
     def build(self, platform, fragment, build_dir="build", build_name="dut",
             toolchain_path=None, serial="console", build=True, run=True, threads=1,
             verbose=True, sim_config=None, coverage=False, opt_level="O0",
-            trace=False, trace_start=0, trace_end=-1):
+            trace=False, trace_start=0, trace_end=-1, jobs=None, output_split=20000,
+            savable=False, save_at=None, save_file=None, restore=None, build_cache=None):
+        # threads: number of threads of the Verilated model
+        # jobs: number of parallel C++ compile jobs (default: number of CPUs)
+        # output_split: split the Verilated C++ files into chunks of about
+        #               this many statements, 0 to disable
+        # savable: build a model that can be checkpointed (verilator --savable)
+        # save_at: save a checkpoint to save_file (default: dut.ckpt) at this
+        #          sys_clk cycle, sim modules can also request checkpoints
+        # restore: start the simulation from this checkpoint
+        # a checkpoint holds the model, the simulated time and the state of the
+        # sim modules implementing save/restore, the others (ethernet,
+        # serial2tcp...) restart fresh and are listed in a warning
+        # build_cache: ignored, verilator builds are incremental (obj_dir is reused)
+
+        # checkpoint paths are relative to the calling directory
+        run_args = []
+        if save_at is not None:
+            run_args.append("--save-at={}".format(save_at))
+        if save_file is not None:
+            run_args.append("--save={}".format(os.path.abspath(save_file)))
+        if restore is not None:
+            run_args.append("--restore={}".format(os.path.abspath(restore)))
 
         # create build directory
         os.makedirs(build_dir, exist_ok=True)
@@ -184,29 +236,32 @@ class SimVerilatorToolchain:
             platform.finalize(fragment)
 
             # generate top module
-            top_output = platform.get_verilog(fragment,
-                name=build_name, dummy_signal=False, regular_comb=False, blocking_assign=True)
-            named_sc, named_pc = platform.resolve_signals(top_output.ns)
             top_file = build_name + ".v"
+            with _keep_mtime_if_unchanged(top_file):
+                top_output = platform.get_verilog(fragment,
+                    name=build_name, dummy_signal=False, regular_comb=False, blocking_assign=True,
+                    filename=top_file)
+            named_sc, named_pc = platform.resolve_signals(top_output.ns)
             top_output.write(top_file)
             platform.add_source(top_file)
 
             # generate cpp header/main/variables
             _generate_sim_h(platform)
             _generate_sim_cpp(platform, trace, trace_start, trace_end)
-            _generate_sim_variables(platform.verilog_include_paths)
+            _generate_sim_variables(platform.verilog_include_paths,
+                threads, coverage, opt_level, output_split, savable)
 
             # generate sim config
             if sim_config:
                 _generate_sim_config(sim_config)
 
             # build
-            _build_sim(build_name, platform.sources, threads, coverage, opt_level)
+            _build_sim(build_name, platform.sources, jobs)
 
         # run
         if run:
             _compile_sim(build_name, verbose)
-            _run_sim(build_name, as_root=sim_config.has_module("ethernet"))
+            _run_sim(build_name, as_root=sim_config.has_module("ethernet"), args=run_args)
 
         os.chdir("../../")
 
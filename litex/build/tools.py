@@ -12,7 +12,6 @@ import subprocess
 import sys
 import ctypes
 import time
-import datetime
 
 
 def language_by_filename(name):
@@ -126,10 +125,10 @@ def get_litex_git_revision():
 
 def generated_banner(line_comment="//"):
     r = line_comment + "-"*80 + "\n"
-    r += line_comment + " Auto-generated by Migen ({}) & LiteX ({}) on ".format(
+    # no timestamp: identical designs must give identical files (see litex.build.cache)
+    r += line_comment + " Auto-generated by Migen ({}) & LiteX ({})\n".format(
         get_migen_git_revision(),
         get_litex_git_revision())
-    r += "{}\n".format(datetime.datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S"))
     r += line_comment + "-"*80 + "\n"
     return r
 
@@ -177,7 +177,9 @@ class XilinxISEToolchain:
         self.ise_commands = ""
 
     def build(self, platform, fragment, build_dir="build", build_name="top",
-            toolchain_path=None, source=True, run=True, mode="xst", **kwargs):
+            toolchain_path=None, source=True, run=True, mode="xst", build_cache=None, **kwargs):
+        if build_cache is not None:
+            print("[WARNING] Build cache not supported by this toolchain, ignored")
         if not isinstance(fragment, _Fragment):
             fragment = fragment.get_fragment()
         if toolchain_path is None:
@@ -197,10 +199,10 @@ class XilinxISEToolchain:
         os.chdir(build_dir)
         try:
             if mode in ("xst", "yosys", "cpld"):
-                v_output = platform.get_verilog(fragment, name=build_name, **kwargs)
+                v_file = build_name + ".v"
+                v_output = platform.get_verilog(fragment, name=build_name, filename=v_file, **kwargs)
                 vns = v_output.ns
                 named_sc, named_pc = platform.resolve_signals(vns)
-                v_file = build_name + ".v"
                 v_output.write(v_file)
                 sources = platform.sources | {(v_file, "verilog", "work")}
                 if mode in ("xst", "cpld"):
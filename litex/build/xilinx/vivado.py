@@ -11,6 +11,7 @@ from migen.fhdl.structure import _Fragment
 
 from litex.build.generic_platform import *
 from litex.build import tools
+from litex.build import cache
 from litex.build.xilinx import common
 
 
@@ -56,6 +57,22 @@ def _build_xdc(named_sc, named_pc):
     return r
 
 
+def _vivado_settings(vivado_path, ver=None):
+    # settings script sourced to run Vivado, None when it is in our $PATH
+    if sys.platform == "win32" or sys.platform == "cygwin" or find_executable("vivado"):
+        return None
+    # For backwards compatibility with ISE paths, also
+    # look for a version in a subdirectory named "Vivado"
+    # under the current directory.
+    paths_to_try = [vivado_path, os.path.join(vivado_path, "Vivado")]
+    for p in paths_to_try:
+        try:
+            return common.settings(p, ver)
+        except OSError:
+            continue
+    raise OSError("Unable to locate Vivado directory or settings.")
+
+
 def _run_vivado(build_name, vivado_path, source, ver=None):
     if sys.platform == "win32" or sys.platform == "cygwin":
         build_script_contents = "REM Autogenerated by LiteX / git: " + tools.get_litex_git_revision() + "\n"
@@ -66,19 +83,8 @@ def _run_vivado(build_name, vivado_path, source, ver=None):
     else:
         build_script_contents = "# Autogenerated by LiteX / git: " + tools.get_litex_git_revision() + "\nset -e\n"
         # Only source Vivado settings if not already in our $PATH
-        if not find_executable("vivado"):
-            # For backwards compatibility with ISE paths, also
-            # look for a version in a subdirectory named "Vivado"
-            # under the current directory.
-            paths_to_try = [vivado_path, os.path.join(vivado_path, "Vivado")]
-            for p in paths_to_try:
-                try:
-                    settings = common.settings(p, ver)
-                except OSError:
-                    continue
-                break
-            else:
-                raise OSError("Unable to locate Vivado directory or settings.")
+        settings = _vivado_settings(vivado_path, ver)
+        if settings is not None:
             build_script_contents += "source " + settings + "\n"
 
         build_script_contents += "vivado -mode batch -source " + build_name + ".tcl\n"
@@ -231,7 +237,7 @@ class XilinxVivadoToolchain:
 
     def build(self, platform, fragment, build_dir="build", build_name="top",
             toolchain_path="/opt/Xilinx/Vivado", source=True, run=True,
-            synth_mode="vivado", enable_xpm=False, **kwargs):
+            synth_mode="vivado", enable_xpm=False, build_cache=None, **kwargs):
         if toolchain_path is None:
             toolchain_path = "/opt/Xilinx/Vivado"
         os.makedirs(build_dir, exist_ok=True)
@@ -243,9 +249,9 @@ class XilinxVivadoToolchain:
         platform.finalize(fragment)
         self._convert_clocks(platform)
         self._constrain(platform)
-        v_output = platform.get_verilog(fragment, name=build_name, **kwargs)
-        named_sc, named_pc = platform.resolve_signals(v_output.ns)
         v_file = build_name + ".v"
+        v_output = platform.get_verilog(fragment, name=build_name, filename=v_file, **kwargs)
+        named_sc, named_pc = platform.resolve_signals(v_output.ns)
         v_output.write(v_file)
         sources = platform.sources | {(v_file, "verilog", "work")}
         edifs = platform.edifs
@@ -253,9 +259,17 @@ class XilinxVivadoToolchain:
         self._build_batch(platform, sources, edifs, ips, build_name, synth_mode, enable_xpm)
         tools.write_to_file(build_name + ".xdc", _build_xdc(named_sc, named_pc))
         if run:
-            if synth_mode == "yosys":
-                common._run_yosys(platform.device, sources, platform.verilog_include_paths, build_name)
-            _run_vivado(build_name, toolchain_path, source)
+            def run_toolchain():
+                if synth_mode == "yosys":
+                    common._run_yosys(platform.device, sources, platform.verilog_include_paths, build_name)
+                _run_vivado(build_name, toolchain_path, source)
+            cache.run_cached(build_cache, run_toolchain,
+                inputs=cache.build_inputs(platform, v_output,
+                    v_file, build_name + ".tcl", build_name + ".xdc", *edifs, *ips),
+                outputs=[build_name + ".bit", build_name + ".bin", "*.rpt"],
+                options={"toolchain_path": toolchain_path, "synth_mode": synth_mode},
+                toolchain=(["vivado", "-version"], ["yosys", "-V"]),
+                settings=_vivado_settings(toolchain_path))
 
         os.chdir(cwd)
 
@@ -0,0 +1,157 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import sys
+import json
+import collections
+import contextlib
+from time import perf_counter
+
+from migen.fhdl.structure import _Fragment
+from migen.fhdl.visit import NodeVisitor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def dump_report(data, report, filename=None):
+    """Prints the text ``report``, or writes it to ``filename``
+
+    ``data`` is written instead, as JSON, when ``filename`` ends with ``.json``.
+    """
+    if filename is None:
+        sys.stdout.write(report)
+    elif filename.endswith(".json"):
+        with open(filename, "w") as f:
+            json.dump(data, f, indent=4)
+    else:
+        with open(filename, "w") as f:
+            f.write(report)
+
+
+def _peak_memory():
+    # peak resident set size of the process, in bytes
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else 1024*rss
+
+
+class _NodeCounter(NodeVisitor):
+    def __init__(self):
+        self.nodes = 0
+        self.signals = set()
+
+    def visit(self, node):
+        self.nodes += 1
+        NodeVisitor.visit(self, node)
+
+    def visit_Signal(self, node):
+        self.signals.add(node)
+
+
+class _PassEntry:
+    __slots__ = ("name", "calls", "time", "peak_memory", "nodes", "signals")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.time = 0.0
+        self.peak_memory = None
+        self.nodes = None
+        self.signals = None
+
+    def as_dict(self):
+        return {
+            "name":        self.name,
+            "calls":       self.calls,
+            "time":        self.time,
+            "peak_memory": self.peak_memory,
+            "nodes":       self.nodes,
+            "signals":     self.signals,
+        }
+
+
+class ConversionProfiler:
+    """Collects the execution time of the passes of a Verilog conversion
+
+    Each pass records its wall time and the peak memory of the process at
+    its end. With ``counts``, the number of nodes and signals of the
+    fragment produced by each pass are also recorded, at the cost of a
+    traversal of the design after each pass. Passes run several times (for
+    each module of a hierarchical conversion) are accumulated.
+    """
+    def __init__(self, counts=False):
+        self.counts = counts
+        self.entries = collections.OrderedDict()
+        self.last = None
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        try:
+            entry = self.entries[name]
+        except KeyError:
+            entry = self.entries[name] = _PassEntry(name)
+        start = perf_counter()
+        try:
+            yield entry
+        finally:
+            entry.time += perf_counter() - start
+            entry.calls += 1
+            entry.peak_memory = _peak_memory()
+            self.last = entry
+
+    def count(self, fragment):
+        """Records the node and signal counts of ``fragment`` in the last pass"""
+        if not self.counts or self.last is None:
+            return
+        counter = _NodeCounter()
+        counter.visit(fragment)
+        if isinstance(fragment, _Fragment):
+            for special in fragment.specials:
+                for obj, attr, direction in special.iter_expressions():
+                    counter.visit(getattr(obj, attr))
+        entry = self.last
+        entry.nodes = (entry.nodes or 0) + counter.nodes
+        entry.signals = (entry.signals or 0) + len(counter.signals)
+
+    # reports
+
+    @property
+    def time(self):
+        return sum(entry.time for entry in self.entries.values())
+
+    @property
+    def peak_memory(self):
+        memories = [e.peak_memory for e in self.entries.values() if e.peak_memory is not None]
+        return max(memories) if memories else None
+
+    def as_dict(self):
+        return {
+            "time":        self.time,
+            "peak_memory": self.peak_memory,
+            "passes":      [entry.as_dict() for entry in self.entries.values()],
+        }
+
+    def report(self):
+        total = self.time or 1.0
+        r = "Verilog conversion profile\n"
+        r += "==========================\n\n"
+        r += "{:>10} {:>6} {:>6} {:>10} {:>10} {:>10}  {}\n".format(
+            "time (s)", "%", "calls", "peak (MB)", "nodes", "signals", "pass")
+        for entry in self.entries.values():
+            r += "{:10.3f} {:6.1f} {:6d} {:>10} {:>10} {:>10}  {}\n".format(
+                entry.time, 100*entry.time/total, entry.calls,
+                "-" if entry.peak_memory is None else "{:.1f}".format(entry.peak_memory/2**20),
+                "-" if entry.nodes is None else entry.nodes,
+                "-" if entry.signals is None else entry.signals,
+                entry.name)
+        r += "{:10.3f} {:6.1f} {:6} {:>10} {:>10} {:>10}  total\n".format(
+            self.time, 100.0, "", "", "", "")
+        return r
+
+    def dump(self, filename=None):
+        """Writes the report to ``filename`` (JSON if it ends with ``.json``)"""
+        dump_report(self.as_dict(), self.report(), filename)
@@ -11,17 +11,23 @@
 
 # License: BSD
 
+import os
+import shutil
+import contextlib
 from functools import partial
 from operator import itemgetter
 import collections
+import collections.abc
 
 from migen.fhdl.structure import *
-from migen.fhdl.structure import _Operator, _Slice, _Assign, _Fragment
+from migen.fhdl.structure import _Operator, _Slice, _Assign, _Fragment, _ClockDomainList
+from migen.fhdl.module import Module
 from migen.fhdl.tools import *
 from migen.fhdl.namer import build_namespace
 from migen.fhdl.conv_output import ConvOutput
 
 from litex.build.tools import generated_banner
+from litex.gen.fhdl.profiler import ConversionProfiler
 
 
 _reserved_keywords = {
@@ -130,9 +136,9 @@ def _printexpr(ns, node):
 (_AT_BLOCKING, _AT_NONBLOCKING, _AT_SIGNAL) = range(3)
 
 
-def _printnode(ns, at, level, node, target_filter=None):
+def _printnode(w, ns, at, level, node, target_filter=None):
     if target_filter is not None and target_filter not in list_targets(node):
-        return ""
+        return
     elif isinstance(node, _Assign):
         if at == _AT_BLOCKING:
             assignment = " = "
@@ -142,34 +148,31 @@ def _printnode(ns, at, level, node, target_filter=None):
             assignment = " = "
         else:
             assignment = " <= "
-        return "\t"*level + _printexpr(ns, node.l)[0] + assignment + _printexpr(ns, node.r)[0] + ";\n"
-    elif isinstance(node, collections.Iterable):
-        return "".join(_printnode(ns, at, level, n, target_filter) for n in node)
+        w("\t"*level + _printexpr(ns, node.l)[0] + assignment + _printexpr(ns, node.r)[0] + ";\n")
+    elif isinstance(node, collections.abc.Iterable):
+        for n in node:
+            _printnode(w, ns, at, level, n, target_filter)
     elif isinstance(node, If):
-        r = "\t"*level + "if (" + _printexpr(ns, node.cond)[0] + ") begin\n"
-        r += _printnode(ns, at, level + 1, node.t, target_filter)
+        w("\t"*level + "if (" + _printexpr(ns, node.cond)[0] + ") begin\n")
+        _printnode(w, ns, at, level + 1, node.t, target_filter)
         if node.f:
-            r += "\t"*level + "end else begin\n"
-            r += _printnode(ns, at, level + 1, node.f, target_filter)
-        r += "\t"*level + "end\n"
-        return r
+            w("\t"*level + "end else begin\n")
+            _printnode(w, ns, at, level + 1, node.f, target_filter)
+        w("\t"*level + "end\n")
     elif isinstance(node, Case):
         if node.cases:
-            r = "\t"*level + "case (" + _printexpr(ns, node.test)[0] + ")\n"
+            w("\t"*level + "case (" + _printexpr(ns, node.test)[0] + ")\n")
             css = [(k, v) for k, v in node.cases.items() if isinstance(k, Constant)]
             css = sorted(css, key=lambda x: x[0].value)
             for choice, statements in css:
-                r += "\t"*(level + 1) + _printexpr(ns, choice)[0] + ": begin\n"
-                r += _printnode(ns, at, level + 2, statements, target_filter)
-                r += "\t"*(level + 1) + "end\n"
+                w("\t"*(level + 1) + _printexpr(ns, choice)[0] + ": begin\n")
+                _printnode(w, ns, at, level + 2, statements, target_filter)
+                w("\t"*(level + 1) + "end\n")
             if "default" in node.cases:
-                r += "\t"*(level + 1) + "default: begin\n"
-                r += _printnode(ns, at, level + 2, node.cases["default"], target_filter)
-                r += "\t"*(level + 1) + "end\n"
-            r += "\t"*level + "endcase\n"
-            return r
-        else:
-            return ""
+                w("\t"*(level + 1) + "default: begin\n")
+                _printnode(w, ns, at, level + 2, node.cases["default"], target_filter)
+                w("\t"*(level + 1) + "end\n")
+            w("\t"*level + "endcase\n")
     elif isinstance(node, Display):
         s = "\"" + node.s + "\""
         for arg in node.args:
@@ -178,9 +181,9 @@ def _printnode(ns, at, level, node, target_filter=None):
                 s += ns.get_name(arg)
             else:
                 s += str(arg)
-        return "\t"*level + "$display(" + s + ");\n"
+        w("\t"*level + "$display(" + s + ");\n")
     elif isinstance(node, Finish):
-        return "\t"*level + "$finish;\n"
+        w("\t"*level + "$finish;\n")
     else:
         raise TypeError("Node of unrecognized type: "+str(type(node)))
 
@@ -220,57 +223,55 @@ def _printattr(attr, attr_translate):
     return r
 
 
-def _printheader(f, ios, name, ns, attr_translate,
+def _printheader(w, f, ios, name, ns, attr_translate,
                  reg_initialization):
     sigs = list_signals(f) | list_special_ios(f, True, True, True)
     special_outs = list_special_ios(f, False, True, True)
     inouts = list_special_ios(f, False, False, True)
     targets = list_targets(f) | special_outs
     wires = _list_comb_wires(f) | special_outs
-    r = "module " + name + "(\n"
+    w("module " + name + "(\n")
     firstp = True
     for sig in sorted(ios, key=lambda x: x.duid):
         if not firstp:
-            r += ",\n"
+            w(",\n")
         firstp = False
         attr = _printattr(sig.attr, attr_translate)
         if attr:
-            r += "\t" + attr
+            w("\t" + attr)
         sig.type = "wire"
         if sig in inouts:
             sig.direction = "inout"
-            r += "\tinout " + _printsig(ns, sig)
+            w("\tinout " + _printsig(ns, sig))
         elif sig in targets:
             sig.direction = "output"
             if sig in wires:
-                r += "\toutput " + _printsig(ns, sig)
+                w("\toutput " + _printsig(ns, sig))
             else:
                 sig.type = "reg"
-                r += "\toutput reg " + _printsig(ns, sig)
+                w("\toutput reg " + _printsig(ns, sig))
         else:
             sig.direction = "input"
-            r += "\tinput " + _printsig(ns, sig)
-    r += "\n);\n\n"
+            w("\tinput " + _printsig(ns, sig))
+    w("\n);\n\n")
     for sig in sorted(sigs - ios, key=lambda x: x.duid):
         attr = _printattr(sig.attr, attr_translate)
         if attr:
-            r += attr + " "
+            w(attr + " ")
         if sig in wires:
-            r += "wire " + _printsig(ns, sig) + ";\n"
+            w("wire " + _printsig(ns, sig) + ";\n")
         else:
             if reg_initialization:
-                r += "reg " + _printsig(ns, sig) + " = " + _printexpr(ns, sig.reset)[0] + ";\n"
+                w("reg " + _printsig(ns, sig) + " = " + _printexpr(ns, sig.reset)[0] + ";\n")
             else:
-                r += "reg " + _printsig(ns, sig) + ";\n"
-    r += "\n"
-    return r
+                w("reg " + _printsig(ns, sig) + ";\n")
+    w("\n")
 
 
-def _printcomb_simulation(f, ns,
+def _printcomb_simulation(w, f, ns,
             display_run,
             dummy_signal,
             blocking_assign):
-    r = ""
     if f.comb:
         if dummy_signal:
             # Generate a dummy event to get the simulator
@@ -278,10 +279,10 @@ def _printcomb_simulation(f, ns,
             syn_off = "// synthesis translate_off\n"
             syn_on = "// synthesis translate_on\n"
             dummy_s = Signal(name_override="dummy_s")
-            r += syn_off
-            r += "reg " + _printsig(ns, dummy_s) + ";\n"
-            r += "initial " + ns.get_name(dummy_s) + " <= 1'd0;\n"
-            r += syn_on
+            w(syn_off)
+            w("reg " + _printsig(ns, dummy_s) + ";\n")
+            w("initial " + ns.get_name(dummy_s) + " <= 1'd0;\n")
+            w(syn_on)
 
 
         from collections import defaultdict
@@ -293,83 +294,514 @@ def _printcomb_simulation(f, ns,
             for t in targets:
                 target_stmt_map[t].append(statement)
 
-        groups = group_by_targets(f.comb)
-
         for n, (t, stmts) in enumerate(target_stmt_map.items()):
             assert isinstance(t, Signal)
             if len(stmts) == 1 and isinstance(stmts[0], _Assign):
-                r += "assign " + _printnode(ns, _AT_BLOCKING, 0, stmts[0])
+                w("assign ")
+                _printnode(w, ns, _AT_BLOCKING, 0, stmts[0])
             else:
                 if dummy_signal:
                     dummy_d = Signal(name_override="dummy_d")
-                    r += "\n" + syn_off
-                    r += "reg " + _printsig(ns, dummy_d) + ";\n"
-                    r += syn_on
+                    w("\n" + syn_off)
+                    w("reg " + _printsig(ns, dummy_d) + ";\n")
+                    w(syn_on)
 
-                r += "always @(*) begin\n"
+                w("always @(*) begin\n")
                 if display_run:
-                    r += "\t$display(\"Running comb block #" + str(n) + "\");\n"
+                    w("\t$display(\"Running comb block #" + str(n) + "\");\n")
                 if blocking_assign:
-                    r += "\t" + ns.get_name(t) + " = " + _printexpr(ns, t.reset)[0] + ";\n"
-                    r += _printnode(ns, _AT_BLOCKING, 1, stmts, t)
+                    w("\t" + ns.get_name(t) + " = " + _printexpr(ns, t.reset)[0] + ";\n")
+                    _printnode(w, ns, _AT_BLOCKING, 1, stmts, t)
                 else:
-                    r += "\t" + ns.get_name(t) + " <= " + _printexpr(ns, t.reset)[0] + ";\n"
-                    r += _printnode(ns, _AT_NONBLOCKING, 1, stmts, t)
+                    w("\t" + ns.get_name(t) + " <= " + _printexpr(ns, t.reset)[0] + ";\n")
+                    _printnode(w, ns, _AT_NONBLOCKING, 1, stmts, t)
                 if dummy_signal:
-                    r += syn_off
-                    r += "\t" + ns.get_name(dummy_d) + " = " + ns.get_name(dummy_s) + ";\n"
-                    r += syn_on
-                r += "end\n"
-    r += "\n"
-    return r
+                    w(syn_off)
+                    w("\t" + ns.get_name(dummy_d) + " = " + ns.get_name(dummy_s) + ";\n")
+                    w(syn_on)
+                w("end\n")
+    w("\n")
 
 
-def _printcomb_regular(f, ns, blocking_assign):
-    r = ""
+def _printcomb_regular(w, f, ns, blocking_assign):
     if f.comb:
         groups = group_by_targets(f.comb)
 
         for n, g in enumerate(groups):
             if len(g[1]) == 1 and isinstance(g[1][0], _Assign):
-                r += "assign " + _printnode(ns, _AT_BLOCKING, 0, g[1][0])
+                w("assign ")
+                _printnode(w, ns, _AT_BLOCKING, 0, g[1][0])
             else:
-                r += "always @(*) begin\n"
+                w("always @(*) begin\n")
                 if blocking_assign:
-                    for t in g[0]:
-                        r += "\t" + ns.get_name(t) + " = " + _printexpr(ns, t.reset)[0] + ";\n"
-                    r += _printnode(ns, _AT_BLOCKING, 1, g[1])
+                    for t in sorted(g[0], key=lambda x: x.duid):
+                        w("\t" + ns.get_name(t) + " = " + _printexpr(ns, t.reset)[0] + ";\n")
+                    _printnode(w, ns, _AT_BLOCKING, 1, g[1])
                 else:
-                    for t in g[0]:
-                        r += "\t" + ns.get_name(t) + " <= " + _printexpr(ns, t.reset)[0] + ";\n"
-                    r += _printnode(ns, _AT_NONBLOCKING, 1, g[1])
-                r += "end\n"
-    r += "\n"
-    return r
+                    for t in sorted(g[0], key=lambda x: x.duid):
+                        w("\t" + ns.get_name(t) + " <= " + _printexpr(ns, t.reset)[0] + ";\n")
+                    _printnode(w, ns, _AT_NONBLOCKING, 1, g[1])
+                w("end\n")
+    w("\n")
 
 
-def _printsync(f, ns):
-    r = ""
+def _printsync(w, f, ns):
     for k, v in sorted(f.sync.items(), key=itemgetter(0)):
-        r += "always @(posedge " + ns.get_name(f.clock_domains[k].clk) + ") begin\n"
-        r += _printnode(ns, _AT_SIGNAL, 1, v)
-        r += "end\n\n"
-    return r
+        w("always @(posedge " + ns.get_name(f.clock_domains[k].clk) + ") begin\n")
+        _printnode(w, ns, _AT_SIGNAL, 1, v)
+        w("end\n\n")
 
 
-def _printspecials(overrides, specials, ns, add_data_file, attr_translate):
-    r = ""
+def _printspecials(w, overrides, specials, ns, add_data_file, attr_translate):
     for special in sorted(specials, key=lambda x: x.duid):
         if hasattr(special, "attr"):
             attr = _printattr(special.attr, attr_translate)
             if attr:
-                r += attr + " "
+                w(attr + " ")
         pr = call_special_classmethod(overrides, special, "emit_verilog", ns, add_data_file)
         if pr is None:
             raise NotImplementedError("Special " + str(special) + " failed to implement emit_verilog")
-        r += pr
+        w(pr)
+
+
+class _SourceWriter:
+    """Collects the generated source as a list of chunks
+
+    When ``f`` is given, the chunks are written to it every ``max_chunks``
+    chunks instead of being kept in memory.
+    """
+    def __init__(self, f=None, max_chunks=4096):
+        self.f = f
+        self.max_chunks = max_chunks
+        self.chunks = []
+
+    def write(self, s):
+        self.chunks.append(s)
+        if self.f is not None and len(self.chunks) >= self.max_chunks:
+            self.flush()
+
+    def flush(self):
+        if self.f is not None:
+            self.f.write("".join(self.chunks))
+            self.chunks.clear()
+
+    def getvalue(self):
+        return "".join(self.chunks)
+
+
+class _StreamedConvOutput(ConvOutput):
+    """``ConvOutput`` whose main source has been written to ``filename``"""
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+        self.data_files = dict()
+
+    @property
+    def main_source(self):
+        with open(self.filename, "r") as f:
+            return f.read()
+
+    def write(self, main_filename):
+        if os.path.abspath(main_filename) != self.filename:
+            shutil.copyfile(self.filename, main_filename)
+        for filename, content in self.data_files.items():
+            with open(filename, "w") as f:
+                f.write(content)
+
+
+# Hierarchical conversion
+
+class _HierarchyNode:
+    def __init__(self, module, name, fragment):
+        self.module = module
+        self.name = name
+        self.fragment = fragment
+        self.children = []
+        self.parent = None
+        self.instance_name = None
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def walk_bottom_up(self):
+        for child in self.children:
+            yield from child.walk_bottom_up()
+        yield self
+
+    def path(self):
+        r = []
+        node = self
+        while node is not None:
+            r.append(node)
+            node = node.parent
+        return r[::-1]
+
+    def add_children(self, children):
+        for child in children:
+            child.parent = self
+            self.children.append(child)
+
+
+def _split_module(module, name=None, seen=None):
+    # the fragment of a finalized module also holds the statements of its
+    # submodules: keep its own ones only, and split the submodules
+    if seen is None:
+        seen = set()
+    seen.add(module)
+    f = module._fragment
+    node = _HierarchyNode(module, name, None)
+    submodule_ids = set()
+    for submodule_name, submodule in module._submodules:
+        if not submodule.get_fragment_called:
+            # added after finalization, not part of the design
+            continue
+        sf = submodule._fragment
+        submodule_ids |= {id(x) for x in sf.comb}
+        for statements in sf.sync.values():
+            submodule_ids |= {id(x) for x in statements}
+        submodule_ids |= {id(x) for x in sf.specials}
+        submodule_ids |= {id(x) for x in sf.clock_domains}
+        if submodule not in seen:
+            node.add_children([_split_module(submodule, submodule_name, seen)])
+    sync = dict()
+    for cd, statements in f.sync.items():
+        statements = [s for s in statements if id(s) not in submodule_ids]
+        if statements:
+            sync[cd] = statements
+    node.fragment = _Fragment(
+        [s for s in f.comb if id(s) not in submodule_ids],
+        sync,
+        {s for s in f.specials if id(s) not in submodule_ids},
+        [cd for cd in f.clock_domains if id(cd) not in submodule_ids])
+    return node
+
+
+def _common_ancestor(nodes):
+    nodes = iter(nodes)
+    path = next(nodes).path()
+    for node in nodes:
+        other = node.path()
+        i = 0
+        while i < min(len(path), len(other)) and path[i] is other[i]:
+            i += 1
+        path = path[:i]
+    return path[-1]
+
+
+def _lower_node(node, clock_domains, special_overrides):
+    f = node.fragment
+    f.clock_domains = _ClockDomainList(clock_domains)
+    f = lower_complex_slices(f)
+    insert_resets(f)
+    f = lower_basics(f)
+    f, lowered_specials = lower_specials(special_overrides, f)
+    f = lower_basics(f)
+    node.fragment = f
+    node.targets = list_targets(f) | list_special_ios(f, False, True, True)
+    node.inouts = list_special_ios(f, False, False, True)
+    node.refs = (list_signals(f) | list_special_ios(f, True, True, True)
+                 | {f.clock_domains[cd].clk for cd in f.sync})
+
+
+def _inline_node(node):
+    parent = node.parent
+    parent.fragment += node.fragment
+    parent.fragment.clock_domains = _ClockDomainList(
+        cd for i, cd in enumerate(parent.fragment.clock_domains)
+        if cd not in parent.fragment.clock_domains[:i])
+    parent.targets |= node.targets
+    parent.inouts |= node.inouts
+    parent.refs |= node.refs
+    i = parent.children.index(node)
+    parent.children[i:i+1] = node.children
+    for child in node.children:
+        child.parent = parent
+    node.inlined = parent
+
+
+def _inline_multiple_drivers(top):
+    # a signal can only be driven from one module: inline the modules
+    # driving a same signal into their common ancestor
+    drivers = collections.defaultdict(list)
+    for node in top.walk():
+        node.inlined = None
+        for signal in node.targets:
+            drivers[signal].append(node)
+    r = dict()
+    for signal, nodes in sorted(drivers.items(), key=lambda x: x[0].duid):
+        resolved = []
+        for node in nodes:
+            while node.inlined is not None:
+                node = node.inlined
+            if node not in resolved:
+                resolved.append(node)
+        ancestor = _common_ancestor(resolved)
+        for node in resolved:
+            while node is not ancestor:
+                parent = node.parent
+                _inline_node(node)
+                node = parent
+        r[signal] = ancestor
+    # the modules of the signals processed earlier may have been inlined since
+    for signal, node in r.items():
+        while node.inlined is not None:
+            node = node.inlined
+        r[signal] = node
     return r
 
 
+def _list_ports(top, ios):
+    # a signal is declared in the common ancestor of the modules using it,
+    # and is a port of the modules between them
+    users = collections.defaultdict(set)
+    for node in top.walk():
+        for signal in node.refs:
+            users[signal].add(node)
+    for signal in ios:
+        users[signal].add(top)
+    declared = collections.defaultdict(set)
+    ports = collections.defaultdict(set)
+    for signal, nodes in users.items():
+        home = _common_ancestor(nodes)
+        declared[home].add(signal)
+        for node in nodes:
+            while node is not home and signal not in ports[node]:
+                ports[node].add(signal)
+                node = node.parent
+    declared[top] -= ios
+    ports[top] = set(ios)
+    return declared, ports
+
+
+def _printmoduleheader(w, node, ports, declared, drivers, ns, attr_translate,
+                       reg_initialization, top):
+    f = node.fragment
+    wires = _list_comb_wires(f) | list_special_ios(f, False, True, True)
+
+    def is_reg(sig):
+        return sig in node.targets and sig not in wires or sig not in drivers
+
+    inouts = {sig for n in node.walk() for sig in n.inouts}
+    firstp = True
+    for sig in sorted(ports, key=lambda x: x.duid):
+        if not firstp:
+            w(",\n")
+        firstp = False
+        attr = _printattr(sig.attr, attr_translate)
+        if attr:
+            w("\t" + attr)
+        if top:
+            sig.type = "wire"
+        if sig in inouts:
+            direction = "inout"
+            w("\tinout " + _printsig(ns, sig))
+        elif sig in drivers and node in drivers[sig].path():
+            direction = "output"
+            if is_reg(sig):
+                if top:
+                    sig.type = "reg"
+                w("\toutput reg " + _printsig(ns, sig))
+                if reg_initialization and not top:
+                    w(" = " + _printexpr(ns, sig.reset)[0])
+            else:
+                w("\toutput " + _printsig(ns, sig))
+        else:
+            direction = "input"
+            w("\tinput " + _printsig(ns, sig))
+        if top:
+            sig.direction = direction
+    w("\n);\n\n")
+    for sig in sorted(declared, key=lambda x: x.duid):
+        attr = _printattr(sig.attr, attr_translate)
+        if attr:
+            w(attr + " ")
+        if not is_reg(sig):
+            w("wire " + _printsig(ns, sig) + ";\n")
+        elif reg_initialization:
+            w("reg " + _printsig(ns, sig) + " = " + _printexpr(ns, sig.reset)[0] + ";\n")
+        else:
+            w("reg " + _printsig(ns, sig) + ";\n")
+    w("\n")
+
+
+def _printinstances(w, node, ports, ns, module_names, used_names):
+    counts = collections.Counter()
+    for child in node.children:
+        base = child.name
+        if base is None:
+            base = child.module.__class__.__name__.lower()
+        instance_name = base
+        while instance_name in used_names:
+            counts[base] += 1
+            instance_name = base + "_" + str(counts[base])
+        used_names.add(instance_name)
+        child.instance_name = instance_name
+        w(module_names[child] + " " + instance_name + "(\n")
+        connections = [
+            "\t." + child.ns.get_name(sig) + "(" + ns.get_name(sig) + ")"
+            for sig in sorted(ports[child], key=lambda x: x.duid)]
+        w(",\n".join(connections))
+        w("\n);\n\n")
+
+
+def _convert_hierarchical(r, top, ios, name, filename, special_overrides, attr_translate,
+        create_clock_domains, reg_initialization, profiler, **options):
+    with profiler.measure("split"):
+        if isinstance(top, Module):
+            top.get_fragment()
+            root = _split_module(top)
+        else:
+            root = _HierarchyNode(None, None, top)
+
+    clock_domains = _ClockDomainList(cd for node in root.walk()
+                                     for cd in node.fragment.clock_domains)
+    used_domains = set()
+    for node in root.walk():
+        used_domains |= list_clock_domains(node.fragment)
+    for cd_name in sorted(used_domains):
+        if cd_name not in clock_domains:
+            if create_clock_domains:
+                cd = ClockDomain(cd_name)
+                clock_domains.append(cd)
+                ios |= {cd.clk, cd.rst}
+            else:
+                print("available clock domains:")
+                for cd in clock_domains:
+                    print(cd.name)
+                raise KeyError("Unresolved clock domain: '"+cd_name+"'")
+
+    for node in root.walk():
+        with profiler.measure("lower"):
+            _lower_node(node, clock_domains, special_overrides)
+        profiler.count(node.fragment)
+    with profiler.measure("inline"):
+        drivers = _inline_multiple_drivers(root)
+    with profiler.measure("list_ports"):
+        declared, ports = _list_ports(root, ios)
+
+    _name_ios(ios)
+    module_names = dict()
+    module_sources = dict()
+    module_counts = collections.Counter()
+    emitted = 0
+    with _source_writer(filename) as src:
+        src.write(generated_banner("//"))
+        for node in root.walk_bottom_up():
+            is_top = node is root
+            with profiler.measure("build_namespace"):
+                signals = node.refs | ports[node] | declared[node]
+                ns = build_namespace(signals, _reserved_keywords)
+                ns.clock_domains = node.fragment.clock_domains
+                used_names = {ns.get_name(sig) for sig in sorted(signals, key=lambda x: x.duid)}
+                node.ns = ns
+
+            module = _SourceWriter()
+            w = module.write
+            with profiler.measure("print_header"):
+                _printmoduleheader(w, node, ports[node], declared[node], drivers, ns,
+                    attr_translate, reg_initialization, is_top)
+            _printbody(w, node.fragment, ns,
+                special_overrides=special_overrides,
+                specials=node.fragment.specials,
+                add_data_file=r.add_data_file,
+                attr_translate=attr_translate,
+                profiler=profiler,
+                **options)
+            with profiler.measure("print_instances"):
+                _printinstances(w, node, ports, ns, module_names, used_names)
+            w("endmodule\n")
+            source = module.getvalue()
+
+            if is_top:
+                module_name = name
+            elif source in module_sources:
+                # identical to an already emitted module
+                module_names[node] = module_sources[source]
+                continue
+            else:
+                base = name + "_" + node.module.__class__.__name__.lower()
+                module_name = base
+                if module_counts[base]:
+                    module_name += "_" + str(module_counts[base])
+                module_counts[base] += 1
+                module_names[node] = module_sources[source] = module_name
+            if emitted:
+                src.write("\n")
+            emitted += 1
+            src.write("module " + module_name + "(\n")
+            src.write(source)
+    r.ns = _HierarchicalNamespace(root, declared, clock_domains)
+    if filename is None:
+        r.set_main_source(src.getvalue())
+
+    return r
+
+
+class _HierarchicalNamespace:
+    """Names the signals of a hierarchical conversion
+
+    Signals are named in the module declaring them, prefixed by the path of
+    instance names from the top module (``crg/clk``, as used by the
+    constraint files) when it is not the top module.
+    """
+    def __init__(self, root, declared, clock_domains, separator="/"):
+        self.root = root
+        self.clock_domains = clock_domains
+        self.separator = separator
+        self.homes = {signal: node for node, signals in declared.items() for signal in signals}
+
+    def get_name(self, sig):
+        if isinstance(sig, ClockSignal):
+            sig = self.clock_domains[sig.cd].clk
+        elif isinstance(sig, ResetSignal):
+            rst = self.clock_domains[sig.cd].rst
+            if rst is None:
+                raise ValueError("Attempted to obtain name of non-existent "
+                                 "reset signal of domain " + sig.cd)
+            sig = rst
+        home = self.homes.get(sig, self.root)
+        path = [node.instance_name for node in home.path()[1:]]
+        return self.separator.join(path + [home.ns.get_name(sig)])
+
+
+@contextlib.contextmanager
+def _source_writer(filename=None):
+    if filename is None:
+        yield _SourceWriter()
+    else:
+        with open(filename, "w") as f:
+            src = _SourceWriter(f)
+            yield src
+            src.flush()
+
+
+def _name_ios(ios):
+    for io in sorted(ios, key=lambda x: x.duid):
+        if io.name_override is None:
+            io_name = io.backtrace[-1][0]
+            if io_name:
+                io.name_override = io_name
+
+
+def _printbody(w, f, ns, special_overrides, specials, add_data_file, attr_translate,
+               display_run, dummy_signal, blocking_assign, regular_comb, profiler):
+    with profiler.measure("print_comb"):
+        if regular_comb:
+            _printcomb_regular(w, f, ns,
+                          blocking_assign=blocking_assign)
+        else:
+            _printcomb_simulation(w, f, ns,
+                          display_run=display_run,
+                          dummy_signal=dummy_signal,
+                          blocking_assign=blocking_assign)
+    with profiler.measure("print_sync"):
+        _printsync(w, f, ns)
+    with profiler.measure("print_specials"):
+        _printspecials(w, special_overrides, specials,
+            ns, add_data_file, attr_translate)
+
+
 def convert(f, ios=None, name="top",
   special_overrides=dict(),
   attr_translate={},
@@ -378,12 +810,53 @@ def convert(f, ios=None, name="top",
   reg_initialization=True,
   dummy_signal=True,
   blocking_assign=False,
-  regular_comb=True):
-    r = ConvOutput()
-    if not isinstance(f, _Fragment):
-        f = f.get_fragment()
+  regular_comb=True,
+  filename=None,
+  hierarchical=False,
+  profile=None):
+    # profile: a ConversionProfiler collecting the time spent in each pass
+    # (dumped by the caller), True to print the collected profile, or a file
+    # name to write it to
+    if isinstance(profile, ConversionProfiler):
+        profiler = profile
+    else:
+        profiler = ConversionProfiler(counts=bool(profile))
+    r = _convert(f, ios, name, special_overrides, attr_translate,
+        create_clock_domains, display_run, reg_initialization, dummy_signal,
+        blocking_assign, regular_comb, filename, hierarchical, profiler)
+    r.profile = profiler
+    if profile is True:
+        profiler.dump()
+    elif isinstance(profile, str):
+        profiler.dump(profile)
+    return r
+
+
+def _convert(f, ios, name, special_overrides, attr_translate, create_clock_domains,
+        display_run, reg_initialization, dummy_signal, blocking_assign, regular_comb,
+        filename, hierarchical, profiler):
+    if filename is None:
+        r = ConvOutput()
+    else:
+        # stream the main source to filename, writing the output to
+        # filename afterwards only writes the data files
+        r = _StreamedConvOutput(filename)
     if ios is None:
         ios = set()
+    if hierarchical:
+        return _convert_hierarchical(r, f, ios, name, filename,
+            special_overrides=special_overrides,
+            attr_translate=attr_translate,
+            create_clock_domains=create_clock_domains,
+            display_run=display_run,
+            reg_initialization=reg_initialization,
+            dummy_signal=dummy_signal,
+            blocking_assign=blocking_assign,
+            regular_comb=regular_comb,
+            profiler=profiler)
+    if not isinstance(f, _Fragment):
+        with profiler.measure("get_fragment"):
+            f = f.get_fragment()
 
     for cd_name in sorted(list_clock_domains(f)):
         try:
@@ -399,38 +872,49 @@ def convert(f, ios=None, name="top",
                     print(f.name)
                 raise KeyError("Unresolved clock domain: '"+cd_name+"'")
 
-    f = lower_complex_slices(f)
-    insert_resets(f)
-    f = lower_basics(f)
-    f, lowered_specials = lower_specials(special_overrides, f)
-    f = lower_basics(f)
-
-    for io in sorted(ios, key=lambda x: x.duid):
-        if io.name_override is None:
-            io_name = io.backtrace[-1][0]
-            if io_name:
-                io.name_override = io_name
-    ns = build_namespace(list_signals(f) \
-        | list_special_ios(f, True, True, True) \
-        | ios, _reserved_keywords)
-    ns.clock_domains = f.clock_domains
+    profiler.count(f)
+    with profiler.measure("lower_complex_slices"):
+        f = lower_complex_slices(f)
+    profiler.count(f)
+    with profiler.measure("insert_resets"):
+        insert_resets(f)
+    profiler.count(f)
+    with profiler.measure("lower_basics"):
+        f = lower_basics(f)
+    profiler.count(f)
+    with profiler.measure("lower_specials"):
+        f, lowered_specials = lower_specials(special_overrides, f)
+    profiler.count(f)
+    with profiler.measure("lower_basics_specials"):
+        f = lower_basics(f)
+    profiler.count(f)
+
+    with profiler.measure("build_namespace"):
+        _name_ios(ios)
+        ns = build_namespace(list_signals(f) \
+            | list_special_ios(f, True, True, True) \
+            | ios, _reserved_keywords)
+        ns.clock_domains = f.clock_domains
     r.ns = ns
 
-    src = generated_banner("//")
-    src += _printheader(f, ios, name, ns, attr_translate,
-                        reg_initialization=reg_initialization)
-    if regular_comb:
-        src += _printcomb_regular(f, ns,
-                      blocking_assign=blocking_assign)
-    else:
-        src += _printcomb_simulation(f, ns,
-                      display_run=display_run,
-                      dummy_signal=dummy_signal,
-                      blocking_assign=blocking_assign)
-    src += _printsync(f, ns)
-    src += _printspecials(special_overrides, f.specials - lowered_specials,
-        ns, r.add_data_file, attr_translate)
-    src += "endmodule\n"
-    r.set_main_source(src)
+    with _source_writer(filename) as src:
+        w = src.write
+        with profiler.measure("print_header"):
+            w(generated_banner("//"))
+            _printheader(w, f, ios, name, ns, attr_translate,
+                         reg_initialization=reg_initialization)
+        _printbody(w, f, ns,
+            special_overrides=special_overrides,
+            specials=f.specials - lowered_specials,
+            add_data_file=r.add_data_file,
+            attr_translate=attr_translate,
+            display_run=display_run,
+            dummy_signal=dummy_signal,
+            blocking_assign=blocking_assign,
+            regular_comb=regular_comb,
+            profiler=profiler)
+        w("endmodule\n")
+    if filename is None:
+        r.set_main_source(src.getvalue())
 
     return r
@@ -1 +1,4 @@
-from litex.gen.sim.core import Simulator, run_simulation, passive
+from litex.gen.sim.core import Simulator, run_simulation, passive, Wait, WaitUntil, WaitEdge
+from litex.gen.sim.cache import ElaborationCache
+from litex.gen.sim.parallel import SimJob, run_simulations
+from litex.gen.sim.coverage import SimCoverage, merge_coverage
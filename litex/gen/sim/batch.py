@@ -0,0 +1,570 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import collections.abc
+
+import numpy as np
+
+from migen.fhdl.structure import *
+from migen.fhdl.structure import _Operator, _Slice, _ArrayProxy, _Assign
+from migen.fhdl.bitcontainer import value_bits_sign
+from migen.fhdl.specials import WRITE_FIRST, NO_CHANGE
+
+from litex.gen.sim.core import Evaluator, Simulator, _truncate
+from litex.gen.sim.compiler import (_binary_ops, _mask, _max_expr_depth,
+                                    _max_block_depth, _CompiledFunction,
+                                    expression_width)
+from litex.gen.sim.memory import SimMemoryPort
+
+
+# Values up to this width are held in int64 arrays, wider ones in arrays of
+# Python integers. Expressions with wider intermediate results are also
+# evaluated on Python integers.
+_max_native_width = 62
+
+_comparisons = {"<", "<=", "==", "!=", ">", ">="}
+
+
+def _dtype(nbits):
+    return np.int64 if nbits <= _max_native_width else object
+
+
+class BatchCompiler:
+    """Compiles lists of statements into vectorized Python functions
+
+    The generated functions have the same arguments as the ones produced by
+    ``Compiler``, with each value being a NumPy array holding one lane per
+    simulated instance. Control flow is predicated: each statement block
+    runs with a boolean mask of the lanes taking it, and is skipped when
+    no lane does.
+    """
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.namespace = {
+            "np": np,
+            "_where": np.where,
+            "_minimum": np.minimum,
+            "_cond": evaluator.condition,
+            "_i": evaluator.native,
+            "_o": evaluator.python,
+            "_sel": evaluator.select,
+        }
+        self.names = dict()
+        self.nfunctions = 0
+        self.source = []
+
+    def _bind(self, obj, prefix):
+        try:
+            return self.names[id(obj)]
+        except KeyError:
+            name = "{}{}".format(prefix, len(self.names))
+            self.names[id(obj)] = name
+            self.namespace[name] = obj
+            return name
+
+    def _slot(self, signal):
+        return str(self.evaluator.slot(signal))
+
+    # expressions
+
+    def _spill(self, f, indent, code):
+        t = f.temp()
+        f.lines.append(indent + "{} = {}".format(t, code))
+        return t
+
+    def _expr(self, f, indent, node, postcommit=False):
+        wide = expression_width(node) > _max_native_width
+        code, depth = self._expr_depth(f, indent, node, postcommit, wide)
+        return code
+
+    def _sub(self, f, indent, node, postcommit, wide):
+        code, depth = self._expr_depth(f, indent, node, postcommit, wide)
+        if depth > _max_expr_depth:
+            return self._spill(f, indent, code), 0
+        return code, depth
+
+    def _expr_depth(self, f, indent, node, postcommit, wide):
+        if isinstance(node, Constant):
+            return repr(node.value), 0
+        elif isinstance(node, Signal):
+            code = "{}[{}]".format("n" if postcommit else "v", self._slot(node))
+            if wide and node.nbits <= _max_native_width:
+                code = "_o({})".format(code)
+            return code, 0
+        elif isinstance(node, _Operator):
+            operands = [self._sub(f, indent, o, postcommit, wide) for o in node.operands]
+            depth = max(d for c, d in operands) + 1
+            codes = [c for c, d in operands]
+            if node.op == "-" and len(codes) == 1:
+                return "(-{})".format(codes[0]), depth
+            elif node.op == "~":
+                return "(~{})".format(codes[0]), depth
+            elif node.op == "m":
+                return "_where(_cond({}), {}, {})".format(*codes), depth
+            elif node.op in _comparisons:
+                return "_i({} {} {})".format(codes[0], _binary_ops[node.op], codes[1]), depth
+            elif node.op in _binary_ops and len(codes) == 2:
+                return "({} {} {})".format(codes[0], _binary_ops[node.op], codes[1]), depth
+        elif isinstance(node, _Slice):
+            code, depth = self._sub(f, indent, node.value, postcommit, wide)
+            mask = _mask(node.stop - node.start)
+            if node.start:
+                return "(({} >> {}) & {})".format(code, node.start, mask), depth + 1
+            else:
+                return "({} & {})".format(code, mask), depth + 1
+        elif isinstance(node, Cat):
+            shift = 0
+            terms = []
+            depth = 0
+            for element in node.l:
+                nbits = len(element)
+                code, d = self._sub(f, indent, element, postcommit, wide)
+                depth = max(depth, d)
+                if shift:
+                    terms.append("(({} & {}) << {})".format(code, _mask(nbits), shift))
+                else:
+                    terms.append("({} & {})".format(code, _mask(nbits)))
+                shift += nbits
+            if not terms:
+                return "0", 0
+            return "(" + " | ".join(terms) + ")", depth + 1
+        elif isinstance(node, Replicate):
+            nbits = len(node.v)
+            code, depth = self._sub(f, indent, node.v, postcommit, wide)
+            factor = sum(1 << i*nbits for i in range(node.n))
+            return "(({} & {}) * {})".format(code, _mask(nbits), factor), depth + 1
+        elif isinstance(node, _ArrayProxy):
+            key, depth = self._sub(f, indent, node.key, postcommit, wide)
+            choices = [self._sub(f, indent, c, postcommit, wide) for c in node.choices]
+            depth = max([depth] + [d for c, d in choices])
+            return "_sel(_minimum({}, {}), ({},))".format(
+                len(node.choices) - 1, key, ", ".join(c for c, d in choices)), depth + 1
+        elif isinstance(node, ClockSignal):
+            cd = self.evaluator.clock_domains[node.cd]
+            return self._expr_depth(f, indent, cd.clk, postcommit, wide)
+        elif isinstance(node, ResetSignal):
+            rst = self.evaluator.clock_domains[node.cd].rst
+            if rst is None:
+                if node.allow_reset_less:
+                    return "0", 0
+                raise ValueError("Attempted to get reset signal of resetless"
+                                 " domain '{}'".format(node.cd))
+            return self._expr_depth(f, indent, rst, postcommit, wide)
+        raise NotImplementedError("Batch simulation does not support {}".format(node))
+
+    # statements
+
+    def _truncate(self, code, nbits, signed):
+        if signed and nbits:
+            return "((({} & {}) ^ {}) - {})".format(code, _mask(nbits),
+                                                   1 << (nbits - 1), 1 << (nbits - 1))
+        else:
+            return "({} & {})".format(code, _mask(nbits))
+
+    def _and(self, f, indent, mask, cond):
+        if mask is None:
+            return cond
+        return self._spill(f, indent, "{} & {}".format(mask, cond))
+
+    def _assign(self, f, indent, node, value, mask):
+        if isinstance(node, Signal) and not node.variable:
+            slot = self._slot(node)
+            value = self._truncate(value, node.nbits, node.signed)
+            convert = "_i" if node.nbits <= _max_native_width else "_o"
+            if mask is None:
+                f.lines.append(indent + "n[{}] = {}({})".format(slot, convert, value))
+            else:
+                f.lines.append(indent + "n[{0}] = _where({1}, {2}({3}), n[{0}])".format(
+                    slot, mask, convert, value))
+            f.lines.append(indent + "w({})".format(slot))
+        elif isinstance(node, Cat):
+            value = self._spill(f, indent, value)
+            shift = 0
+            for element in node.l:
+                if shift:
+                    element_value = "({} >> {})".format(value, shift)
+                else:
+                    element_value = value
+                self._assign(f, indent, element, element_value, mask)
+                shift += len(element)
+        elif isinstance(node, _Slice):
+            full_value = self._expr(f, indent, node.value, True)
+            clear = _mask(node.stop) - _mask(node.start)
+            value = "(({} & ~{}) | (({} & {}) << {}))".format(
+                full_value, clear, value, _mask(node.stop - node.start), node.start)
+            self._assign(f, indent, node.value, self._spill(f, indent, value), mask)
+        elif isinstance(node, _ArrayProxy):
+            n = len(node.choices)
+            key = self._expr(f, indent, node.key)
+            index = self._spill(f, indent, "_minimum({}, {})".format(n - 1, key))
+            # normalize negative indices the same way Python indexing does
+            f.lines.append(indent + "{0} = _where({0} < 0, {0} + {1}, {0})".format(index, n))
+            value = self._spill(f, indent, value)
+            for i, choice in enumerate(node.choices):
+                choice_mask = self._and(f, indent, mask, "_cond({} == {})".format(index, i))
+                f.lines.append(indent + "if ({}).any():".format(choice_mask))
+                self._assign(f, indent + "    ", choice, value, choice_mask)
+        else:
+            raise NotImplementedError("Batch simulation cannot assign to {}".format(node))
+
+    def _block(self, f, indent, statements, mask):
+        if len(indent)//4 > _max_block_depth:
+            function = self._function(statements, masked=True)
+            f.lines.append(indent + "{}(ev, v, n, w, {})".format(function, mask))
+            return
+        n = len(f.lines)
+        self._statements(f, indent, statements, mask)
+        if len(f.lines) == n:
+            f.lines.append(indent + "pass")
+
+    def _if(self, f, indent, s, mask):
+        while True:
+            cond = self._spill(f, indent, "_cond({} & {})".format(
+                self._expr(f, indent, s.cond), _mask(len(s.cond))))
+            taken = self._and(f, indent, mask, cond)
+            f.lines.append(indent + "if ({}).any():".format(taken))
+            self._block(f, indent + "    ", s.t, taken)
+            if not s.f:
+                break
+            mask = self._and(f, indent, mask, "~" + cond)
+            # Elif chains are predicated at the same nesting depth
+            if len(s.f) == 1 and isinstance(s.f[0], If):
+                s = s.f[0]
+                continue
+            f.lines.append(indent + "if ({}).any():".format(mask))
+            self._block(f, indent + "    ", s.f, mask)
+            break
+
+    def _statements(self, f, indent, statements, mask):
+        for s in statements:
+            if isinstance(s, _Assign):
+                self._assign(f, indent, s.l, self._expr(f, indent, s.r), mask)
+            elif isinstance(s, If):
+                self._if(f, indent, s, mask)
+            elif isinstance(s, Case):
+                nbits, signed = value_bits_sign(s.test)
+                test = self._spill(f, indent, self._truncate(self._expr(f, indent, s.test), nbits, signed))
+                matched = None
+                for k, v in s.cases.items():
+                    if isinstance(k, Constant):
+                        cond = self._spill(f, indent, "_cond({} == {})".format(test, k.value))
+                        if matched is None:
+                            matched = cond
+                        else:
+                            matched = self._spill(f, indent, "{} | {}".format(matched, cond))
+                        taken = self._and(f, indent, mask, cond)
+                        f.lines.append(indent + "if ({}).any():".format(taken))
+                        self._block(f, indent + "    ", v, taken)
+                if "default" in s.cases:
+                    if matched is None:
+                        self._statements(f, indent, s.cases["default"], mask)
+                    else:
+                        taken = self._and(f, indent, mask, "~" + matched)
+                        f.lines.append(indent + "if ({}).any():".format(taken))
+                        self._block(f, indent + "    ", s.cases["default"], taken)
+            elif isinstance(s, collections.abc.Iterable):
+                self._statements(f, indent, s, mask)
+            else:
+                raise NotImplementedError("Batch simulation does not support {}".format(s))
+
+    def _function(self, statements, masked=False):
+        f = _CompiledFunction("f{}".format(self.nfunctions))
+        self.nfunctions += 1
+        self._block(f, "    ", statements, "m" if masked else None)
+        source = "def {}(ev, v, n, w{}):\n".format(f.name, ", m" if masked else "")
+        source += "\n".join(f.lines) + "\n"
+        self.source.append(source)
+        exec(compile(source, "<litex.gen.sim.batch {}>".format(f.name), "exec"), self.namespace)
+        return f.name
+
+    def compile(self, statements):
+        return self.namespace[self._function(statements)]
+
+
+class BatchMemory:
+    """Memory contents of all lanes, one column per lane"""
+    def __init__(self, memory, lanes, modified):
+        self.memory = memory
+        self.width = memory.width
+        self.depth = memory.depth
+        self.mask = 2**memory.width - 1
+        self.lanes = np.arange(lanes)
+        self.data = np.zeros((memory.depth, lanes), dtype=_dtype(memory.width))
+        self.next_data = self.data.copy()
+        self.written = []
+        self.modified = modified
+        if memory.init is not None:
+            self.load(memory.init)
+
+    def load(self, filename_or_data, endianness="big"):
+        """Loads the same contents in all lanes, see ``SimMemory.load``"""
+        if isinstance(filename_or_data, (str, dict)):
+            from litex.soc.integration.soc_core import get_mem_data
+            data = get_mem_data(filename_or_data, endianness)
+        else:
+            data = filename_or_data
+        if len(data) > self.depth:
+            raise ValueError("Memory {} is too small: {}/{} words".format(
+                self.memory.name_override, len(data), self.depth))
+        for address, word in enumerate(data):
+            self.data[address, :] = word & self.mask
+        self.next_data[:] = self.data
+
+    def read(self, addresses, postcommit=False):
+        data = self.next_data if postcommit else self.data
+        return data[np.minimum(self.depth - 1, addresses), self.lanes]
+
+    def write(self, addresses, values, enable):
+        addresses = np.minimum(self.depth - 1, addresses)[enable]
+        lanes = self.lanes[enable]
+        if not len(lanes):
+            return
+        if not self.written:
+            self.modified.append(self)
+        self.next_data[addresses, lanes] = np.broadcast_to(values & self.mask, enable.shape)[enable]
+        self.written.append((addresses, lanes))
+
+    def commit(self):
+        changed = False
+        for addresses, lanes in self.written:
+            new = self.next_data[addresses, lanes]
+            if (self.data[addresses, lanes] != new).any():
+                self.data[addresses, lanes] = new
+                changed = True
+        self.written.clear()
+        return changed
+
+
+class BatchMemoryPort(SimMemoryPort):
+    """Vectorized model of a ``Memory`` port, see ``SimMemoryPort``"""
+    def comb(self, ev, v, n, w):
+        n[self.dat_r] = ev.memories[self.memory].read(v[self.async_adr_slot])
+        w(self.dat_r)
+
+    def sync(self, ev, v, n, w):
+        port = self.port
+        memory = ev.memories[self.memory]
+        adr = v[self.adr]
+
+        # read
+        if not port.async_read:
+            enable = ev.condition(1 if self.re is None else v[self.re] & self.re_mask)
+            if port.mode == WRITE_FIRST:
+                n[self.async_adr_slot] = np.where(enable, adr, n[self.async_adr_slot])
+                w(self.async_adr_slot)
+            else:
+                if port.mode == NO_CHANGE and self.we is not None:
+                    enable = enable & ev.condition(~v[self.we] & self.we_mask)
+                n[self.dat_r] = np.where(enable, memory.read(adr), n[self.dat_r])
+                w(self.dat_r)
+
+        # write
+        if self.we is not None:
+            we = v[self.we]
+            dat_w = v[self.dat_w]
+            if port.we_granularity:
+                granularity = port.we_granularity
+                word = memory.read(adr, postcommit=True)
+                written = ev.condition(0)
+                for i in range(memory.width//granularity):
+                    lane = ev.condition(we & (1 << i))
+                    mask = (2**granularity - 1) << i*granularity
+                    word = np.where(lane, (word & ~mask) | (dat_w & mask), word)
+                    written = written | lane
+                memory.write(adr, word, written)
+            else:
+                memory.write(adr, dat_w, ev.condition(we & self.we_mask))
+
+
+class _LaneValues:
+    def __init__(self, arrays, lane):
+        self.arrays = arrays
+        self.lane = lane
+
+    def __getitem__(self, slot):
+        return int(self.arrays[slot][self.lane])
+
+    def __setitem__(self, slot, value):
+        # arrays are shared between the current and next values, never
+        # modify them in place
+        array = self.arrays[slot].copy()
+        array[self.lane] = value
+        self.arrays[slot] = array
+
+
+class _LaneMemory:
+    def __init__(self, memory, lane):
+        self.memory = memory
+        self.lane = lane
+
+    def read(self, address, postcommit=False):
+        data = self.memory.next_data if postcommit else self.memory.data
+        return int(data[min(self.memory.depth - 1, address), self.lane])
+
+    def write(self, address, value):
+        enable = np.arange(len(self.memory.lanes)) == self.lane
+        self.memory.write(np.full(enable.shape, address), value, enable)
+
+
+class _LaneEvaluator(Evaluator):
+    """Evaluator for the generators of one lane of a ``BatchEvaluator``"""
+    def __init__(self, batch, lane):
+        self.batch = batch
+        self.clock_domains = batch.clock_domains
+        self.memories = {memory: _LaneMemory(batch_memory, lane)
+                         for memory, batch_memory in batch.memories.items()}
+        self.slots = batch.slots
+        self.signals = batch.signals
+        self.values = _LaneValues(batch.values, lane)
+        self.next_values = _LaneValues(batch.next_values, lane)
+        self.pending = batch.pending
+        self.pruned = batch.pruned
+
+    def allocate(self, signals):
+        self.batch.allocate(signals)
+
+
+class BatchEvaluator(Evaluator):
+    """Slot-indexed signal store holding one NumPy array per signal
+
+    Each array has one element per lane. Arrays are never modified in
+    place, so that ``values`` and ``next_values`` can share them.
+    """
+    def __init__(self, clock_domains, memories, lanes):
+        Evaluator.__init__(self, clock_domains, [])
+        self.lanes = lanes
+        self.memories = {memory: BatchMemory(memory, lanes, self.modified_memories)
+                         for memory in memories}
+
+    def allocate(self, signals):
+        for signal in signals:
+            if signal not in self.slots:
+                self.slots[signal] = len(self.signals)
+                self.signals.append(signal)
+                array = np.full(self.lanes, signal.reset.value, dtype=_dtype(signal.nbits))
+                self.values.append(array)
+                self.next_values.append(array)
+
+    def lane(self, lane):
+        return _LaneEvaluator(self, lane)
+
+    def condition(self, x):
+        return np.broadcast_to(np.asarray(x) != 0, (self.lanes,))
+
+    def native(self, x):
+        x = np.asarray(x).astype(np.int64, copy=False)
+        if x.ndim == 0:
+            x = np.full(self.lanes, x, dtype=np.int64)
+        return x
+
+    def python(self, x):
+        x = np.asarray(x).astype(object, copy=False)
+        if x.ndim == 0:
+            x = np.full(self.lanes, x, dtype=object)
+        return x
+
+    def select(self, index, choices):
+        choices = np.stack([np.broadcast_to(c, (self.lanes,)) for c in choices])
+        return choices[index, np.arange(self.lanes)]
+
+    def commit(self):
+        r = []
+        values = self.values
+        next_values = self.next_values
+        for slot in self.pending:
+            value = next_values[slot]
+            if value is not values[slot] and not np.array_equal(values[slot], value):
+                r.append(slot)
+            values[slot] = value
+        self.pending.clear()
+        return r
+
+    def assign(self, node, value):
+        if isinstance(node, Signal):
+            slot = self.slot(node)
+            value = _truncate(value, node.nbits, node.signed)
+            self.next_values[slot] = np.full(self.lanes, value, dtype=_dtype(node.nbits))
+            self.pending.append(slot)
+        else:
+            raise NotImplementedError(node)
+
+
+class _Lane:
+    def __init__(self, generators, evaluator):
+        self.evaluator = evaluator
+        self.generators = dict()
+        self.passive_generators = set()
+        self.parked_generators = dict()
+        if not isinstance(generators, dict):
+            generators = {"sys": generators}
+        for k, v in generators.items():
+            if (isinstance(v, collections.abc.Iterable)
+                    and not isinstance(v, collections.abc.Generator)):
+                self.generators[k] = list(v)
+            else:
+                self.generators[k] = [v]
+
+
+class BatchSimulator(Simulator):
+    """Simulates independent instances of a design in lockstep
+
+    ``generators`` is a list with one entry per lane, each in any of the
+    forms accepted by ``Simulator``. All lanes share the same compiled
+    design, with each signal and memory word held as a NumPy array of one
+    element per lane, so that the cost of evaluating the design is
+    amortized over the lanes. Lanes keep being simulated until the active
+    generators of all lanes are exhausted. Snapshots and VCD tracing are
+    not supported.
+    """
+    _cacheable = False
+
+    def __init__(self, fragment_or_module, generators, *args, **kwargs):
+        self.lanes = len(generators)
+        if kwargs.get("vcd_name") is not None:
+            raise ValueError("VCD tracing is not supported by the batch simulator")
+        if kwargs.get("coverage"):
+            raise ValueError("Coverage is not supported by the batch simulator")
+        Simulator.__init__(self, fragment_or_module, generators, *args, **kwargs)
+
+    def _new_evaluator(self, memories):
+        return BatchEvaluator(self.fragment.clock_domains, memories, self.lanes)
+
+    def _new_memory_port(self, memory, port):
+        return BatchMemoryPort(memory, port, self.evaluator)
+
+    def _new_executor(self):
+        return BatchCompiler(self.evaluator).compile
+
+    def _set_generators(self, generators):
+        self.lane_generators = [_Lane(lane_generators, self.evaluator.lane(i))
+                                for i, lane_generators in enumerate(generators)]
+
+    def _process_generators(self, cd):
+        for lane in self.lane_generators:
+            if cd in lane.generators:
+                self._resume_generators(lane.generators[cd], lane.passive_generators,
+                                        lane.parked_generators, lane.evaluator)
+
+    def _has_generators(self, cd):
+        return any(lane.generators.get(cd) for lane in self.lane_generators)
+
+    def _continue_simulation(self):
+        for lane in self.lane_generators:
+            for cd_generators in lane.generators.values():
+                if set(cd_generators) - lane.passive_generators:
+                    return True
+        return False
+
+    def snapshot(self):
+        raise NotImplementedError("Snapshots are not supported by the batch simulator")
+
+    def restore(self, *args, **kwargs):
+        raise NotImplementedError("Snapshots are not supported by the batch simulator")
+
+    def fork(self, *args, **kwargs):
+        raise NotImplementedError("Snapshots are not supported by the batch simulator")
+
+
+def run_batch_simulation(*args, **kwargs):
+    with BatchSimulator(*args, **kwargs) as s:
+        s.run()
@@ -0,0 +1,176 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import hashlib
+import collections
+
+from migen.fhdl.structure import *
+from migen.fhdl.structure import (_Operator, _Slice, _ArrayProxy, _Assign,
+                                  _Statement)
+from migen.fhdl.specials import Memory, _MemoryLocation
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+class _Signature:
+    """Structural description of a fragment
+
+    Signals and memories are numbered in their order of appearance, so
+    that identically built fragments get the same description regardless
+    of the identity of their signals. ``signals`` and ``memories`` list
+    them in this order.
+    """
+    def __init__(self):
+        self.signals = []
+        self.signal_index = dict()
+        self.memories = []
+        self.memory_index = dict()
+        self.memory_contents = []
+        self.stack = set()
+
+    def signal(self, signal):
+        try:
+            return self.signal_index[signal]
+        except KeyError:
+            index = self.signal_index[signal] = len(self.signals)
+            self.signals.append(signal)
+            return index
+
+    def value(self, node):
+        if node is None or isinstance(node, (bool, int, float, str)):
+            return node
+        elif isinstance(node, Constant):
+            return ("C", node.value, node.nbits, node.signed)
+        elif isinstance(node, Signal):
+            return ("S", self.signal(node))
+        elif isinstance(node, _Operator):
+            return ("O", node.op) + tuple(self.value(o) for o in node.operands)
+        elif isinstance(node, _Slice):
+            return ("L", self.value(node.value), node.start, node.stop)
+        elif isinstance(node, Cat):
+            return ("T",) + tuple(self.value(e) for e in node.l)
+        elif isinstance(node, Replicate):
+            return ("R", self.value(node.v), node.n)
+        elif isinstance(node, _ArrayProxy):
+            return ("A", self.value(node.key)) + tuple(self.value(c) for c in node.choices)
+        elif isinstance(node, ClockSignal):
+            return ("K", node.cd)
+        elif isinstance(node, ResetSignal):
+            return ("Z", node.cd, node.allow_reset_less)
+        elif isinstance(node, _MemoryLocation):
+            return ("M", self.memory(node.memory), self.value(node.index))
+        elif isinstance(node, _Assign):
+            return ("=", self.value(node.l), self.value(node.r))
+        elif isinstance(node, If):
+            return ("I", self.value(node.cond), self.value(node.t), self.value(node.f))
+        elif isinstance(node, Case):
+            return ("W", self.value(node.test)) + tuple(
+                (self.value(k), self.value(v)) for k, v in node.cases.items())
+        elif isinstance(node, Display):
+            return ("D", node.s) + tuple(self.value(a) for a in node.args)
+        elif isinstance(node, ClockDomain):
+            return ("CD", node.name, self.value(node.clk), self.value(node.rst))
+        elif isinstance(node, Memory):
+            return ("MEM", self.memory(node))
+        elif isinstance(node, (list, tuple)):
+            return tuple(self.value(e) for e in node)
+        elif hasattr(node, "__dict__") and not isinstance(node, _Statement):
+            # specials and the objects they hold (Instance items, ...)
+            if id(node) in self.stack:
+                raise _Uncacheable
+            self.stack.add(id(node))
+            r = (type(node).__module__, type(node).__qualname__) + tuple(
+                (k, self.value(v)) for k, v in sorted(vars(node).items())
+                if k not in ("duid", "name_override"))
+            self.stack.discard(id(node))
+            return r
+        raise _Uncacheable
+
+    def memory(self, memory):
+        try:
+            return self.memory_index[memory]
+        except KeyError:
+            index = self.memory_index[memory] = len(self.memories)
+            self.memories.append(memory)
+            self.memory_contents.append((memory.width, memory.depth,
+                                         tuple(memory.init or ()),
+                                         self.value(memory.ports)))
+            return index
+
+    def fragment(self, fragment):
+        r = [self.value(fragment.comb)]
+        for cd in sorted(fragment.sync.keys()):
+            r.append((cd, self.value(fragment.sync[cd])))
+        r.append(tuple(self.value(cd) for cd in
+                       sorted(fragment.clock_domains, key=lambda cd: cd.name)))
+        # specials are held in a set: order them by their structure alone
+        # (a tie between identical specials only costs a cache miss)
+        keys = []
+        for special in fragment.specials:
+            local = _Signature()
+            keys.append((repr((local.value(special), local.memory_contents)), special))
+        for key, special in sorted(keys, key=lambda k: k[0]):
+            r.append(self.value(special))
+        r.append(tuple(self.memory_contents))
+        r.append(tuple((s.nbits, s.signed, s.reset.value, s.reset_less, s.variable)
+                       for s in self.signals))
+        return r
+
+
+def design_signature(fragment, options=()):
+    """Returns a structural hash of ``fragment``
+
+    Returns a ``(key, signals, memories)`` tuple: ``key`` identifies the
+    structure of ``fragment`` (and ``options``), and ``signals`` and
+    ``memories`` list the objects of ``fragment`` in an order that is the
+    same for all fragments with the same key. ``key`` is ``None`` if the
+    fragment holds objects that cannot be described.
+    """
+    signature = _Signature()
+    try:
+        description = signature.fragment(fragment)
+    except _Uncacheable:
+        return None, [], []
+    key = hashlib.sha256(repr((description, options)).encode()).hexdigest()
+    return key, signature.signals, signature.memories
+
+
+class ElaborationCache:
+    """Cache of elaborated designs
+
+    Holds the lowered fragment, the sensitivity index, the compiled code
+    and the initial state of the evaluator of the last ``maxsize``
+    designs simulated with this cache (see the ``cache`` argument of
+    ``Simulator``). Simulations of designs with the same structure (same
+    statements, signal widths, reset values, memories, specials, clocks
+    and simulator options) reuse them, and only allocate fresh signal
+    state.
+    """
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            entry = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, elaboration):
+        self.entries[key] = elaboration
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+default_cache = ElaborationCache()
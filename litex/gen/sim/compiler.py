@@ -0,0 +1,341 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import collections.abc
+
+from migen.fhdl.structure import *
+from migen.fhdl.structure import (_Operator, _Slice, _ArrayProxy, _Assign)
+from migen.fhdl.bitcontainer import value_bits_sign
+from migen.fhdl.specials import _MemoryLocation
+
+from litex.gen.sim.coverage import CoverPoint
+
+
+# Python operators equivalent to the ones implemented by Evaluator.eval
+_binary_ops = {
+    "+": "+",
+    "-": "-",
+    "*": "*",
+
+    ">>>": ">>",
+    "<<<": "<<",
+
+    "&": "&",
+    "^": "^",
+    "|": "|",
+
+    "<": "<",
+    "<=": "<=",
+    "==": "==",
+    "!=": "!=",
+    ">": ">",
+    ">=": ">=",
+}
+
+# Expressions nested deeper than this are spilled into temporaries to stay
+# well within the limits of the Python parser.
+_max_expr_depth = 32
+# Statement blocks nested deeper than this are moved into helper functions
+# to stay within the limits of the Python compiler.
+_max_block_depth = 48
+
+
+def _mask(nbits):
+    return (1 << nbits) - 1
+
+
+def _truncate(value, nbits, signed):
+    value = value & (2**nbits - 1)
+    if signed and (value & 2**(nbits - 1)):
+        value -= 2**nbits
+    return value
+
+
+def expression_width(node):
+    """Returns the width of the widest intermediate result of an expression"""
+    if isinstance(node, (Constant, Signal, ClockSignal, ResetSignal)):
+        return value_bits_sign(node)[0]
+    elif isinstance(node, _Operator):
+        children = node.operands
+    elif isinstance(node, _Slice):
+        children = [node.value]
+    elif isinstance(node, Cat):
+        children = node.l
+    elif isinstance(node, Replicate):
+        children = [node.v]
+    elif isinstance(node, _ArrayProxy):
+        children = list(node.choices) + [node.key]
+    elif isinstance(node, _MemoryLocation):
+        return max(node.memory.width, expression_width(node.index))
+    else:
+        raise NotImplementedError(node)
+    return max([value_bits_sign(node)[0]] + [expression_width(child) for child in children])
+
+
+class _CompiledFunction:
+    def __init__(self, name):
+        self.name = name
+        self.lines = []
+        self.ntemps = 0
+
+    def temp(self):
+        self.ntemps += 1
+        return "t{}".format(self.ntemps)
+
+
+class Compiler:
+    """Compiles lists of statements into Python functions
+
+    The generated functions take an ``Evaluator``, its ``values`` and
+    ``next_values`` lists and the ``append`` method of its ``pending`` list
+    as arguments and have the same semantics as ``Evaluator.execute``, with
+    all dispatch on node types and signal slots resolved once at compile
+    time. Constructs that have no compiled form fall back to the evaluator.
+    """
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.namespace = dict()
+        self.names = dict()
+        self.nfunctions = 0
+        self.source = []
+
+    def _bind(self, obj, prefix):
+        try:
+            return self.names[id(obj)]
+        except KeyError:
+            name = "{}{}".format(prefix, len(self.names))
+            self.names[id(obj)] = name
+            self.namespace[name] = obj
+            return name
+
+    def _slot(self, signal):
+        return str(self.evaluator.slot(signal))
+
+    # expressions
+
+    def _spill(self, f, indent, code):
+        t = f.temp()
+        f.lines.append(indent + "{} = {}".format(t, code))
+        return t
+
+    def _expr(self, f, indent, node, postcommit=False):
+        code, depth = self._expr_depth(f, indent, node, postcommit)
+        return code
+
+    def _sub(self, f, indent, node, postcommit):
+        code, depth = self._expr_depth(f, indent, node, postcommit)
+        if depth > _max_expr_depth:
+            return self._spill(f, indent, code), 0
+        return code, depth
+
+    def _expr_depth(self, f, indent, node, postcommit):
+        if isinstance(node, Constant):
+            return repr(node.value), 0
+        elif isinstance(node, Signal):
+            if postcommit:
+                return "n[{}]".format(self._slot(node)), 0
+            else:
+                return "v[{}]".format(self._slot(node)), 0
+        elif isinstance(node, _Operator):
+            operands = [self._sub(f, indent, o, postcommit) for o in node.operands]
+            depth = max(d for c, d in operands) + 1
+            codes = [c for c, d in operands]
+            if node.op == "-" and len(codes) == 1:
+                return "(-{})".format(codes[0]), depth
+            elif node.op == "~":
+                return "(~{})".format(codes[0]), depth
+            elif node.op == "m":
+                return "({1} if {0} else {2})".format(*codes), depth
+            elif node.op in _binary_ops and len(codes) == 2:
+                return "({} {} {})".format(codes[0], _binary_ops[node.op], codes[1]), depth
+        elif isinstance(node, _Slice):
+            code, depth = self._sub(f, indent, node.value, postcommit)
+            mask = _mask(node.stop - node.start)
+            if node.start:
+                return "(({} >> {}) & {})".format(code, node.start, mask), depth + 1
+            else:
+                return "({} & {})".format(code, mask), depth + 1
+        elif isinstance(node, Cat):
+            shift = 0
+            terms = []
+            depth = 0
+            for element in node.l:
+                nbits = len(element)
+                code, d = self._sub(f, indent, element, postcommit)
+                depth = max(depth, d)
+                if shift:
+                    terms.append("(({} & {}) << {})".format(code, _mask(nbits), shift))
+                else:
+                    terms.append("({} & {})".format(code, _mask(nbits)))
+                shift += nbits
+            if not terms:
+                return "0", 0
+            return "(" + " | ".join(terms) + ")", depth + 1
+        elif isinstance(node, Replicate):
+            nbits = len(node.v)
+            code, depth = self._sub(f, indent, node.v, postcommit)
+            factor = sum(1 << i*nbits for i in range(node.n))
+            return "(({} & {}) * {})".format(code, _mask(nbits), factor), depth + 1
+        elif isinstance(node, _ArrayProxy):
+            key, depth = self._sub(f, indent, node.key, postcommit)
+            index = "min({}, {})".format(len(node.choices) - 1, key)
+            if all(isinstance(c, Signal) for c in node.choices):
+                array = self._bind(tuple(self.evaluator.slot(c) for c in node.choices), "a")
+                return "{}[{}[{}]]".format("n" if postcommit else "v", array, index), depth + 1
+            else:
+                choices = [self._sub(f, indent, c, postcommit) for c in node.choices]
+                depth = max([depth] + [d for c, d in choices])
+                return "({},)[{}]".format(", ".join(c for c, d in choices), index), depth + 1
+        elif isinstance(node, ClockSignal):
+            cd = self.evaluator.clock_domains[node.cd]
+            return self._expr_depth(f, indent, cd.clk, postcommit)
+        elif isinstance(node, ResetSignal):
+            rst = self.evaluator.clock_domains[node.cd].rst
+            if rst is None:
+                if node.allow_reset_less:
+                    return "0", 0
+            else:
+                return self._expr_depth(f, indent, rst, postcommit)
+
+        # no compiled form, defer to the evaluator
+        node = self._bind(node, "e")
+        return "ev.eval({}, {})".format(node, postcommit), 0
+
+    # statements
+
+    def _truncate(self, code, nbits, signed):
+        if signed and nbits:
+            return "((({} & {}) ^ {}) - {})".format(code, _mask(nbits),
+                                                   1 << (nbits - 1), 1 << (nbits - 1))
+        else:
+            return "({} & {})".format(code, _mask(nbits))
+
+    def _assign(self, f, indent, node, value):
+        if isinstance(node, Signal) and not node.variable:
+            slot = self._slot(node)
+            value = self._truncate(value, node.nbits, node.signed)
+            f.lines.append(indent + "n[{}] = {}".format(slot, value))
+            f.lines.append(indent + "w({})".format(slot))
+        elif isinstance(node, Cat):
+            value = self._spill(f, indent, value)
+            shift = 0
+            for element in node.l:
+                nbits = len(element)
+                if shift:
+                    element_value = "({} >> {})".format(value, shift)
+                else:
+                    element_value = value
+                self._assign(f, indent, element, element_value)
+                shift += nbits
+        elif isinstance(node, _Slice):
+            full_value = self._expr(f, indent, node.value, True)
+            clear = _mask(node.stop) - _mask(node.start)
+            value = "(({} & ~{}) | (({} & {}) << {}))".format(
+                full_value, clear, value, _mask(node.stop - node.start), node.start)
+            self._assign(f, indent, node.value, self._spill(f, indent, value))
+        elif isinstance(node, _ArrayProxy):
+            key = self._expr(f, indent, node.key)
+            index = self._spill(f, indent, "min({}, {})".format(len(node.choices) - 1, key))
+            signals = all(isinstance(c, Signal) and not c.variable for c in node.choices)
+            if signals and len(set((c.nbits, c.signed) for c in node.choices)) == 1:
+                array = self._bind(tuple(self.evaluator.slot(c) for c in node.choices), "a")
+                value = self._truncate(value, node.choices[0].nbits, node.choices[0].signed)
+                f.lines.append(indent + "{0} = {1}[{0}]".format(index, array))
+                f.lines.append(indent + "n[{}] = {}".format(index, value))
+                f.lines.append(indent + "w({})".format(index))
+            else:
+                value = self._spill(f, indent, value)
+                # normalize negative indices the same way Python indexing does
+                f.lines.append(indent + "{0} = range({1})[{0}]".format(index, len(node.choices)))
+                for i, choice in enumerate(node.choices):
+                    f.lines.append(indent + "{} {} == {}:".format("if" if i == 0 else "elif", index, i))
+                    self._assign(f, indent + "    ", choice, value)
+        else:
+            # no compiled form, defer to the evaluator
+            node = self._bind(node, "e")
+            f.lines.append(indent + "ev.assign({}, {})".format(node, value))
+
+    def _fallback(self, f, indent, statement):
+        statement = self._bind(statement, "x")
+        f.lines.append(indent + "ev.execute([{}])".format(statement))
+
+    def _block(self, f, indent, statements):
+        if len(indent)//4 > _max_block_depth:
+            function = self._function(statements)
+            f.lines.append(indent + "{}(ev, v, n, w)".format(function))
+            return
+        n = len(f.lines)
+        self._statements(f, indent, statements)
+        if len(f.lines) == n:
+            f.lines.append(indent + "pass")
+
+    def _if(self, f, indent, s):
+        keyword = "if"
+        while True:
+            n = len(f.lines)
+            cond = self._expr(f, indent, s.cond)
+            if keyword == "elif" and len(f.lines) != n:
+                # the condition needs temporaries, which cannot be
+                # computed ahead of an elif: nest it instead
+                spilled = f.lines[n:]
+                del f.lines[n:]
+                f.lines.append(indent + "else:")
+                indent += "    "
+                f.lines += ["    " + line for line in spilled]
+                keyword = "if"
+            f.lines.append(indent + "{} {} & {}:".format(keyword, cond, _mask(len(s.cond))))
+            self._block(f, indent + "    ", s.t)
+            # flatten Elif chains to keep the nesting depth constant
+            if len(s.f) == 1 and isinstance(s.f[0], If):
+                s = s.f[0]
+                keyword = "elif"
+                continue
+            if s.f:
+                f.lines.append(indent + "else:")
+                self._block(f, indent + "    ", s.f)
+            break
+
+    def _statements(self, f, indent, statements):
+        for s in statements:
+            if isinstance(s, _Assign):
+                self._assign(f, indent, s.l, self._expr(f, indent, s.r))
+            elif isinstance(s, If):
+                self._if(f, indent, s)
+            elif isinstance(s, Case):
+                nbits, signed = value_bits_sign(s.test)
+                test = self._spill(f, indent, self._truncate(self._expr(f, indent, s.test), nbits, signed))
+                keyword = "if"
+                for k, v in s.cases.items():
+                    if isinstance(k, Constant):
+                        f.lines.append(indent + "{} {} == {}:".format(keyword, test, k.value))
+                        self._block(f, indent + "    ", v)
+                        keyword = "elif"
+                if "default" in s.cases:
+                    if keyword == "if":
+                        self._statements(f, indent, s.cases["default"])
+                    else:
+                        f.lines.append(indent + "else:")
+                        self._block(f, indent + "    ", s.cases["default"])
+            elif isinstance(s, CoverPoint):
+                f.lines.append(indent + "{}[{}] += 1".format(self._bind(s.hits, "h"), s.index))
+            elif isinstance(s, collections.abc.Iterable):
+                self._statements(f, indent, s)
+            else:
+                self._fallback(f, indent, s)
+
+    def _function(self, statements):
+        f = _CompiledFunction("f{}".format(self.nfunctions))
+        self.nfunctions += 1
+        self._block(f, "    ", statements)
+        source = "def {}(ev, v, n, w):\n".format(f.name) + "\n".join(f.lines) + "\n"
+        self.source.append(source)
+        exec(compile(source, "<litex.gen.sim {}>".format(f.name), "exec"), self.namespace)
+        return f.name
+
+    def compile(self, statements):
+        """Returns a function executing ``statements``
+
+        The returned function must be called with the evaluator, its
+        ``values`` and ``next_values`` lists and ``pending.append``.
+        """
+        return self.namespace[self._function(statements)]
@@ -8,9 +8,15 @@
 # License: BSD
 
 import operator
+import math
 import collections
+import collections.abc
 import inspect
-from functools import wraps
+import heapq
+import copy
+from functools import wraps, partial
+from fnmatch import fnmatchcase
+from time import perf_counter
 
 from migen.fhdl.structure import *
 from migen.fhdl.structure import (_Value, _Statement,
@@ -18,13 +24,22 @@ from migen.fhdl.structure import (_Value, _Statement,
                                   _Assign, _Fragment)
 from migen.fhdl.bitcontainer import value_bits_sign
 from migen.fhdl.tools import (list_targets, list_signals,
-                              insert_resets, lower_specials)
-from migen.fhdl.simplify import MemoryToArray
-from migen.fhdl.specials import _MemoryLocation
+                              insert_resets, insert_reset, lower_specials)
+from migen.fhdl.specials import Memory, _MemoryLocation
 from migen.fhdl.module import Module
+from migen.genlib.record import Record
+from migen.fhdl.namer import build_namespace
 from migen.genlib.resetsync import AsyncResetSynchronizer
 
 from litex.gen.sim.vcd import VCDWriter, DummyVCDWriter
+from litex.gen.sim.compiler import Compiler, _truncate
+from litex.gen.sim.sensitivity import SensitivityIndex, _InputLister, group_by_targets
+from litex.gen.sim.profiler import SimProfiler
+from litex.gen.sim.hierarchy import ModuleHierarchy, signal_name
+from litex.gen.sim.memory import SimMemory, SimMemoryPort
+from litex.gen.sim.cache import design_signature, default_cache
+from litex.gen.sim.optimizer import optimize_fragment
+from litex.gen.sim.coverage import SimCoverage, CoverPoint
 
 
 class ClockState:
@@ -33,9 +48,27 @@ class ClockState:
         self.half_period = half_period
         self.time_before_trans = time_before_trans
 
+    def state(self, t):
+        """Returns the level at time ``t`` and the time of the next transition"""
+        if t < self.time_before_trans:
+            return self.high, self.time_before_trans
+        transitions = (t - self.time_before_trans)//self.half_period + 1
+        return (self.high != bool(transitions & 1),
+                self.time_before_trans + transitions*self.half_period)
+
 
 class TimeManager:
-    def __init__(self, description):
+    """Schedules the edges of the clocks
+
+    ``clocks`` holds the initial state of each clock. The edges of the
+    active clocks (all by default, see ``set_active``) are precomputed
+    over their hyperperiod (the least common multiple of their periods)
+    and replayed from this table when it has at most ``max_table``
+    entries, otherwise they are scheduled with a priority queue. ``tick``
+    returns the time to the next edges and the tuples of the clocks
+    rising and falling, in the order of ``clocks``.
+    """
+    def __init__(self, description, max_table=4096):
         self.clocks = collections.OrderedDict()
 
         for k, period_phase in description.items():
@@ -51,21 +84,68 @@ class TimeManager:
             else:
                 high = False
             self.clocks[k] = ClockState(high, half_period, half_period - phase)
+        self.t = 0
+        self.max_table = max_table
+        self.active = None
+        self.set_active(self.clocks.keys())
+
+    def set_active(self, names):
+        """Restricts the schedule to the clocks in ``names`` (all if empty)"""
+        active = tuple(k for k in self.clocks if k in names) or tuple(self.clocks)
+        if active == self.active:
+            return
+        self.active = active
+        self.levels = dict()
+        self.events = []
+        for index, k in enumerate(active):
+            self.levels[k], t = self.clocks[k].state(self.t)
+            self.events.append((t, index, k))
+        heapq.heapify(self.events)
+
+        hyperperiod = 1
+        for k in active:
+            period = 2*self.clocks[k].half_period
+            hyperperiod = hyperperiod*period//math.gcd(hyperperiod, period)
+        nedges = sum(hyperperiod//self.clocks[k].half_period for k in active)
+        self.table = None
+        if nedges <= self.max_table:
+            # the edges of the next hyperperiod, as offsets from now
+            table = []
+            end = self.t + hyperperiod
+            while self.events[0][0] <= end:
+                t, rising, falling = self._pop()
+                table.append((t - self.t, rising, falling))
+            self.table = tuple(table)
+            self.hyperperiod = hyperperiod
+            self.base = self.t
+            self.position = 0
+
+    def _pop(self):
+        events = self.events
+        levels = self.levels
+        t = events[0][0]
+        rising = []
+        falling = []
+        while events and events[0][0] == t:
+            _, index, k = heapq.heappop(events)
+            high = levels[k] = not levels[k]
+            (rising if high else falling).append((index, k))
+            heapq.heappush(events, (t + self.clocks[k].half_period, index, k))
+        return (t, tuple(k for index, k in sorted(rising)),
+                tuple(k for index, k in sorted(falling)))
 
     def tick(self):
-        rising = set()
-        falling = set()
-        dt = min(cs.time_before_trans for cs in self.clocks.values())
-        for k, cs in self.clocks.items():
-            if cs.time_before_trans == dt:
-                cs.high = not cs.high
-                if cs.high:
-                    rising.add(k)
-                else:
-                    falling.add(k)
-            cs.time_before_trans -= dt
-            if not cs.time_before_trans:
-                cs.time_before_trans += cs.half_period
+        if self.table is not None:
+            offset, rising, falling = self.table[self.position]
+            t = self.base + offset
+            self.position += 1
+            if self.position == len(self.table):
+                self.position = 0
+                self.base += self.hyperperiod
+        else:
+            t, rising, falling = self._pop()
+        dt = t - self.t
+        self.t = t
         return dt, rising, falling
 
 
@@ -91,27 +171,75 @@ str2op = {
 }
 
 
-def _truncate(value, nbits, signed):
-    value = value & (2**nbits - 1)
-    if signed and (value & 2**(nbits - 1)):
-        value -= 2**nbits
-    return value
-
-
 class Evaluator:
-    def __init__(self, clock_domains, replaced_memories):
+    """Evaluates statements against a slot-indexed signal store
+
+    Each signal is given an integer slot, indexing the ``values`` (current)
+    and ``next_values`` (current plus pending assignments) lists. Assigned
+    slots are recorded in ``pending`` until the next ``commit``. Memories
+    are held natively in ``memories``, see ``SimMemory``.
+    """
+    def __init__(self, clock_domains, memories):
         self.clock_domains = clock_domains
-        self.replaced_memories = replaced_memories
-        self.signal_values = dict()
-        self.modifications = dict()
+        self.modified_memories = []
+        self.memories = {memory: SimMemory(memory, self.modified_memories)
+                         for memory in memories}
+        self.slots = dict()
+        self.signals = []
+        self.values = []
+        self.next_values = []
+        self.pending = []
+        # signals whose logic was removed by the optimizer
+        self.pruned = set()
+
+    def allocate(self, signals):
+        for signal in signals:
+            if signal not in self.slots:
+                self.slots[signal] = len(self.signals)
+                self.signals.append(signal)
+                self.values.append(signal.reset.value)
+                self.next_values.append(signal.reset.value)
+
+    def slot(self, signal):
+        try:
+            return self.slots[signal]
+        except KeyError:
+            if signal in self.pruned:
+                raise ValueError("Signal {} was removed by the optimizer, pass it in"
+                                 " keep to access it".format(signal))
+            self.allocate([signal])
+            return self.slots[signal]
 
     def commit(self):
-        r = set()
-        for k, v in self.modifications.items():
-            if k not in self.signal_values or self.signal_values[k] != v:
-                self.signal_values[k] = v
-                r.add(k)
-        self.modifications.clear()
+        r = []
+        values = self.values
+        next_values = self.next_values
+        for slot in self.pending:
+            value = next_values[slot]
+            if values[slot] != value:
+                values[slot] = value
+                r.append(slot)
+        self.pending.clear()
+        return r
+
+    def copy(self):
+        r = Evaluator(self.clock_domains, [])
+        # memories may be held under several keys (see _Elaboration)
+        copies = dict()
+        for memory, sim_memory in self.memories.items():
+            if id(sim_memory) not in copies:
+                copies[id(sim_memory)] = sim_memory.copy(r.modified_memories)
+            r.memories[memory] = copies[id(sim_memory)]
+        r.slots = dict(self.slots)
+        r.pruned = set(self.pruned)
+        r.signals = list(self.signals)
+        r.values = list(self.values)
+        r.next_values = list(self.next_values)
+        return r
+
+    def commit_memories(self):
+        r = [memory for memory in self.modified_memories if memory.commit()]
+        self.modified_memories.clear()
         return r
 
     def eval(self, node, postcommit=False):
@@ -119,14 +247,9 @@ class Evaluator:
             return node.value
         elif isinstance(node, Signal):
             if postcommit:
-                try:
-                    return self.modifications[node]
-                except KeyError:
-                    pass
-            try:
-                return self.signal_values[node]
-            except KeyError:
-                return node.reset.value
+                return self.next_values[self.slot(node)]
+            else:
+                return self.values[self.slot(node)]
         elif isinstance(node, _Operator):
             operands = [self.eval(o, postcommit) for o in node.operands]
             if node.op == "-":
@@ -159,8 +282,8 @@ class Evaluator:
             idx = min(len(node.choices) - 1, self.eval(node.key, postcommit))
             return self.eval(node.choices[idx], postcommit)
         elif isinstance(node, _MemoryLocation):
-            array = self.replaced_memories[node.memory]
-            return self.eval(array[self.eval(node.index, postcommit)], postcommit)
+            memory = self.memories[node.memory]
+            return memory.read(self.eval(node.index, postcommit), postcommit)
         elif isinstance(node, ClockSignal):
             return self.eval(self.clock_domains[node.cd].clk, postcommit)
         elif isinstance(node, ResetSignal):
@@ -179,8 +302,9 @@ class Evaluator:
     def assign(self, node, value):
         if isinstance(node, Signal):
             assert not node.variable
-            self.modifications[node] = _truncate(value,
-                                                 node.nbits, node.signed)
+            slot = self.slot(node)
+            self.next_values[slot] = _truncate(value, node.nbits, node.signed)
+            self.pending.append(slot)
         elif isinstance(node, Cat):
             for element in node.l:
                 nbits = len(element)
@@ -198,8 +322,7 @@ class Evaluator:
             idx = min(len(node.choices) - 1, self.eval(node.key))
             self.assign(node.choices[idx], value)
         elif isinstance(node, _MemoryLocation):
-            array = self.replaced_memories[node.memory]
-            self.assign(array[self.eval(node.index)], value)
+            self.memories[node.memory].write(self.eval(node.index), value)
         else:
             raise NotImplementedError(node)
 
@@ -223,21 +346,33 @@ class Evaluator:
                         break
                 if not found and "default" in s.cases:
                     self.execute(s.cases["default"])
-            elif isinstance(s, collections.Iterable):
+            elif isinstance(s, CoverPoint):
+                s.hits[s.index] += 1
+            elif isinstance(s, collections.abc.Iterable):
                 self.execute(s)
             elif isinstance(s, Display):
                 args = []
                 for arg in s.args:
                     assert isinstance(arg, _Value)
-                    try:
-                        args.append(self.signal_values[arg])
-                    except: # not yet evaluated
-                        args.append(arg.reset.value)
+                    args.append(self.eval(arg))
                 print(s.s %(*args,))
             else:
                 raise NotImplementedError
 
 
+def _interpreted(statements):
+    def execute(ev, v, n, w):
+        ev.execute(statements)
+    return execute
+
+
+class SimulatorSnapshot:
+    def __init__(self, values, memories, time):
+        self.values = values
+        self.memories = memories
+        self.time = time
+
+
 class DummyAsyncResetSynchronizerImpl(Module):
     def __init__(self, cd, async_reset):
         # TODO: asynchronous set
@@ -252,17 +387,170 @@ class DummyAsyncResetSynchronizer:
         return DummyAsyncResetSynchronizerImpl(dr.cd, dr.async_reset)
 
 
+class _Elaboration:
+    """Elaborated design of a ``Simulator``, held by an ``ElaborationCache``
+
+    ``load`` gives a new simulator the elaborated design and a fresh copy
+    of the initial state. The signals and memories of the new design
+    (listed in the same order as ``design_signals`` and ``design_memories``
+    by ``design_signature``) are given the slots and the contents of the
+    ones of the cached design.
+    """
+    _shared = ("fragment", "memory_ports", "sensitivity", "comb_readers",
+               "comb_drivers", "memory_readers", "comb_code", "sync_code")
+
+    def __init__(self, sim, design_signals, design_memories):
+        for name in self._shared:
+            setattr(self, name, getattr(sim, name))
+        ev = sim.evaluator
+        self.design_slots = [None if signal in ev.pruned else ev.slot(signal)
+                             for signal in design_signals]
+        self.design_memories = design_memories
+        self.nvcd_signals = len(sim.vcd_signals)
+        self.evaluator = sim.evaluator.copy()
+
+    def load(self, sim, design_signals, design_memories):
+        for name in self._shared:
+            setattr(sim, name, getattr(self, name))
+        ev = sim.evaluator = self.evaluator.copy()
+        for signal, slot in zip(design_signals, self.design_slots):
+            if slot is None:
+                ev.pruned.add(signal)
+            else:
+                ev.slots[signal] = slot
+                ev.signals[slot] = signal
+        for memory, cached in zip(design_memories, self.design_memories):
+            ev.memories[memory] = ev.memories[cached]
+        sim.vcd_signals = ev.signals[:self.nvcd_signals]
+
+
 # TODO: instances via Iverilog/VPI
 class Simulator:
+    """Simulates a fragment or module, driven by generators
+
+    When tracing to ``vcd_name``, ``trace_signals`` restricts the trace to
+    the signals with a VCD name, name or hierarchical name (such as
+    ``top.fifo.level``) matching one of the given glob patterns.
+    ``trace_start`` and ``trace_end`` (in cycles of the ``sys`` clock, -1
+    for no end) limit the trace to a window. With a ``trace_trigger``
+    expression, only the ``trace_depth`` = ``(pre, post)`` cycles around
+    the cycles where the trigger is true are written, the pre-trigger
+    cycles being held in memory until the trigger fires.
+
+    With a ``cache`` (an ``ElaborationCache``, or ``True`` for the default
+    one), the elaborated and compiled design is shared with the previous
+    simulations of designs with the same structure.
+
+    With ``optimize``, constant expressions are folded and the logic that
+    does not affect the signals read by the design, the traced signals
+    and the signals (or records) in ``keep`` is removed: generators can
+    only access the signals of this logic and the ones in ``keep``, and
+    the memories with ports or read by this logic.
+
+    With ``coverage``, the toggles of the bits of the signals, the branches
+    of the ``Case`` statements and the states and transitions of the FSMs
+    are counted (see ``SimCoverage``), and reported when the simulation is
+    closed: to ``coverage`` if it is a filename (JSON if it ends with
+    ``.json``), or to the standard output.
+    """
+    _cacheable = True
+
     def __init__(self, fragment_or_module, generators, clocks={"sys": 10}, vcd_name=None,
-                 special_overrides={}):
+                 special_overrides={}, compiled=True, memory_init={}, profile=None,
+                 trace_signals=None, trace_start=0, trace_end=-1, trace_trigger=None,
+                 trace_depth=(16, 16), cache=None, optimize=False, keep=(),
+                 coverage=None):
+        self.top = fragment_or_module
         if isinstance(fragment_or_module, _Fragment):
             self.fragment = fragment_or_module
         else:
             self.fragment = fragment_or_module.get_fragment()
 
-        mta = MemoryToArray()
-        mta.transform_fragment(None, self.fragment)
+        clocks = collections.OrderedDict(sorted(clocks.items(),
+                                                key=operator.itemgetter(0)))
+        self.time = TimeManager(clocks)
+        self.profile = profile
+        self.profiler = SimProfiler(fragment_or_module) if profile else None
+        self.coverage_output = coverage
+        self.coverage = SimCoverage(fragment_or_module) if coverage else None
+        self.compiled = compiled
+        self.optimize = optimize
+        self.keep = set()
+        for value in keep:
+            if isinstance(value, Record):
+                self.keep.update(value.flatten())
+            else:
+                self.keep.update(list_signals(wrap(value)))
+        self.tracing = vcd_name is not None
+        self.trace_signals = trace_signals
+        self.trace_trigger = None if trace_trigger is None else wrap(trace_trigger)
+
+        if cache is True:
+            cache = default_cache
+        key = None
+        # profiles and coverage are collected by the elaborated design
+        if cache is not None and self.profiler is None and self.coverage is None:
+            if not self._cacheable:
+                raise ValueError("{} does not support elaboration caching".format(
+                                 type(self).__name__))
+            options = (tuple(clocks.items()), compiled,
+                       sorted((k.__qualname__, v.__module__, v.__qualname__)
+                              for k, v in special_overrides.items()))
+            key, design_signals, design_memories = design_signature(self.fragment, options)
+            if key is not None and optimize:
+                # what is removed depends on the signals observed
+                index = {signal: i for i, signal in enumerate(design_signals)}
+                if self.tracing or self.trace_trigger is not None or not self.keep <= index.keys():
+                    key = None
+                else:
+                    key += ":" + ",".join(str(i) for i in sorted(index[s] for s in self.keep))
+        elaboration = None if key is None else cache.get(key)
+        if elaboration is None:
+            self._elaborate(clocks, special_overrides)
+            if key is not None:
+                cache.put(key, _Elaboration(self, design_signals, design_memories))
+        else:
+            elaboration.load(self, design_signals, design_memories)
+        for memory, data in memory_init.items():
+            self.evaluator.memories[memory].load(data)
+        self._bind()
+        self._set_generators(generators)
+
+        if trace_start > 0 or trace_end >= 0 or trace_trigger is not None:
+            # window and trigger are given in cycles of the sys clock (or of
+            # the first clock if there is none)
+            reference = self.time.clocks.get("sys", next(iter(self.time.clocks.values())))
+            period = 2*reference.half_period
+            pre_trigger, post_trigger = trace_depth
+            self.trace_window = (trace_start*period,
+                                 trace_end*period if trace_end >= 0 else None)
+            self.trace_pre_trigger = pre_trigger*period if trace_trigger is not None else 0
+            self.trace_post_trigger = post_trigger*period
+            self.trace_until = -1
+        else:
+            self.trace_window = None
+        self._open_vcd(vcd_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        self.vcd.close()
+        if self.profiler is not None:
+            self.profiler.dump(None if self.profile is True else self.profile)
+        if self.coverage is not None:
+            self.coverage.dump(None if self.coverage_output is True else self.coverage_output)
+
+    def _elaborate(self, clocks, special_overrides):
+        # memories are simulated natively, take them and their ports out
+        memories = [s for s in self.fragment.specials if isinstance(s, Memory)]
+        for memory in memories:
+            self.fragment.specials.discard(memory)
+            for port in memory.ports:
+                self.fragment.specials.discard(port)
 
         overrides = {AsyncResetSynchronizer: DummyAsyncResetSynchronizer}
         overrides.update(special_overrides)
@@ -270,105 +558,362 @@ class Simulator:
         if self.fragment.specials:
             raise ValueError("Could not lower all specials", self.fragment.specials)
 
+        for clock in clocks.keys():
+            if clock not in self.fragment.clock_domains:
+                cd = ClockDomain(name=clock, reset_less=True)
+                cd.clk.reset = C(self.time.clocks[clock].high)
+                self.fragment.clock_domains.append(cd)
+
+        pruned = set()
+        if self.optimize:
+            observed = set(self.keep)
+            for cd in self.fragment.clock_domains:
+                observed.add(cd.clk)
+                if cd.rst is not None:
+                    observed.add(cd.rst)
+            for memory in memories:
+                # memories are read by their ports
+                if memory.ports:
+                    observed.add(memory)
+                for port in memory.ports:
+                    for value in (port.adr, port.dat_w, port.we, port.re):
+                        if value is not None:
+                            observed |= list_signals(value)
+            if self.trace_trigger is not None:
+                observed |= list_signals(self.trace_trigger)
+            if self.tracing:
+                candidates = list_signals(self.fragment)
+                signal_filter = self._trace_filter(candidates)
+                observed |= {s for s in candidates if signal_filter is None or signal_filter(s)}
+            pruned = optimize_fragment(self.fragment,
+                                       Evaluator(self.fragment.clock_domains, []), observed)
+
+        if self.coverage is not None:
+            cds = self.fragment.clock_domains
+            self.fragment.comb = self.coverage.instrument(self.fragment.comb, cds)
+            self.fragment.sync = {cd: self.coverage.instrument(statements, cds)
+                                  for cd, statements in self.fragment.sync.items()}
+
+        if self.profiler is None:
+            sync_units = None
+        else:
+            # split the synchronous statements of each domain by targets so
+            # that they can be attributed to the modules driving them
+            sync_units = {cd: group_by_targets(statements)
+                          for cd, statements in self.fragment.sync.items()}
+        insert_resets(self.fragment)
+        # comb signals return to their reset value if nothing assigns them
+        self.fragment.comb[0:0] = [s.eq(s.reset)
+                                   for s in sorted(list_targets(self.fragment.comb),
+                                                   key=lambda x: x.duid)]
+        self.evaluator = self._new_evaluator(memories)
+        self.evaluator.pruned |= pruned
+
+        signals = list_signals(self.fragment)
+        for cd in self.fragment.clock_domains:
+            signals.add(cd.clk)
+            if cd.rst is not None:
+                signals.add(cd.rst)
+        signals = sorted(signals, key=lambda x: x.duid)
+        self.evaluator.allocate(signals)
+        self.vcd_signals = signals
+        if self.coverage is not None:
+            self.coverage.attach(self.evaluator, signals)
+
+        self.memory_ports = [self._new_memory_port(memory, port)
+                             for memory in memories for port in memory.ports]
+        self.sensitivity = SensitivityIndex(self.fragment.comb,
+                                            self.fragment.clock_domains,
+                                            [port for port in self.memory_ports
+                                             if port.targets])
+        slot = self.evaluator.slot
+        self.comb_readers = {slot(signal): units
+                             for signal, units in self.sensitivity.readers.items()}
+        self.comb_drivers = {slot(signal): unit
+                             for signal, unit in self.sensitivity.drivers.items()}
+        self.memory_readers = self.sensitivity.memory_readers
+
+        executor = self._new_executor()
+        self.comb_code = [unit.comb if isinstance(unit, SimMemoryPort) else executor(unit)
+                          for unit in self.sensitivity.units]
+        if sync_units is None:
+            self.sync_code = {cd: [executor(statements)]
+                              for cd, statements in self.fragment.sync.items()}
+        else:
+            self.sync_code = dict()
+            self.sync_entries = dict()
+            for cd, groups in sync_units.items():
+                for targets, statements in groups:
+                    if self.fragment.clock_domains[cd].rst is not None:
+                        statements = insert_reset(ResetSignal(cd), statements)
+                    self.sync_code.setdefault(cd, []).append(executor(statements))
+                    self.sync_entries.setdefault(cd, []).append(
+                        self.profiler.entry_for_targets("sync", targets))
+            self.comb_entries = [self.profiler.entry_for_port("comb", unit)
+                                 if isinstance(unit, SimMemoryPort) else
+                                 self.profiler.entry_for_targets("comb", list_targets(unit))
+                                 for unit in self.sensitivity.units]
+        for port in self.memory_ports:
+            self.sync_code.setdefault(port.cd, []).append(port.sync)
+            if self.profiler is not None:
+                self.sync_entries.setdefault(port.cd, []).append(
+                    self.profiler.entry_for_port("sync", port))
+
+    def _new_evaluator(self, memories):
+        return Evaluator(self.fragment.clock_domains, memories)
+
+    def _new_memory_port(self, memory, port):
+        return SimMemoryPort(memory, port, self.evaluator)
+
+    def _new_executor(self):
+        if self.compiled:
+            return Compiler(self.evaluator).compile
+        else:
+            return _interpreted
+
+    def _set_generators(self, generators):
         if not isinstance(generators, dict):
             generators = {"sys": generators}
         self.generators = dict()
         self.passive_generators = set()
+        self.parked_generators = dict()
         for k, v in generators.items():
-            if (isinstance(v, collections.Iterable)
+            if (isinstance(v, collections.abc.Iterable)
                     and not inspect.isgenerator(v)):
                 self.generators[k] = list(v)
             else:
                 self.generators[k] = [v]
 
-        clocks = collections.OrderedDict(sorted(clocks.items(),
-                                                key=operator.itemgetter(0)))
-        self.time = TimeManager(clocks)
-        for clock in clocks.keys():
-            if clock not in self.fragment.clock_domains:
-                cd = ClockDomain(name=clock, reset_less=True)
-                cd.clk.reset = C(self.time.clocks[clock].high)
-                self.fragment.clock_domains.append(cd)
+    def _bind(self):
+        ev = self.evaluator
+        args = (ev, ev.values, ev.next_values, ev.pending.append)
+        self.comb_functions = [partial(code, *args) for code in self.comb_code]
+        self.sync_functions = {cd: [partial(code, *args) for code in codes]
+                               for cd, codes in self.sync_code.items()}
+        if self.profiler is not None:
+            wrap = self.profiler.wrap
+            self.comb_functions = [wrap(entry, function, comb=True)
+                for entry, function in zip(self.comb_entries, self.comb_functions)]
+            self.sync_functions = {cd: [wrap(entry, function)
+                for entry, function in zip(self.sync_entries[cd], functions)]
+                for cd, functions in self.sync_functions.items()}
 
-        insert_resets(self.fragment)
-        # comb signals return to their reset value if nothing assigns them
-        self.fragment.comb[0:0] = [s.eq(s.reset)
-                                   for s in list_targets(self.fragment.comb)]
-        self.evaluator = Evaluator(self.fragment.clock_domains,
-                                   mta.replacements)
+    def _trace_filter(self, vcd_signals=None):
+        if self.trace_signals is None:
+            return None
+        if vcd_signals is None:
+            vcd_signals = self.vcd_signals
+        patterns = [self.trace_signals] if isinstance(self.trace_signals, str) else self.trace_signals
+        hierarchy = ModuleHierarchy(self.top)
+        ns = build_namespace(vcd_signals)
+        vcd_signals = set(vcd_signals)
+
+        def signal_filter(signal):
+            names = [hierarchy.signal_path(signal), signal_name(signal)]
+            if signal in vcd_signals:
+                names.append(ns.get_name(signal))
+            return any(fnmatchcase(name, pattern) for name in names for pattern in patterns)
+        return signal_filter
 
+    def _open_vcd(self, vcd_name):
         if vcd_name is None:
             self.vcd = DummyVCDWriter()
         else:
-            self.vcd = VCDWriter(vcd_name)
+            if self.trace_window is None:
+                self.vcd = VCDWriter(vcd_name, signal_filter=self._trace_filter())
+            else:
+                self.vcd = VCDWriter(vcd_name, signal_filter=self._trace_filter(),
+                                     recording=False, history=self.trace_pre_trigger)
+            self.vcd.t = self.time.t
+            self.vcd.init(self.vcd_signals)
+            values = self.evaluator.values
+            slots = self.evaluator.slots
+            for signal in self.vcd_signals:
+                self.vcd.set(signal, values[slots[signal]])
+            if self.trace_window is not None:
+                self._update_trace()
 
-            signals = list_signals(self.fragment)
-            for cd in self.fragment.clock_domains:
-                signals.add(cd.clk)
-                if cd.rst is not None:
-                    signals.add(cd.rst)
-            for memory_array in mta.replacements.values():
-                signals |= set(memory_array)
-            self.vcd.init(signals)
-            for signal in sorted(signals, key=lambda x: x.duid):
-                self.vcd.set(signal, signal.reset.value)
+    def _update_trace(self):
+        t = self.time.t
+        start, end = self.trace_window
+        recording = start <= t and (end is None or t < end)
+        if self.trace_trigger is not None:
+            if recording and self.evaluator.eval(self.trace_trigger):
+                self.trace_until = t + self.trace_post_trigger
+            recording = recording and t <= self.trace_until
+        if recording:
+            self.vcd.start()
+        else:
+            self.vcd.stop()
 
-    def __enter__(self):
-        return self
+    def snapshot(self):
+        """Captures the state of the simulation
 
-    def __exit__(self, type, value, traceback):
-        self.close()
+        The returned ``SimulatorSnapshot`` holds the signal values, the
+        memory contents and the clock phases, and can be passed to
+        ``restore`` or ``fork`` any number of times. Generators are not
+        part of the snapshot.
+        """
+        ev = self.evaluator
+        assert not ev.pending and not ev.modified_memories
+        return SimulatorSnapshot(
+            values=list(ev.values),
+            memories={memory: copy.copy(sim_memory.data)
+                      for memory, sim_memory in ev.memories.items()},
+            time=copy.deepcopy(self.time))
 
-    def close(self):
-        self.vcd.close()
+    def restore(self, snapshot, generators=None, vcd_name=None):
+        """Returns the simulation to the state captured by ``snapshot``
+
+        ``generators`` (in the same form as for the constructor) replace the
+        current generators if given. The trace continues in the current VCD
+        file, or in a new file starting at the time of the snapshot if
+        ``vcd_name`` is given.
+        """
+        ev = self.evaluator
+        n = len(snapshot.values)
+        # signals allocated after the snapshot return to their reset value
+        ev.values[:] = snapshot.values + [s.reset.value for s in ev.signals[n:]]
+        ev.next_values[:] = ev.values
+        ev.pending.clear()
+        ev.modified_memories.clear()
+        for memory, data in snapshot.memories.items():
+            ev.memories[memory].data[:] = data
+            ev.memories[memory].pending.clear()
+        self.time = copy.deepcopy(snapshot.time)
+        if generators is not None:
+            self._set_generators(generators)
+        if vcd_name is not None:
+            self.vcd.close()
+            self._open_vcd(vcd_name)
+        else:
+            for signal in self.vcd_signals:
+                self.vcd.set(signal, ev.values[ev.slots[signal]])
+
+    def fork(self, generators, snapshot=None, vcd_name=None):
+        """Returns an independent simulator starting from the current state
+
+        The new simulator shares the elaborated and compiled design with this
+        one, and starts from ``snapshot`` if given.
+        """
+        sim = copy.copy(self)
+        sim.evaluator = self.evaluator.copy()
+        sim.time = copy.deepcopy(self.time)
+        sim._set_generators(generators)
+        sim._bind()
+        sim._open_vcd(vcd_name)
+        if snapshot is not None:
+            sim.restore(snapshot)
+        return sim
+
+    def _execute_comb(self):
+        for function in self.comb_functions:
+            function()
+
+    def _execute_sync(self, cd):
+        for function in self.sync_functions[cd]:
+            function()
 
     def _commit_and_comb_propagate(self):
-        # TODO: optimize
-        all_modified = set()
-        modified = self.evaluator.commit()
-        all_modified |= modified
-        while modified:
-            self.evaluator.execute(self.fragment.comb)
-            modified = self.evaluator.commit()
-            all_modified |= modified
-        for signal in all_modified:
-            self.vcd.set(signal, self.evaluator.signal_values[signal])
-
-    def _evalexec_nested_lists(self, x):
+        readers = self.comb_readers
+        drivers = self.comb_drivers
+        functions = self.comb_functions
+        commit = self.evaluator.commit
+
+        # signals modified outside of the combinatorial logic wake up their
+        # readers, and their driver so that it can override them
+        all_modified = set(commit())
+        pending = set()
+        for sim_memory in self.evaluator.commit_memories():
+            pending.update(self.memory_readers.get(sim_memory.memory, ()))
+        for slot in all_modified:
+            pending.update(readers.get(slot, ()))
+            if slot in drivers:
+                pending.add(drivers[slot])
+        pending = list(pending)
+        heapq.heapify(pending)
+        queued = set(pending)
+
+        # units are ranked in dependency order, run them lowest rank first
+        while pending:
+            unit = heapq.heappop(pending)
+            queued.discard(unit)
+            functions[unit]()
+            modified = commit()
+            all_modified.update(modified)
+            for slot in modified:
+                for reader in readers.get(slot, ()):
+                    if reader not in queued:
+                        queued.add(reader)
+                        heapq.heappush(pending, reader)
+
+        signals = self.evaluator.signals
+        values = self.evaluator.values
+        for slot in all_modified:
+            self.vcd.set(signals[slot], values[slot])
+        if self.coverage is not None:
+            self.coverage.update(all_modified, values)
+        if self.profiler is not None:
+            self.profiler.end_propagation()
+
+    def _evalexec_nested_lists(self, x, evaluator):
         if isinstance(x, list):
-            return [self._evalexec_nested_lists(e) for e in x]
+            return [self._evalexec_nested_lists(e, evaluator) for e in x]
         elif isinstance(x, _Value):
-            return self.evaluator.eval(x)
+            return evaluator.eval(x)
         elif isinstance(x, _Statement):
-            self.evaluator.execute([x])
+            evaluator.execute([x])
             return None
         else:
             raise ValueError
 
-    def _process_generators(self, cd):
+    def _resume_generators(self, generators, passive_generators, parked_generators, evaluator):
         exhausted = []
-        for generator in self.generators[cd]:
+        profiler = self.profiler
+        for generator in generators:
+            waiter = parked_generators.get(generator)
+            if waiter is not None:
+                if not waiter.ready(evaluator):
+                    continue
+                del parked_generators[generator]
+            if profiler is not None:
+                start = perf_counter()
             reply = None
             while True:
                 try:
                     request = generator.send(reply)
+                    reply = None
                     if request is None:
                         break  # next cycle
                     elif isinstance(request, str):
                         if request == "passive":
-                            self.passive_generators.add(generator)
+                            passive_generators.add(generator)
                         elif request == "active":
-                            self.passive_generators.discard(generator)
+                            passive_generators.discard(generator)
                         else:
                             raise ValueError("Unknown simulator command: '{}'"
                                              .format(request))
+                    elif isinstance(request, (Wait, WaitUntil, WaitEdge)):
+                        waiter = request.park(evaluator)
+                        if waiter is not None:
+                            parked_generators[generator] = waiter
+                            break  # resumed by the waiter
                     else:
-                        reply = self._evalexec_nested_lists(request)
+                        reply = self._evalexec_nested_lists(request, evaluator)
                 except StopIteration:
                     exhausted.append(generator)
                     break
+            if profiler is not None:
+                entry = profiler.entry_for_generator(generator)
+                entry.time += perf_counter() - start
+                entry.calls += 1
         for generator in exhausted:
-            self.generators[cd].remove(generator)
+            generators.remove(generator)
+
+    def _process_generators(self, cd):
+        if cd in self.generators:
+            self._resume_generators(self.generators[cd], self.passive_generators,
+                                    self.parked_generators, self.evaluator)
 
     def _continue_simulation(self):
         for cd_generators in self.generators.values():
@@ -376,8 +921,25 @@ class Simulator:
                 return True
         return False
 
+    def _has_generators(self, cd):
+        return bool(self.generators.get(cd))
+
+    def _active_clocks(self):
+        # clocks that nothing observes need no edges: no synchronous logic,
+        # no generators, not read by the combinatorial logic, not traced
+        active = []
+        slots = self.evaluator.slots
+        for cd in self.time.clocks:
+            clk = self.fragment.clock_domains[cd].clk
+            if (self.sync_code.get(cd) or self._has_generators(cd)
+                    or slots.get(clk) in self.comb_readers
+                    or clk in getattr(self.vcd, "variables", ())):
+                active.append(cd)
+        return active
+
     def run(self):
-        self.evaluator.execute(self.fragment.comb)
+        self.time.set_active(self._active_clocks())
+        self._execute_comb()
         self._commit_and_comb_propagate()
 
         while True:
@@ -385,13 +947,14 @@ class Simulator:
             self.vcd.delay(dt)
             for cd in rising:
                 self.evaluator.assign(self.fragment.clock_domains[cd].clk, 1)
-                if cd in self.fragment.sync:
-                    self.evaluator.execute(self.fragment.sync[cd])
-                if cd in self.generators:
-                    self._process_generators(cd)
+                if cd in self.sync_functions:
+                    self._execute_sync(cd)
+                self._process_generators(cd)
             for cd in falling:
                 self.evaluator.assign(self.fragment.clock_domains[cd].clk, 0)
             self._commit_and_comb_propagate()
+            if self.trace_window is not None:
+                self._update_trace()
 
             if not self._continue_simulation():
                 break
@@ -408,3 +971,115 @@ def passive(generator):
         yield "passive"
         yield from generator(*args, **kwargs)
     return wrapper
+
+
+class Wait:
+    """Simulator command waiting for ``cycles`` cycles
+
+    ``yield Wait(n)`` is equivalent to ``n`` bare ``yield`` statements,
+    without resuming the generator in between.
+    """
+    def __init__(self, cycles):
+        self.cycles = cycles
+
+    def park(self, evaluator):
+        if self.cycles > 0:
+            return _CycleWaiter(self.cycles)
+        return None
+
+
+class WaitUntil:
+    """Simulator command waiting until ``condition`` is true
+
+    ``yield WaitUntil(c)`` is equivalent to ``while not (yield c): yield``
+    and returns immediately if ``c`` is already true. While waiting, the
+    generator is not resumed and ``c`` is only evaluated again in cycles
+    where the signals it reads have changed.
+    """
+    def __init__(self, condition):
+        self.condition = wrap(condition)
+
+    def park(self, evaluator):
+        if evaluator.eval(self.condition):
+            return None
+        return _ConditionWaiter(self.condition, evaluator)
+
+
+class WaitEdge:
+    """Simulator command waiting for an edge of ``value``
+
+    ``edge`` is ``"rising"`` (the value becomes non-zero), ``"falling"``
+    (the value becomes zero) or ``"any"`` (the value changes). Values are
+    sampled once per cycle, like with ``yield value``, and the generator
+    is resumed in the first cycle where the edge is seen.
+    """
+    def __init__(self, value, edge="rising"):
+        if edge not in ("rising", "falling", "any"):
+            raise ValueError("Unknown edge: '{}'".format(edge))
+        self.value = wrap(value)
+        self.edge = edge
+
+    def park(self, evaluator):
+        return _EdgeWaiter(self.value, self.edge, evaluator)
+
+
+class _CycleWaiter:
+    def __init__(self, cycles):
+        self.cycles = cycles
+
+    def ready(self, evaluator):
+        self.cycles -= 1
+        return not self.cycles
+
+
+class _Watch:
+    # signals read by an expression, and their values when last checked
+    def __init__(self, expression, evaluator):
+        lister = _InputLister(evaluator.clock_domains)
+        lister.visit(expression)
+        signals = sorted(lister.output_list, key=lambda s: s.duid)
+        evaluator.allocate(signals)
+        self.slots = [evaluator.slot(signal) for signal in signals]
+        # memory contents are not tracked, always evaluate the expression
+        self.volatile = bool(lister.memory_list)
+        self.values = self._values(evaluator)
+
+    def _values(self, evaluator):
+        values = evaluator.values
+        return [values[slot] for slot in self.slots]
+
+    def changed(self, evaluator):
+        values = self._values(evaluator)
+        if values == self.values:
+            return self.volatile
+        self.values = values
+        return True
+
+
+class _ConditionWaiter:
+    def __init__(self, condition, evaluator):
+        self.condition = condition
+        self.watch = _Watch(condition, evaluator)
+
+    def ready(self, evaluator):
+        return self.watch.changed(evaluator) and bool(evaluator.eval(self.condition))
+
+
+class _EdgeWaiter:
+    def __init__(self, value, edge, evaluator):
+        self.value = value
+        self.edge = edge
+        self.watch = _Watch(value, evaluator)
+        self.previous = evaluator.eval(value)
+
+    def ready(self, evaluator):
+        if not self.watch.changed(evaluator):
+            return False
+        previous = self.previous
+        value = self.previous = evaluator.eval(self.value)
+        if self.edge == "rising":
+            return not previous and bool(value)
+        elif self.edge == "falling":
+            return bool(previous) and not value
+        else:
+            return value != previous
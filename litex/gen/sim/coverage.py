@@ -0,0 +1,240 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import json
+import collections
+import collections.abc
+
+from migen.fhdl.structure import *
+from migen.fhdl.structure import _Statement
+from migen.fhdl.module import Module
+from migen.genlib.fsm import FSM
+
+from litex.gen.fhdl.profiler import dump_report
+from litex.gen.sim.hierarchy import ModuleHierarchy, iter_modules
+from litex.gen.sim.sensitivity import list_inputs
+
+
+class CoverPoint(_Statement):
+    """Statement counting its executions in ``hits[index]``"""
+    def __init__(self, hits, index):
+        self.hits = hits
+        self.index = index
+
+
+class _FSMCoverage:
+    __slots__ = ("name", "decoding", "state", "states", "transitions")
+
+    def __init__(self, name, fsm):
+        self.name = name
+        self.decoding = fsm.decoding
+        self.state = None
+        self.states = collections.OrderedDict((s, 0) for s in fsm.actions.keys())
+        self.transitions = collections.Counter()
+
+    def visit(self, state):
+        name = self.decoding.get(state, str(state))
+        if self.state is not None:
+            self.transitions[self.state + "->" + name] += 1
+        self.states[name] = self.states.get(name, 0) + 1
+        self.state = name
+
+
+def _popcount(x):
+    return bin(x).count("1")
+
+
+class SimCoverage:
+    """Collects toggle, ``Case`` branch and FSM coverage of a simulation
+
+    ``instrument`` adds a ``CoverPoint`` to each branch of the ``Case``
+    statements (and a ``none`` branch to the ones without default).
+    ``attach`` selects the signals whose bits are tracked for 0->1 and
+    1->0 toggles, and the state signals of the FSMs of ``top``; ``update``
+    is then given the slots changed by each propagation. Points are named
+    after the module hierarchy of ``top``, so that reports of simulations
+    of the same design can be combined with ``merge_coverage``.
+    """
+    def __init__(self, top=None):
+        self.top = top
+        self.hierarchy = ModuleHierarchy(top)
+        self.hits = []
+        self.points = []
+        self.case_names = collections.Counter()
+        self.toggle_names = []
+        self.masks = []
+        self.last = []
+        self.rose = []
+        self.fell = []
+        self.fsms = dict()
+        self.clock_domains = None
+
+    # Case branches
+
+    def _case_name(self, case):
+        signals = sorted(list_inputs(case.test, self.clock_domains), key=lambda s: s.duid)
+        module = self.hierarchy.module_path(signals[0]) if signals else "top"
+        n = self.case_names[module]
+        self.case_names[module] += 1
+        return "{}:case{}".format(module, n)
+
+    def _point(self, case, branch):
+        self.points.append((case, branch))
+        self.hits.append(0)
+        return CoverPoint(self.hits, len(self.hits) - 1)
+
+    def instrument(self, statements, clock_domains):
+        """Returns ``statements`` with cover points in the ``Case`` branches"""
+        self.clock_domains = clock_domains
+        r = []
+        for s in statements:
+            if isinstance(s, If):
+                instrumented = If(s.cond)
+                instrumented.t = self.instrument(s.t, clock_domains)
+                instrumented.f = self.instrument(s.f, clock_domains)
+                r.append(instrumented)
+            elif isinstance(s, Case):
+                name = self._case_name(s)
+                cases = collections.OrderedDict()
+                for k, v in s.cases.items():
+                    branch = "default" if isinstance(k, str) else str(k.value)
+                    cases[k] = [self._point(name, branch)] + self.instrument(v, clock_domains)
+                if "default" not in cases:
+                    cases["default"] = [self._point(name, "none")]
+                r.append(Case(s.test, cases))
+            elif isinstance(s, collections.abc.Iterable):
+                r.append(self.instrument(s, clock_domains))
+            else:
+                r.append(s)
+        return r
+
+    # toggles and FSMs
+
+    def attach(self, evaluator, signals):
+        names = collections.Counter()
+        for signal in signals:
+            slot = evaluator.slot(signal)
+            name = self.hierarchy.signal_path(signal)
+            names[name] += 1
+            if names[name] > 1:
+                name += "#{}".format(names[name])
+            while len(self.toggle_names) <= slot:
+                self.toggle_names.append(None)
+                self.masks.append(0)
+                self.last.append(0)
+                self.rose.append(0)
+                self.fell.append(0)
+            self.toggle_names[slot] = name
+            self.masks[slot] = 2**len(signal) - 1
+            self.last[slot] = evaluator.values[slot] & self.masks[slot]
+        if isinstance(self.top, Module):
+            for name, module in iter_modules(self.top):
+                if isinstance(module, FSM) and hasattr(module, "state"):
+                    slot = evaluator.slots.get(module.state)
+                    if slot is not None:
+                        fsm = self.fsms[slot] = _FSMCoverage(name, module)
+                        fsm.visit(evaluator.values[slot])
+
+    def update(self, slots, values):
+        last = self.last
+        masks = self.masks
+        rose = self.rose
+        fell = self.fell
+        n = len(last)
+        fsms = self.fsms
+        for slot in slots:
+            if slot < n:
+                new = values[slot] & masks[slot]
+                old = last[slot]
+                changed = old ^ new
+                rose[slot] |= changed & new
+                fell[slot] |= changed & old
+                last[slot] = new
+                if slot in fsms:
+                    fsms[slot].visit(new)
+
+    # reports
+
+    def as_dict(self):
+        cases = collections.OrderedDict()
+        for (case, branch), hits in zip(self.points, self.hits):
+            cases.setdefault(case, collections.OrderedDict())[branch] = hits
+        return {
+            "toggle": collections.OrderedDict(
+                (name, {"width": mask.bit_length(), "rose": rose, "fell": fell})
+                for name, mask, rose, fell in zip(self.toggle_names, self.masks,
+                                                  self.rose, self.fell)
+                if name is not None),
+            "cases": cases,
+            "fsm": collections.OrderedDict(
+                (fsm.name, {"states": dict(fsm.states), "transitions": dict(fsm.transitions)})
+                for fsm in self.fsms.values()),
+        }
+
+    def report(self):
+        return coverage_report(self.as_dict())
+
+    def dump(self, filename=None):
+        """Writes the report to ``filename`` (JSON if it ends with ``.json``)"""
+        dump_coverage(self.as_dict(), filename)
+
+
+def merge_coverage(*reports):
+    """Combines coverage reports (dicts, or names of JSON files)
+
+    Toggles are ORed, and branch, state and transition counts summed.
+    """
+    r = {"toggle": collections.OrderedDict(), "cases": collections.OrderedDict(),
+         "fsm": collections.OrderedDict()}
+    for report in reports:
+        if isinstance(report, str):
+            with open(report) as f:
+                report = json.load(f)
+        for name, toggle in report["toggle"].items():
+            merged = r["toggle"].setdefault(name, {"width": toggle["width"], "rose": 0, "fell": 0})
+            merged["rose"] |= toggle["rose"]
+            merged["fell"] |= toggle["fell"]
+        for name, branches in report["cases"].items():
+            merged = r["cases"].setdefault(name, collections.OrderedDict())
+            for branch, hits in branches.items():
+                merged[branch] = merged.get(branch, 0) + hits
+        for name, fsm in report["fsm"].items():
+            merged = r["fsm"].setdefault(name, {"states": dict(), "transitions": dict()})
+            for kind in ("states", "transitions"):
+                for k, hits in fsm[kind].items():
+                    merged[kind][k] = merged[kind].get(k, 0) + hits
+    return r
+
+
+def coverage_report(coverage):
+    """Returns a text summary of a coverage report"""
+    toggles = coverage["toggle"].values()
+    toggled = sum(_popcount(t["rose"]) + _popcount(t["fell"]) for t in toggles)
+    total = 2*sum(t["width"] for t in toggles)
+    branches = [hits for case in coverage["cases"].values() for hits in case.values()]
+    r = "Simulation coverage\n"
+    r += "===================\n\n"
+    r += "toggles:  {:6.1f}% ({}/{} bit transitions)\n".format(
+        100*toggled/max(total, 1), toggled, total)
+    r += "branches: {:6.1f}% ({}/{} Case branches)\n".format(
+        100*sum(1 for h in branches if h)/max(len(branches), 1),
+        sum(1 for h in branches if h), len(branches))
+    for name, fsm in coverage["fsm"].items():
+        states = fsm["states"]
+        r += "fsm {}: {}/{} states, {} transitions\n".format(name,
+            sum(1 for h in states.values() if h), len(states), len(fsm["transitions"]))
+        for state, hits in states.items():
+            if not hits:
+                r += "    unvisited state {}\n".format(state)
+    uncovered = [(name, branch) for name, case in coverage["cases"].items()
+                 for branch, hits in case.items() if not hits and branch != "none"]
+    if uncovered:
+        r += "\nUncovered Case branches:\n"
+        for name, branch in uncovered:
+            r += "    {} {}\n".format(name, branch)
+    return r
+
+
+def dump_coverage(coverage, filename=None):
+    """Writes a coverage report to ``filename`` (JSON if it ends with ``.json``)"""
+    dump_report(coverage, coverage_report(coverage), filename)
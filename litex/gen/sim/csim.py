@@ -0,0 +1,769 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import os
+import hashlib
+import subprocess
+import collections.abc
+import ctypes
+from ctypes import POINTER, c_int64, c_int32, c_uint8
+
+from migen.fhdl.structure import *
+from migen.fhdl.structure import _Operator, _Slice, _ArrayProxy, _Assign
+from migen.fhdl.bitcontainer import value_bits_sign
+from migen.fhdl.tools import list_targets
+from migen.fhdl.specials import WRITE_FIRST, NO_CHANGE, _MemoryLocation
+
+from litex.gen.sim.core import Evaluator, Simulator
+from litex.gen.sim.compiler import (_mask, _max_expr_depth, _CompiledFunction,
+                                    expression_width)
+from litex.gen.sim.memory import SimMemory, SimMemoryPort
+from litex.gen.sim.vcd import DummyVCDWriter
+
+
+# Values are held in int64_t: signals and intermediate results must fit
+# without overflow for the C code to match Python integers.
+_max_width = 63
+
+_binary_ops = {
+    "+": "+",
+    "-": "-",
+    "*": "*",
+
+    "&": "&",
+    "^": "^",
+    "|": "|",
+
+    "<": "<",
+    "<=": "<=",
+    "==": "==",
+    "!=": "!=",
+    ">": ">",
+    ">=": ">=",
+}
+
+
+def _const(value):
+    return "INT64_C({})".format(value)
+
+
+def _table(values):
+    # C does not allow empty initializers, terminate tables with -1
+    return "{" + ", ".join(str(v) for v in list(values) + [-1]) + "}"
+
+
+def _csr(lists):
+    # compressed sparse rows: start offsets and concatenated lists
+    start = [0]
+    entries = []
+    for l in lists:
+        entries += l
+        start.append(len(entries))
+    return start, entries
+
+
+_header = """\
+#include <stdint.h>
+#include <stddef.h>
+
+typedef struct {
+    int64_t *v;
+    int64_t *n;
+    int64_t **mem;
+    int64_t **queue;
+    int32_t *nqueued;
+    uint8_t *dirty;
+    int32_t lowest;
+    uint8_t *synced;
+    uint8_t *seen;
+    int32_t *changed;
+    int32_t nchanged;
+} sim_t;
+
+static inline int64_t shl(int64_t a, int64_t b) {
+    return b >= 64 ? 0 : (int64_t)((uint64_t)a << b);
+}
+
+static inline int64_t shr(int64_t a, int64_t b) {
+    return b >= 63 ? (a < 0 ? -1 : 0) : a >> b;
+}
+
+static inline int64_t array_index(int64_t key, int64_t n) {
+    if (key > n - 1)
+        key = n - 1;
+    if (key < 0)
+        key += n;
+    return key;
+}
+"""
+
+_memory_access = """\
+static int64_t mem_read(sim_t *s, int32_t m, int64_t address, int postcommit) {
+    int32_t i;
+    address = address < memory_depth[m] - 1 ? address : memory_depth[m] - 1;
+    if (postcommit)
+        for (i = s->nqueued[m] - 1; i >= 0; i--)
+            if (s->queue[m][2*i] == address)
+                return s->queue[m][2*i + 1];
+    return s->mem[m][address];
+}
+
+static void mem_write(sim_t *s, int32_t m, int64_t address, int64_t value) {
+    int32_t i = s->nqueued[m]++;
+    address = address < memory_depth[m] - 1 ? address : memory_depth[m] - 1;
+    s->queue[m][2*i] = address;
+    s->queue[m][2*i + 1] = value & memory_mask[m];
+}
+
+"""
+
+_engine = """\
+static void mark(sim_t *s, int32_t unit) {
+    if (!s->dirty[unit]) {
+        s->dirty[unit] = 1;
+        if (unit < s->lowest)
+            s->lowest = unit;
+    }
+}
+
+static void commit_slot(sim_t *s, int32_t slot, int wake_driver) {
+    int32_t i;
+    if (s->n[slot] == s->v[slot])
+        return;
+    s->v[slot] = s->n[slot];
+    if (!s->seen[slot]) {
+        s->seen[slot] = 1;
+        s->changed[s->nchanged++] = slot;
+    }
+    for (i = reader_start[slot]; i < reader_start[slot + 1]; i++)
+        mark(s, readers[i]);
+    if (wake_driver && driver[slot] >= 0)
+        mark(s, driver[slot]);
+}
+
+void sim_memory_changed(sim_t *s, int32_t m) {
+    int32_t i;
+    for (i = memory_reader_start[m]; i < memory_reader_start[m + 1]; i++)
+        mark(s, memory_readers[i]);
+}
+
+void sim_commit_memories(sim_t *s) {
+    int32_t m, i, changed;
+    for (m = 0; m < NMEMORIES; m++) {
+        changed = 0;
+        for (i = 0; i < s->nqueued[m]; i++) {
+            int64_t address = s->queue[m][2*i];
+            if (s->mem[m][address] != s->queue[m][2*i + 1]) {
+                s->mem[m][address] = s->queue[m][2*i + 1];
+                changed = 1;
+            }
+        }
+        s->nqueued[m] = 0;
+        if (changed)
+            sim_memory_changed(s, m);
+    }
+}
+
+void sim_mark_all(sim_t *s) {
+    int32_t u;
+    for (u = 0; u < NUNITS; u++)
+        s->dirty[u] = 1;
+    s->lowest = 0;
+}
+
+void sim_sync(sim_t *s, int32_t domain) {
+    sync_functions[domain](s);
+    s->synced[domain] = 1;
+}
+
+int32_t sim_settle(sim_t *s, const int32_t *pending, int32_t npending) {
+    int32_t i, d, u;
+    for (i = 0; i < s->nchanged; i++)
+        s->seen[s->changed[i]] = 0;
+    s->nchanged = 0;
+
+    /* signals modified outside of the combinatorial logic wake up their
+     * readers, and their driver so that it can override them */
+    sim_commit_memories(s);
+    for (d = 0; d < NDOMAINS; d++)
+        if (s->synced[d]) {
+            s->synced[d] = 0;
+            for (i = sync_target_start[d]; i < sync_target_start[d + 1]; i++)
+                commit_slot(s, sync_targets[i], 1);
+        }
+    for (i = 0; i < npending; i++)
+        commit_slot(s, pending[i], 1);
+
+    /* units are ranked in dependency order, run them lowest rank first */
+    while (s->lowest < NUNITS) {
+        u = s->lowest;
+        while (u < NUNITS && !s->dirty[u])
+            u++;
+        if (u == NUNITS)
+            break;
+        s->dirty[u] = 0;
+        s->lowest = u + 1;
+        units[u](s);
+        for (i = unit_target_start[u]; i < unit_target_start[u + 1]; i++)
+            commit_slot(s, unit_targets[i], 0);
+    }
+    s->lowest = NUNITS;
+    return s->nchanged;
+}
+"""
+
+
+class CCompiler:
+    """Compiles lists of statements into C functions
+
+    The generated functions take a ``sim_t`` holding the ``values`` and
+    ``next_values`` of the signals in int64_t arrays indexed by the slots
+    of ``evaluator``, with the same semantics as the functions produced by
+    ``Compiler``. Signals and intermediate results must fit in 63 bits.
+    Memories are identified by their index in ``memory_index``.
+    """
+    def __init__(self, evaluator, memory_index):
+        self.evaluator = evaluator
+        self.memory_index = memory_index
+        self.tables = []
+        self.functions = []
+
+    def _slot(self, signal):
+        if signal.variable:
+            raise NotImplementedError("C simulation does not support variables")
+        return str(self.evaluator.slot(signal))
+
+    def _slot_table(self, signals):
+        name = "slots{}".format(len(self.tables))
+        slots = [self._slot(s) for s in signals]
+        self.tables.append("static const int32_t {}[] = {};".format(name, _table(slots)))
+        return name
+
+    # expressions
+
+    def _spill(self, f, indent, code):
+        t = f.temp()
+        f.lines.append(indent + "int64_t {} = {};".format(t, code))
+        return t
+
+    def _expr(self, f, indent, node, postcommit=False):
+        if expression_width(node) > _max_width:
+            raise NotImplementedError("C simulation does not support expressions"
+                                      " wider than {} bits".format(_max_width))
+        code, depth = self._expr_depth(f, indent, node, postcommit)
+        return code
+
+    def _sub(self, f, indent, node, postcommit):
+        code, depth = self._expr_depth(f, indent, node, postcommit)
+        if depth > _max_expr_depth:
+            return self._spill(f, indent, code), 0
+        return code, depth
+
+    def _expr_depth(self, f, indent, node, postcommit):
+        if isinstance(node, Constant):
+            return _const(node.value), 0
+        elif isinstance(node, Signal):
+            return "{}[{}]".format("n" if postcommit else "v", self._slot(node)), 0
+        elif isinstance(node, _Operator):
+            operands = [self._sub(f, indent, o, postcommit) for o in node.operands]
+            depth = max(d for c, d in operands) + 1
+            codes = [c for c, d in operands]
+            if node.op == "-" and len(codes) == 1:
+                return "(-{})".format(codes[0]), depth
+            elif node.op == "~":
+                return "(~{})".format(codes[0]), depth
+            elif node.op == "m":
+                return "({} ? {} : {})".format(*codes), depth
+            elif node.op == "<<<":
+                return "shl({}, {})".format(*codes), depth
+            elif node.op == ">>>":
+                return "shr({}, {})".format(*codes), depth
+            elif node.op in _binary_ops and len(codes) == 2:
+                return "({} {} {})".format(codes[0], _binary_ops[node.op], codes[1]), depth
+        elif isinstance(node, _Slice):
+            code, depth = self._sub(f, indent, node.value, postcommit)
+            mask = _const(_mask(node.stop - node.start))
+            if node.start:
+                return "(({} >> {}) & {})".format(code, node.start, mask), depth + 1
+            else:
+                return "({} & {})".format(code, mask), depth + 1
+        elif isinstance(node, Cat):
+            shift = 0
+            terms = []
+            depth = 0
+            for element in node.l:
+                nbits = len(element)
+                code, d = self._sub(f, indent, element, postcommit)
+                depth = max(depth, d)
+                if shift:
+                    terms.append("(({} & {}) << {})".format(code, _const(_mask(nbits)), shift))
+                else:
+                    terms.append("({} & {})".format(code, _const(_mask(nbits))))
+                shift += nbits
+            if not terms:
+                return _const(0), 0
+            return "(" + " | ".join(terms) + ")", depth + 1
+        elif isinstance(node, Replicate):
+            nbits = len(node.v)
+            code, depth = self._sub(f, indent, node.v, postcommit)
+            factor = sum(1 << i*nbits for i in range(node.n))
+            return "(({} & {}) * {})".format(code, _const(_mask(nbits)), _const(factor)), depth + 1
+        elif isinstance(node, _ArrayProxy):
+            key, depth = self._sub(f, indent, node.key, postcommit)
+            index = "array_index({}, {})".format(key, len(node.choices))
+            if all(isinstance(c, Signal) for c in node.choices):
+                table = self._slot_table(node.choices)
+                return "{}[{}[{}]]".format("n" if postcommit else "v", table, index), depth + 1
+            else:
+                choices = [self._expr(f, indent, c, postcommit) for c in node.choices]
+                t = f.temp()
+                f.lines.append(indent + "const int64_t {}[] = {{{}}};".format(t, ", ".join(choices)))
+                return "{}[{}]".format(t, index), depth + 1
+        elif isinstance(node, _MemoryLocation):
+            index, depth = self._sub(f, indent, node.index, postcommit)
+            return "mem_read(s, {}, {}, {})".format(self.memory_index[node.memory],
+                index, int(postcommit)), depth + 1
+        elif isinstance(node, ClockSignal):
+            cd = self.evaluator.clock_domains[node.cd]
+            return self._expr_depth(f, indent, cd.clk, postcommit)
+        elif isinstance(node, ResetSignal):
+            rst = self.evaluator.clock_domains[node.cd].rst
+            if rst is None:
+                if node.allow_reset_less:
+                    return _const(0), 0
+                raise ValueError("Attempted to get reset signal of resetless"
+                                 " domain '{}'".format(node.cd))
+            return self._expr_depth(f, indent, rst, postcommit)
+        raise NotImplementedError("C simulation does not support {}".format(node))
+
+    # statements
+
+    def _truncate(self, code, nbits, signed):
+        if signed and nbits:
+            sign = _const(1 << (nbits - 1))
+            return "((({} & {}) ^ {}) - {})".format(code, _const(_mask(nbits)), sign, sign)
+        else:
+            return "({} & {})".format(code, _const(_mask(nbits)))
+
+    def _assign(self, f, indent, node, value):
+        if isinstance(node, Signal):
+            slot = self._slot(node)
+            f.lines.append(indent + "n[{}] = {};".format(slot,
+                self._truncate(value, node.nbits, node.signed)))
+        elif isinstance(node, Cat):
+            value = self._spill(f, indent, value)
+            shift = 0
+            for element in node.l:
+                if shift:
+                    self._assign(f, indent, element, "({} >> {})".format(value, shift))
+                else:
+                    self._assign(f, indent, element, value)
+                shift += len(element)
+        elif isinstance(node, _Slice):
+            full_value = self._expr(f, indent, node.value, True)
+            clear = _const(_mask(node.stop) - _mask(node.start))
+            value = "(({} & ~{}) | (({} & {}) << {}))".format(
+                full_value, clear, value, _const(_mask(node.stop - node.start)), node.start)
+            self._assign(f, indent, node.value, self._spill(f, indent, value))
+        elif isinstance(node, _ArrayProxy):
+            n = len(node.choices)
+            key = self._expr(f, indent, node.key)
+            index = self._spill(f, indent, "array_index({}, {})".format(key, n))
+            signals = all(isinstance(c, Signal) for c in node.choices)
+            if signals and len(set((c.nbits, c.signed) for c in node.choices)) == 1:
+                table = self._slot_table(node.choices)
+                f.lines.append(indent + "n[{}[{}]] = {};".format(table, index,
+                    self._truncate(value, node.choices[0].nbits, node.choices[0].signed)))
+            else:
+                value = self._spill(f, indent, value)
+                f.lines.append(indent + "switch ({}) {{".format(index))
+                for i, choice in enumerate(node.choices):
+                    f.lines.append(indent + "case {}: {{".format(i))
+                    self._assign(f, indent + "    ", choice, value)
+                    f.lines.append(indent + "    break;")
+                    f.lines.append(indent + "}")
+                f.lines.append(indent + "}")
+        else:
+            raise NotImplementedError("C simulation cannot assign to {}".format(node))
+
+    def _if(self, f, indent, s):
+        f.lines.append(indent + "if ({} & {}) {{".format(self._expr(f, indent, s.cond),
+                                                         _const(_mask(len(s.cond)))))
+        self._statements(f, indent + "    ", s.t)
+        if s.f:
+            f.lines.append(indent + "} else {")
+            self._statements(f, indent + "    ", s.f)
+        f.lines.append(indent + "}")
+
+    def _case(self, f, indent, s):
+        nbits, signed = value_bits_sign(s.test)
+        test = self._spill(f, indent, self._truncate(self._expr(f, indent, s.test), nbits, signed))
+        f.lines.append(indent + "switch ({}) {{".format(test))
+        values = set()
+        for k, v in s.cases.items():
+            # the first matching case is taken, skip duplicates
+            if isinstance(k, Constant) and k.value not in values:
+                values.add(k.value)
+                f.lines.append(indent + "case {}: {{".format(_const(k.value)))
+                self._statements(f, indent + "    ", v)
+                f.lines.append(indent + "    break;")
+                f.lines.append(indent + "}")
+        if "default" in s.cases:
+            f.lines.append(indent + "default: {")
+            self._statements(f, indent + "    ", s.cases["default"])
+            f.lines.append(indent + "    break;")
+            f.lines.append(indent + "}")
+        f.lines.append(indent + "}")
+
+    def _statements(self, f, indent, statements):
+        for s in statements:
+            if isinstance(s, _Assign):
+                self._assign(f, indent, s.l, self._expr(f, indent, s.r))
+            elif isinstance(s, If):
+                self._if(f, indent, s)
+            elif isinstance(s, Case):
+                self._case(f, indent, s)
+            elif isinstance(s, collections.abc.Iterable):
+                self._statements(f, indent, s)
+            else:
+                raise NotImplementedError("C simulation does not support {}".format(s))
+
+    def _port_comb(self, f, port, index):
+        f.lines.append("    n[{}] = mem_read(s, {}, v[{}], 0);".format(
+            port.dat_r, index, port.async_adr_slot))
+
+    def _port_sync(self, f, port, index):
+        mode = port.port.mode
+        if not port.port.async_read:
+            cond = "1" if port.re is None else "v[{}] & {}".format(port.re, _const(port.re_mask))
+            if mode == WRITE_FIRST:
+                read = "n[{}] = v[{}];".format(port.async_adr_slot, port.adr)
+            else:
+                read = "n[{}] = mem_read(s, {}, v[{}], 0);".format(port.dat_r, index, port.adr)
+                if mode == NO_CHANGE and port.we is not None:
+                    cond = "({}) && (~v[{}] & {})".format(cond, port.we, _const(port.we_mask))
+            f.lines.append("    if ({}) {{".format(cond))
+            f.lines.append("        " + read)
+            f.lines.append("    }")
+        if port.we is not None:
+            granularity = port.port.we_granularity
+            if granularity:
+                f.lines.append("    {")
+                f.lines.append("        int64_t word = mem_read(s, {}, v[{}], 1);".format(
+                    index, port.adr))
+                f.lines.append("        int written = 0;")
+                for i in range(port.memory.width//granularity):
+                    mask = _const(_mask(granularity) << i*granularity)
+                    f.lines.append("        if (v[{}] & {}) {{".format(port.we, _const(1 << i)))
+                    f.lines.append("            word = (word & ~{0}) | (v[{1}] & {0});".format(
+                        mask, port.dat_w))
+                    f.lines.append("            written = 1;")
+                    f.lines.append("        }")
+                f.lines.append("        if (written)")
+                f.lines.append("            mem_write(s, {}, v[{}], word);".format(index, port.adr))
+                f.lines.append("    }")
+            else:
+                f.lines.append("    if (v[{}] & {})".format(port.we, _const(port.we_mask)))
+                f.lines.append("        mem_write(s, {}, v[{}], v[{}]);".format(
+                    index, port.adr, port.dat_w))
+
+    def function(self, name, statements=(), ports=(), comb_port=None):
+        """Returns the source of ``void name(sim_t *s)`` executing ``statements``
+
+        ``ports`` is a list of ``(SimMemoryPort, memory index)`` whose
+        synchronous logic is appended, ``comb_port`` one whose asynchronous
+        read is executed instead of the statements.
+        """
+        f = _CompiledFunction(name)
+        self._statements(f, "    ", statements)
+        if comb_port is not None:
+            self._port_comb(f, *comb_port)
+        for port, index in ports:
+            self._port_sync(f, port, index)
+        return ("static void {}(sim_t *s) {{\n".format(name) +
+                "    int64_t *v = s->v;\n" +
+                "    int64_t *n = s->n;\n" +
+                "    (void)v; (void)n;\n" +
+                "\n".join(f.lines) + "\n}\n")
+
+
+def build(source, cc=None, cflags=("-O2",), cache_dir=None):
+    """Builds ``source`` into a shared library and loads it
+
+    Libraries are cached in ``cache_dir`` (``$LITEX_SIM_CACHE``, or
+    ``~/.cache/litex/sim`` by default) under a hash of the source and of
+    the compiler options, so that a design is only built once.
+    """
+    cc = cc or os.environ.get("CC", "cc")
+    cflags = list(cflags)
+    if cache_dir is None:
+        cache_dir = os.environ.get("LITEX_SIM_CACHE",
+            os.path.join(os.path.expanduser("~"), ".cache", "litex", "sim"))
+    os.makedirs(cache_dir, exist_ok=True)
+    key = hashlib.sha256("\n".join([cc] + cflags + [source]).encode()).hexdigest()[:24]
+    library = os.path.join(cache_dir, "sim_{}.so".format(key))
+    if not os.path.exists(library):
+        c_file = os.path.join(cache_dir, "sim_{}.c".format(key))
+        with open(c_file, "w") as f:
+            f.write(source)
+        tmp = "{}.{}.tmp".format(library, os.getpid())
+        subprocess.check_call([cc] + cflags + ["-shared", "-fPIC", "-o", tmp, c_file])
+        os.replace(tmp, library)
+    return ctypes.CDLL(library)
+
+
+class _State(ctypes.Structure):
+    _fields_ = [
+        ("v",        POINTER(c_int64)),
+        ("n",        POINTER(c_int64)),
+        ("mem",      POINTER(POINTER(c_int64))),
+        ("queue",    POINTER(POINTER(c_int64))),
+        ("nqueued",  POINTER(c_int32)),
+        ("dirty",    POINTER(c_uint8)),
+        ("lowest",   c_int32),
+        ("synced",   POINTER(c_uint8)),
+        ("seen",     POINTER(c_uint8)),
+        ("changed",  POINTER(c_int32)),
+        ("nchanged", c_int32),
+    ]
+
+
+class _SlotValues:
+    """List of values, the first ``len(array)`` being held in ``array``"""
+    def __init__(self, array, extra):
+        self.array = array
+        self.size = len(array)
+        self.extra = extra
+
+    def __len__(self):
+        return self.size + len(self.extra)
+
+    def __getitem__(self, slot):
+        if slot < self.size:
+            return self.array[slot]
+        return self.extra[slot - self.size]
+
+    def __setitem__(self, slot, value):
+        if slot < self.size:
+            self.array[slot] = value
+        else:
+            self.extra[slot - self.size] = value
+
+    def append(self, value):
+        self.extra.append(value)
+
+
+class CMemory(SimMemory):
+    """``SimMemory`` with its contents held in a ``ctypes`` array"""
+    def __init__(self, memory, modified):
+        SimMemory.__init__(self, memory, modified)
+        if memory.width > _max_width:
+            raise NotImplementedError("C simulation does not support memories"
+                                      " wider than {} bits".format(_max_width))
+        self.data = (c_int64*memory.depth)(*self.data)
+
+
+class CEvaluator(Evaluator):
+    """Evaluator whose design signals are held by the shared library
+
+    Signals are allocated in Python lists until ``attach`` moves the ones
+    allocated so far, which are the ones of the design, into ``ctypes``
+    arrays shared with the C code. Signals allocated afterwards (only used
+    by generators) remain in the lists.
+    """
+    def __init__(self, clock_domains, memories):
+        Evaluator.__init__(self, clock_domains, [])
+        self.memories = {memory: CMemory(memory, self.modified_memories)
+                         for memory in memories}
+
+    def attach(self):
+        for signal in self.signals:
+            if signal.nbits > _max_width:
+                raise NotImplementedError("C simulation does not support signals wider"
+                                          " than {} bits ({})".format(_max_width, signal))
+        n = len(self.signals)
+        self.values = _SlotValues((c_int64*max(n, 1))(*self.values), [])
+        self.next_values = _SlotValues((c_int64*max(n, 1))(*self.next_values), [])
+        self.values.size = self.next_values.size = n
+
+
+class CSimulator(Simulator):
+    """Simulates a design compiled to C
+
+    The combinatorial and synchronous logic and the memories of the design
+    are compiled into a shared library (see ``build``), while generators
+    keep running in Python and access the signals held by the library
+    through ``ctypes``. Signals and intermediate results must fit in 63
+    bits, and ``Display`` statements are not supported. Snapshots and
+    profiling are not supported.
+    """
+    _cacheable = False
+
+    def __init__(self, fragment_or_module, generators, *args, cc=None, cflags=("-O2",),
+                 cache_dir=None, **kwargs):
+        if kwargs.get("profile"):
+            raise ValueError("Profiling is not supported by the C simulator")
+        if kwargs.get("coverage"):
+            raise ValueError("Coverage is not supported by the C simulator")
+        self.lib = None
+        Simulator.__init__(self, fragment_or_module, generators, *args, **kwargs)
+
+        ev = self.evaluator
+        memories = list(ev.memories.keys())
+        memory_index = self.memory_index = {memory: i for i, memory in enumerate(memories)}
+        compiler = CCompiler(ev, memory_index)
+        units = self.sensitivity.units
+        functions = []
+        unit_targets = []
+        for rank, unit in enumerate(units):
+            name = "unit_{}".format(rank)
+            if isinstance(unit, SimMemoryPort):
+                functions.append(compiler.function(name,
+                    comb_port=(unit, memory_index[unit.memory])))
+                targets = unit.targets
+            else:
+                functions.append(compiler.function(name, unit))
+                targets = list_targets(unit)
+            unit_targets.append(sorted(ev.slot(t) for t in targets))
+
+        self.domains = sorted(set(self.fragment.sync.keys()) |
+                              {port.cd for port in self.memory_ports})
+        sync_targets = []
+        for d, cd in enumerate(self.domains):
+            statements = self.fragment.sync.get(cd, [])
+            ports = [(port, memory_index[port.memory]) for port in self.memory_ports
+                     if port.cd == cd]
+            functions.append(compiler.function("sync_{}".format(d), statements, ports))
+            targets = set(ev.slot(t) for t in list_targets(statements))
+            for port, index in ports:
+                if not port.port.async_read:
+                    targets.add(port.async_adr_slot if port.port.mode == WRITE_FIRST else port.dat_r)
+            sync_targets.append(sorted(targets))
+
+        nslots = len(ev.signals)
+        reader_start, readers = _csr([list(self.comb_readers.get(slot, ()))
+                                      for slot in range(nslots)])
+        unit_target_start, unit_targets = _csr(unit_targets)
+        sync_target_start, sync_targets = _csr(sync_targets)
+        memory_reader_start, memory_readers = _csr([self.memory_readers.get(memory, [])
+                                                    for memory in memories])
+        driver = [self.comb_drivers.get(slot, -1) for slot in range(nslots)]
+        source = _header
+        source += "#define NUNITS {}\n".format(len(units))
+        source += "#define NDOMAINS {}\n".format(len(self.domains))
+        source += "#define NMEMORIES {}\n".format(len(memories))
+        for name, table in [("reader_start", reader_start), ("readers", readers),
+                            ("driver", driver),
+                            ("unit_target_start", unit_target_start), ("unit_targets", unit_targets),
+                            ("sync_target_start", sync_target_start), ("sync_targets", sync_targets),
+                            ("memory_reader_start", memory_reader_start),
+                            ("memory_readers", memory_readers)]:
+            source += "static const int32_t {}[] = {};\n".format(name, _table(table))
+        source += "static const int64_t memory_depth[] = {};\n".format(
+            _table(memory.depth for memory in memories))
+        source += "static const int64_t memory_mask[] = {};\n".format(
+            _table(_mask(memory.width) for memory in memories))
+        source += "\n".join(compiler.tables) + "\n\n"
+        source += _memory_access
+        source += "\n".join(functions) + "\n"
+        source += "static void (*const units[])(sim_t *) = {{{}}};\n".format(
+            "".join("unit_{}, ".format(rank) for rank in range(len(units))) + "NULL")
+        source += "static void (*const sync_functions[])(sim_t *) = {{{}}};\n\n".format(
+            "".join("sync_{}, ".format(d) for d in range(len(self.domains))) + "NULL")
+        source += _engine
+        self.source = source
+        self.lib = build(source, cc, cflags, cache_dir)
+
+        # share the signals and memories with the library
+        ev.attach()
+        self.nslots = nslots
+        queues = [(c_int64*(2*max(1, len([p for p in memory.ports if p.we is not None]))))()
+                  for memory in memories]
+        self.buffers = dict(
+            mem=(POINTER(c_int64)*max(1, len(memories)))(
+                *[ctypes.cast(ev.memories[memory].data, POINTER(c_int64)) for memory in memories]),
+            queue=(POINTER(c_int64)*max(1, len(memories)))(
+                *[ctypes.cast(queue, POINTER(c_int64)) for queue in queues]),
+            queues=queues,
+            nqueued=(c_int32*max(1, len(memories)))(),
+            dirty=(c_uint8*max(1, len(units)))(),
+            synced=(c_uint8*max(1, len(self.domains)))(),
+            seen=(c_uint8*max(1, nslots))(),
+            changed=(c_int32*max(1, nslots))(),
+        )
+        b = self.buffers
+        self.state = _State(
+            v=ctypes.cast(ev.values.array, POINTER(c_int64)),
+            n=ctypes.cast(ev.next_values.array, POINTER(c_int64)),
+            mem=b["mem"], queue=b["queue"], nqueued=b["nqueued"],
+            dirty=b["dirty"], lowest=len(units), synced=b["synced"],
+            seen=b["seen"], changed=b["changed"], nchanged=0)
+        self.state_ref = ctypes.byref(self.state)
+        self.lib.sim_settle.restype = c_int32
+        self._bind()
+
+    def _new_evaluator(self, memories):
+        return CEvaluator(self.fragment.clock_domains, memories)
+
+    def _new_executor(self):
+        # the statements are compiled to C once all of them are known
+        return lambda statements: None
+
+    def _bind(self):
+        self.comb_functions = []
+        self.sync_functions = dict()
+        if self.lib is not None:
+            self.domain_index = {cd: d for d, cd in enumerate(self.domains)}
+            self.sync_functions = {cd: [] for cd in self.domains}
+
+    def _execute_comb(self):
+        self.lib.sim_mark_all(self.state_ref)
+
+    def _execute_sync(self, cd):
+        self.lib.sim_sync(self.state_ref, self.domain_index[cd])
+
+    def _commit_and_comb_propagate(self):
+        ev = self.evaluator
+        lib = self.lib
+        state = self.state_ref
+        vcd = self.vcd
+        tracing = not isinstance(vcd, DummyVCDWriter)
+
+        if ev.modified_memories:
+            # writes of the memory ports first, then the ones of generators
+            lib.sim_commit_memories(state)
+            for sim_memory in ev.commit_memories():
+                lib.sim_memory_changed(state, self.memory_index[sim_memory.memory])
+
+        nslots = self.nslots
+        pending = [slot for slot in ev.pending if slot < nslots]
+        values = ev.values
+        next_values = ev.next_values
+        for slot in ev.pending:
+            if slot >= nslots and values[slot] != next_values[slot]:
+                values[slot] = next_values[slot]
+                if tracing:
+                    vcd.set(ev.signals[slot], values[slot])
+        ev.pending.clear()
+
+        nchanged = lib.sim_settle(state, (c_int32*len(pending))(*pending), len(pending))
+        if tracing:
+            changed = self.buffers["changed"]
+            signals = ev.signals
+            for i in range(nchanged):
+                slot = changed[i]
+                vcd.set(signals[slot], values[slot])
+
+    def snapshot(self):
+        raise NotImplementedError("Snapshots are not supported by the C simulator")
+
+    def restore(self, *args, **kwargs):
+        raise NotImplementedError("Snapshots are not supported by the C simulator")
+
+    def fork(self, *args, **kwargs):
+        raise NotImplementedError("Snapshots are not supported by the C simulator")
+
+
+def run_c_simulation(*args, **kwargs):
+    with CSimulator(*args, **kwargs) as s:
+        s.run()
@@ -0,0 +1,64 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+from migen.fhdl import tracer
+from migen.fhdl.module import Module
+
+
+def signal_name(signal):
+    if signal.name_override is not None:
+        return signal.name_override
+    return signal.backtrace[-1][0]
+
+
+def _module_key(module):
+    # the (class name, index) pair the tracer records in the backtraces of
+    # the signals created by the module
+    classname = module.__class__.__name__.lower()
+    try:
+        index = tracer.index_id(tracer.classname_to_objs[classname], module)
+    except (KeyError, ValueError):
+        return None
+    return (tracer.remove_underscore(classname), index)
+
+
+def iter_modules(module, name="top"):
+    """Yields the ``(hierarchical name, module)`` pairs of the hierarchy of ``module``"""
+    yield name, module
+    for submodule_name, submodule in module._submodules:
+        if submodule_name is None:
+            submodule_name = submodule.__class__.__name__.lower()
+        yield from iter_modules(submodule, name + "." + submodule_name)
+
+
+def _module_names(module, name):
+    return {_module_key(m): n for n, m in iter_modules(module, name)}
+
+
+class ModuleHierarchy:
+    """Names signals after the module hierarchy of ``top``
+
+    Modules are named after the attributes of their parents they were
+    added as (``submodules.name``), and are matched against the backtraces
+    of the signals to find the module that created each signal. Signals
+    not created by a module of the hierarchy (or if ``top`` is a fragment)
+    are attributed to ``top``.
+    """
+    def __init__(self, top=None):
+        if isinstance(top, Module):
+            self.module_names = _module_names(top, "top")
+            self.module_names.pop(None, None)
+        else:
+            self.module_names = dict()
+
+    def module_path(self, signal):
+        """Returns the hierarchical name of the module that created ``signal``"""
+        for step in reversed(signal.backtrace):
+            try:
+                return self.module_names[step]
+            except KeyError:
+                pass
+        return "top"
+
+    def signal_path(self, signal):
+        return self.module_path(signal) + "." + signal_name(signal)
@@ -0,0 +1,153 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import array
+
+from migen.fhdl.structure import Signal
+from migen.fhdl.specials import WRITE_FIRST, NO_CHANGE
+
+
+def _storage(width, depth):
+    for typecode in "BHILQ":
+        if array.array(typecode).itemsize*8 >= width:
+            return array.array(typecode, [0])*depth
+    return [0]*depth
+
+
+class SimMemory:
+    """Native simulation model of a ``Memory``
+
+    Contents are held in a flat array instead of one signal per word.
+    Writes are buffered in ``pending`` and applied by ``commit``, so that
+    all ports clocked on the same edge read the contents from before the
+    edge, as they would with the memory lowered to signals.
+    """
+    def __init__(self, memory, modified):
+        self.memory = memory
+        self.width = memory.width
+        self.depth = memory.depth
+        self.mask = 2**memory.width - 1
+        self.data = _storage(memory.width, memory.depth)
+        self.pending = dict()
+        self.modified = modified
+        if memory.init is not None:
+            self.load(memory.init)
+
+    def load(self, filename_or_data, endianness="big"):
+        """Loads words, or a file/regions as accepted by ``get_mem_data``"""
+        if isinstance(filename_or_data, (str, dict)):
+            from litex.soc.integration.soc_core import get_mem_data
+            data = get_mem_data(filename_or_data, endianness)
+        else:
+            data = filename_or_data
+        if len(data) > self.depth:
+            raise ValueError("Memory {} is too small: {}/{} words".format(
+                self.memory.name_override, len(data), self.depth))
+        for address, word in enumerate(data):
+            self.data[address] = word & self.mask
+
+    def copy(self, modified):
+        r = SimMemory(self.memory, modified)
+        r.data[:] = self.data
+        return r
+
+    def _address(self, address):
+        # out of range addresses select the last word, as Array does
+        return min(self.depth - 1, address)
+
+    def read(self, address, postcommit=False):
+        address = self._address(address)
+        if postcommit:
+            try:
+                return self.pending[address]
+            except KeyError:
+                pass
+        return self.data[address]
+
+    def write(self, address, value):
+        if not self.pending:
+            self.modified.append(self)
+        self.pending[self._address(address)] = value & self.mask
+
+    def commit(self):
+        changed = False
+        for address, value in self.pending.items():
+            if self.data[address] != value:
+                self.data[address] = value
+                changed = True
+        self.pending.clear()
+        return changed
+
+
+class SimMemoryPort:
+    """Simulation model of a ``Memory`` port
+
+    ``sync`` performs the registered read and the write of the port at the
+    active edge of its clock. Ports with an asynchronous read, or with a
+    registered address (``WRITE_FIRST``), also drive ``dat_r`` from
+    ``comb``, which is scheduled with the combinatorial logic: ``inputs``
+    and ``targets`` list the signals it reads and drives. Both take the
+    same arguments as compiled functions (see ``Compiler``), so the port
+    can be used with any evaluator sharing the slots of ``evaluator``.
+    """
+    def __init__(self, memory, port, evaluator):
+        self.memory = memory
+        self.port = port
+        self.cd = port.clock.cd
+
+        self.async_adr = None
+        if port.async_read:
+            self.async_adr = port.adr
+        elif port.mode == WRITE_FIRST:
+            self.async_adr = Signal.like(port.adr)
+        self.inputs = {self.async_adr} if self.async_adr is not None else set()
+        self.targets = {port.dat_r} if self.async_adr is not None else set()
+
+        slot = lambda s: None if s is None else evaluator.slot(s)
+        self.adr = slot(port.adr)
+        self.dat_r = slot(port.dat_r)
+        self.we = slot(port.we)
+        self.dat_w = slot(port.dat_w)
+        self.re = slot(port.re)
+        self.async_adr_slot = slot(self.async_adr)
+        self.re_mask = 0 if port.re is None else 2**len(port.re) - 1
+        self.we_mask = 0 if port.we is None else 2**len(port.we) - 1
+
+    def comb(self, ev, v, n, w):
+        n[self.dat_r] = ev.memories[self.memory].read(v[self.async_adr_slot])
+        w(self.dat_r)
+
+    def sync(self, ev, v, n, w):
+        port = self.port
+        memory = ev.memories[self.memory]
+        adr = v[self.adr]
+
+        # read
+        if not port.async_read and (self.re is None or v[self.re] & self.re_mask):
+            if port.mode == WRITE_FIRST:
+                n[self.async_adr_slot] = adr
+                w(self.async_adr_slot)
+            elif (port.mode == NO_CHANGE and self.we is not None
+                  and not (~v[self.we] & self.we_mask)):
+                pass
+            else:
+                n[self.dat_r] = memory.read(adr)
+                w(self.dat_r)
+
+        # write
+        if self.we is not None:
+            we = v[self.we]
+            dat_w = v[self.dat_w]
+            if port.we_granularity:
+                granularity = port.we_granularity
+                word = memory.read(adr, postcommit=True)
+                written = False
+                for i in range(memory.width//granularity):
+                    if we & (1 << i):
+                        mask = (2**granularity - 1) << i*granularity
+                        word = (word & ~mask) | (dat_w & mask)
+                        written = True
+                if written:
+                    memory.write(adr, word)
+            elif we & self.we_mask:
+                memory.write(adr, dat_w)
@@ -0,0 +1,253 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+from migen.fhdl.structure import *
+from migen.fhdl.structure import _Operator, _Slice, _ArrayProxy, _Assign
+from migen.fhdl.bitcontainer import value_bits_sign
+from migen.fhdl.specials import _MemoryLocation
+from migen.fhdl.visit import NodeTransformer
+from migen.fhdl.tools import list_targets
+
+from litex.gen.sim.compiler import _truncate
+from litex.gen.sim.sensitivity import _list_inputs_memories, group_by_targets
+
+
+class _ConstantFolder(NodeTransformer):
+    """Folds the expressions and conditions that only depend on constants
+
+    Folded expressions keep the width and signedness of the original ones,
+    so that they evaluate to the same values in the simulator. Signals in
+    ``constants`` are replaced by their value when read.
+    """
+    def __init__(self, evaluator, constants):
+        self.evaluator = evaluator
+        self.constants = constants
+
+    def _fold(self, node):
+        return Constant(self.evaluator.eval(node), value_bits_sign(node))
+
+    def visit_Signal(self, node):
+        return self.constants.get(node, node)
+
+    def visit_Operator(self, node):
+        operands = [self.visit(o) for o in node.operands]
+        r = _Operator(node.op, operands)
+        if all(isinstance(o, Constant) for o in operands):
+            return self._fold(r)
+        if node.op == "m" and isinstance(operands[0], Constant):
+            choice = operands[1] if operands[0].value else operands[2]
+            if value_bits_sign(choice) == value_bits_sign(r):
+                return choice
+        return r
+
+    def visit_Slice(self, node):
+        value = self.visit(node.value)
+        if isinstance(value, Constant):
+            return self._fold(_Slice(value, node.start, node.stop))
+        if isinstance(value, _Slice):
+            return _Slice(value.value, value.start + node.start, value.start + node.stop)
+        if (isinstance(value, Signal) and not value.signed
+                and node.start == 0 and node.stop == value.nbits):
+            return value
+        return _Slice(value, node.start, node.stop)
+
+    def visit_Cat(self, node):
+        elements = []
+        for element in node.l:
+            element = self.visit(element)
+            if isinstance(element, Cat):
+                elements += element.l
+            elif len(element):
+                elements.append(element)
+        # merge the adjacent slices of a same signal
+        merged = []
+        for element in elements:
+            if merged and isinstance(element, _Slice) and isinstance(merged[-1], _Slice):
+                last = merged[-1]
+                if last.value is element.value and last.stop == element.start:
+                    merged[-1] = _Slice(last.value, last.start, element.stop)
+                    continue
+            merged.append(element)
+        merged = [self.visit_Slice(e) if isinstance(e, _Slice) else e for e in merged]
+        r = Cat(*merged)
+        if all(isinstance(e, Constant) for e in merged):
+            return self._fold(r)
+        if len(merged) == 1 and isinstance(merged[0], Signal) and not merged[0].signed:
+            return merged[0]
+        return r
+
+    def visit_Replicate(self, node):
+        value = self.visit(node.v)
+        r = Replicate(value, node.n)
+        if isinstance(value, Constant):
+            return self._fold(r)
+        if node.n == 1 and isinstance(value, Signal) and not value.signed:
+            return value
+        return r
+
+    def visit_ArrayProxy(self, node):
+        key = self.visit(node.key)
+        choices = [self.visit(choice) for choice in node.choices]
+        r = _ArrayProxy(choices, key)
+        if isinstance(key, Constant):
+            choice = choices[min(len(choices) - 1, key.value)]
+            if value_bits_sign(choice) == value_bits_sign(r):
+                return choice
+        return r
+
+    def visit_target(self, node):
+        if isinstance(node, Cat):
+            return Cat(*[self.visit_target(e) for e in node.l])
+        elif isinstance(node, _Slice):
+            return _Slice(self.visit_target(node.value), node.start, node.stop)
+        elif isinstance(node, _ArrayProxy):
+            key = self.visit(node.key)
+            choices = [self.visit_target(choice) for choice in node.choices]
+            if isinstance(key, Constant):
+                return choices[min(len(choices) - 1, key.value)]
+            return _ArrayProxy(choices, key)
+        return node
+
+    def visit_Assign(self, node):
+        return _Assign(self.visit_target(node.l), self.visit(node.r))
+
+    def visit_If(self, node):
+        cond = self.visit(node.cond)
+        if isinstance(cond, Constant):
+            return self.visit(node.t if cond.value & (2**len(cond) - 1) else node.f)
+        r = If(cond)
+        r.t = self.visit(node.t)
+        r.f = self.visit(node.f)
+        return r
+
+    def visit_Case(self, node):
+        test = self.visit(node.test)
+        if isinstance(test, Constant):
+            value = _truncate(test.value, *value_bits_sign(test))
+            for k, statements in node.cases.items():
+                if isinstance(k, Constant) and k.value == value:
+                    return self.visit(statements)
+            return self.visit(node.cases.get("default", []))
+        return Case(test, {k: self.visit(statements) for k, statements in node.cases.items()})
+
+
+def _comb_constants(statements):
+    # signals only driven by unconditional assignments of constants
+    constants = dict()
+    for targets, group in group_by_targets(statements):
+        if len(targets) != 1:
+            continue
+        signal = next(iter(targets))
+        if signal.variable:
+            continue
+        if not all(isinstance(s, _Assign) and s.l is signal and isinstance(s.r, Constant)
+                   for s in group):
+            continue
+        value = _truncate(group[-1].r.value, signal.nbits, signal.signed)
+        constants[signal] = Constant(value, (signal.nbits, signal.signed))
+    return constants
+
+
+def _live_inputs(node, clock_domains):
+    # signals and memories read by node
+    signals, memories = _list_inputs_memories(node, clock_domains)
+    return signals | memories
+
+
+def _live_targets(s):
+    # signals and memory assigned by s
+    targets = list_targets(s)
+    if isinstance(s.l, _MemoryLocation):
+        targets.add(s.l.memory)
+    return targets
+
+
+def _mark_live(statements, live, conditions, clock_domains):
+    changed = False
+    for s in statements:
+        if isinstance(s, _Assign):
+            if _live_targets(s) & live:
+                inputs = _live_inputs(s, clock_domains) | conditions
+                if not inputs <= live:
+                    live |= inputs
+                    changed = True
+        elif isinstance(s, If):
+            cond = conditions | _live_inputs(s.cond, clock_domains)
+            changed |= _mark_live(s.t, live, cond, clock_domains)
+            changed |= _mark_live(s.f, live, cond, clock_domains)
+        elif isinstance(s, Case):
+            cond = conditions | _live_inputs(s.test, clock_domains)
+            for statements in s.cases.values():
+                changed |= _mark_live(statements, live, cond, clock_domains)
+        elif isinstance(s, Display):
+            inputs = _live_inputs(s, clock_domains) | conditions
+            if not inputs <= live:
+                live |= inputs
+                changed = True
+        else:
+            changed |= _mark_live(s, live, conditions, clock_domains)
+    return changed
+
+
+def _prune(statements, live, pruned):
+    r = []
+    for s in statements:
+        if isinstance(s, _Assign):
+            if _live_targets(s) & live:
+                r.append(s)
+            else:
+                pruned |= list_targets(s)
+        elif isinstance(s, If):
+            t = _prune(s.t, live, pruned)
+            f = _prune(s.f, live, pruned)
+            if t or f:
+                pruned_if = If(s.cond)
+                pruned_if.t = t
+                pruned_if.f = f
+                r.append(pruned_if)
+        elif isinstance(s, Case):
+            cases = {k: _prune(v, live, pruned) for k, v in s.cases.items()}
+            if any(cases.values()):
+                r.append(Case(s.test, cases))
+        elif isinstance(s, Display):
+            r.append(s)
+        else:
+            r += _prune(s, live, pruned)
+    return r
+
+
+def optimize_fragment(fragment, evaluator, observed):
+    """Simplifies the statements of a lowered fragment, in place
+
+    Folds constant expressions and conditions, propagates the value of
+    the combinatorial signals driven by constants, collapses trivial
+    slices, ``Cat`` and ``Replicate``, and removes the assignments to
+    signals and memories that are neither read by the logic nor in
+    ``observed`` (through any chain of assignments). ``evaluator`` is only
+    used to evaluate constant expressions. Returns the set of signals whose
+    assignments were all removed.
+    """
+    constants = dict()
+    while True:
+        folder = _ConstantFolder(evaluator, constants)
+        fragment.comb = folder.visit(fragment.comb)
+        fragment.sync = {cd: folder.visit(statements)
+                         for cd, statements in fragment.sync.items()}
+        new_constants = _comb_constants(fragment.comb)
+        if new_constants.keys() <= constants.keys():
+            break
+        constants.update(new_constants)
+
+    clock_domains = fragment.clock_domains
+    live = set(observed)
+    all_statements = [fragment.comb] + list(fragment.sync.values())
+    while any([_mark_live(statements, live, set(), clock_domains)
+               for statements in all_statements]):
+        pass
+
+    pruned = set()
+    fragment.comb = _prune(fragment.comb, live, pruned)
+    fragment.sync = {cd: _prune(statements, live, pruned)
+                     for cd, statements in fragment.sync.items()}
+    pruned -= live
+    return pruned
@@ -0,0 +1,165 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import os
+import sys
+import random
+import hashlib
+import inspect
+import traceback
+import collections.abc
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+
+from litex.gen.sim.core import run_simulation
+
+
+class SimJob:
+    """Simulation to be run by ``run_simulations``
+
+    ``dut_factory()`` builds the design and ``generators(dut)`` returns the
+    generators driving it, in any of the forms accepted by
+    ``run_simulation`` (which also receives ``clocks`` and ``kwargs``). The
+    result of the job has the same shape as the generators, with the return
+    value of each generator. Jobs are sent to worker processes: the
+    factories must be picklable (module-level functions or
+    ``functools.partial`` of them, not lambdas or closures).
+    """
+    def __init__(self, dut_factory, generators, clocks={"sys": 10}, name=None, **kwargs):
+        self.dut_factory = dut_factory
+        self.generators = generators
+        self.clocks = clocks
+        self.name = name
+        self.kwargs = kwargs
+
+
+class SimJobResult:
+    def __init__(self, index, name, seed):
+        self.index = index
+        self.name = name
+        self.seed = seed
+        self.value = None
+        self.exception = None
+        self.traceback = None
+        self.time = 0.0
+
+    @property
+    def ok(self):
+        return self.exception is None
+
+
+def job_seed(seed, index):
+    """Returns the seed of job ``index``, a function of ``seed`` and ``index`` only"""
+    digest = hashlib.sha256("{}:{}".format(seed, index).encode()).digest()
+    return int.from_bytes(digest[:4], "little")
+
+
+def _capture(generator, results, index):
+    results[index] = yield from generator
+
+
+def _capture_all(generators):
+    # returns the generators wrapped to store their return values, and a
+    # function building the result from them
+    if isinstance(generators, dict):
+        wrapped = dict()
+        builders = dict()
+        for cd, cd_generators in generators.items():
+            wrapped[cd], builders[cd] = _capture_all(cd_generators)
+        return wrapped, lambda: {cd: build() for cd, build in builders.items()}
+    elif (isinstance(generators, collections.abc.Iterable)
+            and not inspect.isgenerator(generators)):
+        generators = list(generators)
+        results = [None]*len(generators)
+        wrapped = [_capture(g, results, i) for i, g in enumerate(generators)]
+        return wrapped, lambda: results
+    else:
+        results = [None]
+        return _capture(generators, results, 0), lambda: results[0]
+
+
+def _run_job(index, job, seed):
+    result = SimJobResult(index, job.name, job_seed(seed, index))
+    random.seed(result.seed)
+    numpy = sys.modules.get("numpy")
+    if numpy is not None:
+        numpy.random.seed(result.seed)
+    start = perf_counter()
+    try:
+        dut = job.dut_factory()
+        generators, build = _capture_all(job.generators(dut))
+        run_simulation(dut, generators, clocks=job.clocks, **job.kwargs)
+        result.value = build()
+    except Exception as e:
+        result.exception = e
+        result.traceback = traceback.format_exc()
+    result.time = perf_counter() - start
+    return result
+
+
+class SimRunReport:
+    """Results of ``run_simulations``, in the order of the jobs"""
+    def __init__(self, results, wall_time, processes):
+        self.results = results
+        self.wall_time = wall_time
+        self.processes = processes
+
+    @property
+    def values(self):
+        return [result.value for result in self.results]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def cpu_time(self):
+        return sum(result.time for result in self.results)
+
+    def check(self):
+        """Raises the exception of the first failed job, if any"""
+        for result in self.failed:
+            raise RuntimeError("Simulation job {} ({}) failed:\n{}".format(
+                result.index, result.name, result.traceback)) from result.exception
+
+    def report(self):
+        r = "{} simulations, {} failed, {:.2f}s on {} processes ({:.2f}s of simulation)\n".format(
+            len(self.results), len(self.failed), self.wall_time, self.processes, self.cpu_time)
+        for result in sorted(self.results, key=lambda r: r.time, reverse=True):
+            r += "{:8.3f}s  {:4d}  {:10d}  {}{}\n".format(result.time, result.index,
+                result.seed, result.name or "", "" if result.ok else " FAILED")
+        return r
+
+
+def run_simulations(jobs, processes=None, seed=0):
+    """Runs ``SimJob``s in a pool of ``processes`` processes
+
+    Each job gets a seed derived from ``seed`` and its index, used to seed
+    ``random`` (and ``numpy.random``) before the design is built, so that
+    results do not depend on the scheduling of the jobs. Exceptions are
+    collected in the results instead of being raised, see
+    ``SimRunReport.check``. With ``processes=1`` the jobs are run in the
+    calling process.
+    """
+    jobs = list(jobs)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(jobs)))
+    start = perf_counter()
+    if processes == 1:
+        results = [_run_job(index, job, seed) for index, job in enumerate(jobs)]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(_run_job, index, job, seed)
+                       for index, job in enumerate(jobs)]
+            results = []
+            for index, future in enumerate(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # the job or its result could not be sent across processes
+                    result = SimJobResult(index, jobs[index].name, job_seed(seed, index))
+                    result.exception = e
+                    result.traceback = traceback.format_exc()
+                    results.append(result)
+    return SimRunReport(results, perf_counter() - start, processes)
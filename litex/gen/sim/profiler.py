@@ -0,0 +1,137 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import collections
+from time import perf_counter
+
+from litex.gen.fhdl.profiler import dump_report
+from litex.gen.sim.hierarchy import ModuleHierarchy, signal_name
+
+
+class _ProfileEntry:
+    __slots__ = ("kind", "module", "description", "calls", "time")
+
+    def __init__(self, kind, module, description):
+        self.kind = kind
+        self.module = module
+        self.description = description
+        self.calls = 0
+        self.time = 0.0
+
+    def as_dict(self):
+        return {
+            "kind":        self.kind,
+            "module":      self.module,
+            "description": self.description,
+            "calls":       self.calls,
+            "time":        self.time,
+        }
+
+
+class SimProfiler:
+    """Collects the execution time and counts of a simulation
+
+    Combinatorial and synchronous statements are attributed to the module
+    of ``top`` that created the signals they drive (from the backtraces of
+    the signals) and generators to their function. The number of
+    combinatorial units executed by each propagation, which is the number
+    of iterations needed to settle the combinatorial logic, is also
+    recorded.
+    """
+    def __init__(self, top=None):
+        self.entries = collections.OrderedDict()
+        self.comb_executions = 0
+        self.propagations = 0
+        self.propagation_executions = 0
+        self.max_propagation_executions = 0
+        self.hierarchy = ModuleHierarchy(top)
+
+    def entry(self, kind, module, description):
+        key = (kind, module, description)
+        try:
+            return self.entries[key]
+        except KeyError:
+            entry = self.entries[key] = _ProfileEntry(kind, module, description)
+            return entry
+
+    def entry_for_targets(self, kind, targets):
+        targets = sorted(targets, key=lambda s: s.duid)
+        if not targets:
+            return self.entry(kind, "top", "")
+        names = [signal_name(s) for s in targets]
+        if len(names) > 4:
+            names = names[:4] + ["... ({} signals)".format(len(targets))]
+        return self.entry(kind, self.hierarchy.module_path(targets[0]), ", ".join(names))
+
+    def entry_for_port(self, kind, port):
+        memory = port.memory
+        return self.entry(kind, self.hierarchy.module_path(port.port.dat_r),
+                          "{} port".format(memory.name_override))
+
+    def entry_for_generator(self, generator):
+        name = getattr(generator, "__qualname__", type(generator).__name__)
+        return self.entry("generator", name, "")
+
+    def wrap(self, entry, function, comb=False):
+        """Returns ``function`` with its calls counted and timed in ``entry``"""
+        def profiled():
+            start = perf_counter()
+            function()
+            entry.time += perf_counter() - start
+            entry.calls += 1
+            if comb:
+                self.comb_executions += 1
+        return profiled
+
+    def end_propagation(self):
+        executions = self.comb_executions - self.propagation_executions
+        self.propagation_executions = self.comb_executions
+        self.propagations += 1
+        self.max_propagation_executions = max(self.max_propagation_executions, executions)
+
+    # reports
+
+    def modules(self):
+        modules = collections.OrderedDict()
+        for entry in self.entries.values():
+            if entry.kind == "generator":
+                continue
+            calls, time = modules.get(entry.module, (0, 0.0))
+            modules[entry.module] = (calls + entry.calls, time + entry.time)
+        return sorted(modules.items(), key=lambda m: m[1][1], reverse=True)
+
+    def as_dict(self):
+        return {
+            "modules": [{"module": module, "calls": calls, "time": time}
+                        for module, (calls, time) in self.modules()],
+            "statements": [entry.as_dict() for entry in sorted(self.entries.values(),
+                           key=lambda e: e.time, reverse=True)],
+            "propagations": {
+                "count":          self.propagations,
+                "comb_units":     self.comb_executions,
+                "max_comb_units": self.max_propagation_executions,
+            },
+        }
+
+    def report(self, top=20):
+        total = sum(entry.time for entry in self.entries.values()) or 1.0
+        r = "Simulation profile\n"
+        r += "==================\n\n"
+        mean = self.comb_executions/max(self.propagations, 1)
+        r += "{} propagations, {:.1f} comb units per propagation (max {})\n\n".format(
+            self.propagations, mean, self.max_propagation_executions)
+        r += "Modules:\n"
+        r += "{:>10} {:>6} {:>10}  {}\n".format("time (s)", "%", "calls", "module")
+        for module, (calls, time) in self.modules():
+            r += "{:10.3f} {:6.1f} {:10d}  {}\n".format(time, 100*time/total, calls, module)
+        r += "\nStatements and generators (top {}):\n".format(top)
+        r += "{:>10} {:>6} {:>10}  {}\n".format("time (s)", "%", "calls", "kind/module/description")
+        entries = sorted(self.entries.values(), key=lambda e: e.time, reverse=True)
+        for entry in entries[:top]:
+            r += "{:10.3f} {:6.1f} {:10d}  {} {}: {}\n".format(entry.time, 100*entry.time/total,
+                entry.calls, entry.kind, entry.module, entry.description)
+        return r
+
+    def dump(self, filename=None):
+        """Writes the report to ``filename`` (JSON if it ends with ``.json``)"""
+        dump_report(self.as_dict(), self.report(), filename)
@@ -0,0 +1,187 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import collections
+import collections.abc
+
+from migen.fhdl.structure import *
+from migen.fhdl.structure import _Slice, _ArrayProxy
+from migen.fhdl.specials import _MemoryLocation
+from migen.fhdl.visit import NodeVisitor
+from migen.fhdl.tools import list_targets
+
+
+class _InputLister(NodeVisitor):
+    def __init__(self, clock_domains):
+        self.clock_domains = clock_domains
+        self.output_list = set()
+        self.memory_list = set()
+
+    def visit_Signal(self, node):
+        self.output_list.add(node)
+
+    def visit_ClockSignal(self, node):
+        self.output_list.add(self.clock_domains[node.cd].clk)
+
+    def visit_ResetSignal(self, node):
+        rst = self.clock_domains[node.cd].rst
+        if rst is not None:
+            self.output_list.add(rst)
+
+    def visit_Assign(self, node):
+        self.visit_target(node.l)
+        self.visit(node.r)
+
+    def visit_target(self, node):
+        if isinstance(node, Signal):
+            pass
+        elif isinstance(node, Cat):
+            for e in node.l:
+                self.visit_target(e)
+        elif isinstance(node, _Slice):
+            self.visit_target(node.value)
+        elif isinstance(node, _ArrayProxy):
+            self.visit(node.key)
+            for choice in node.choices:
+                self.visit_target(choice)
+        else:
+            self.visit(node)
+
+    def visit_unknown(self, node):
+        if isinstance(node, Display):
+            for arg in node.args:
+                self.visit(arg)
+        elif isinstance(node, _MemoryLocation):
+            self.memory_list.add(node.memory)
+            self.visit(node.index)
+
+
+def list_inputs(node, clock_domains):
+    """Lists the signals read by statements, excluding assignment targets"""
+    lister = _InputLister(clock_domains)
+    lister.visit(node)
+    return lister.output_list
+
+
+def _list_inputs_memories(node, clock_domains):
+    lister = _InputLister(clock_domains)
+    lister.visit(node)
+    return lister.output_list, lister.memory_list
+
+
+def _flatten(statements):
+    for s in statements:
+        if isinstance(s, collections.abc.Iterable):
+            yield from _flatten(s)
+        else:
+            yield s
+
+
+def group_by_targets(statements):
+    """Groups statements sharing assignment targets
+
+    Returns a list of ``(targets, statements)`` tuples, with statements kept
+    in their original order within each group. This is equivalent to
+    ``migen.fhdl.tools.group_by_targets``, in linear time.
+    """
+    parent = []
+    owner = dict()
+
+    def find(group):
+        while parent[group] != group:
+            parent[group] = parent[parent[group]]
+            group = parent[group]
+        return group
+
+    statements = list(_flatten(statements))
+    groups = []
+    for statement in statements:
+        group = len(parent)
+        parent.append(group)
+        groups.append(list_targets(statement))
+        for target in groups[group]:
+            try:
+                other = find(owner[target])
+            except KeyError:
+                owner[target] = group
+            else:
+                parent[other] = group
+
+    merged = collections.OrderedDict()
+    for group, statement in enumerate(statements):
+        root = find(group)
+        try:
+            targets, group_statements = merged[root]
+        except KeyError:
+            targets, group_statements = merged[root] = (set(), [])
+        targets |= groups[group]
+        group_statements.append(statement)
+    return list(merged.values())
+
+
+class SensitivityIndex:
+    """Combinatorial statements indexed by the signals they read
+
+    ``units`` holds the groups of statements driving disjoint sets of
+    signals, and the ``extra_units`` (objects with ``targets`` and
+    ``inputs`` sets of signals, such as asynchronous memory read ports,
+    and the ``memory`` they read if any), sorted so that each unit comes
+    after the units driving its inputs (except within combinatorial
+    loops). ``readers`` maps signals to the indices of the units reading
+    them, ``memory_readers`` maps memories to the indices of the units
+    reading them (through a port or a memory location) and ``drivers``
+    maps signals to the index of the unit driving them.
+    """
+    def __init__(self, statements, clock_domains, extra_units=[]):
+        groups = group_by_targets(statements)
+        inputs = []
+        memories = []
+        for targets, group_statements in groups:
+            group_inputs, group_memories = _list_inputs_memories(group_statements, clock_domains)
+            inputs.append(group_inputs)
+            memories.append(group_memories)
+        for unit in extra_units:
+            groups.append((unit.targets, unit))
+            inputs.append(unit.inputs)
+            memory = getattr(unit, "memory", None)
+            memories.append({memory} if memory is not None else set())
+
+        drivers = dict()
+        for i, (targets, group_statements) in enumerate(groups):
+            for target in targets:
+                drivers[target] = i
+
+        # levelize units with Kahn's algorithm, loops keep their original order
+        successors = [set() for group in groups]
+        npredecessors = [0]*len(groups)
+        for i, group_inputs in enumerate(inputs):
+            for signal in group_inputs:
+                driver = drivers.get(signal)
+                if driver is not None and driver != i and i not in successors[driver]:
+                    successors[driver].add(i)
+                    npredecessors[i] += 1
+        order = []
+        ready = collections.deque(i for i, n in enumerate(npredecessors) if not n)
+        while ready:
+            i = ready.popleft()
+            order.append(i)
+            for j in sorted(successors[i]):
+                npredecessors[j] -= 1
+                if not npredecessors[j]:
+                    ready.append(j)
+        ordered = set(order)
+        order += [i for i in range(len(groups)) if i not in ordered]
+        rank = {i: n for n, i in enumerate(order)}
+
+        self.units = [groups[i][1] for i in order]
+        self.drivers = {signal: rank[i] for signal, i in drivers.items()}
+        readers = collections.defaultdict(list)
+        for i in order:
+            for signal in inputs[i]:
+                readers[signal].append(rank[i])
+        self.readers = {signal: tuple(units) for signal, units in readers.items()}
+        memory_readers = collections.defaultdict(list)
+        for i in order:
+            for memory in memories[i]:
+                memory_readers[memory].append(rank[i])
+        self.memory_readers = {memory: tuple(units) for memory, units in memory_readers.items()}
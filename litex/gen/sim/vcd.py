@@ -5,8 +5,8 @@
 
 
 from itertools import count
-import tempfile
 import os
+import collections
 from collections import OrderedDict
 import shutil
 
@@ -24,89 +24,182 @@ def vcd_codes():
         yield code
 
 
+class _VCDVariable:
+    __slots__ = ("code", "suffix", "spec", "mask", "value")
+
+    def __init__(self, signal, code):
+        nbits = len(signal)
+        self.code = code
+        self.suffix = code + "\n" if nbits <= 1 else " " + code + "\n"
+        self.spec = "" if nbits <= 1 else "0{}b".format(nbits)
+        self.mask = 2**nbits - 1
+        self.value = None
+
+    def format(self, value):
+        if self.spec:
+            return "b" + format(value & self.mask, self.spec) + self.suffix
+        return str(value & 1) + self.suffix
+
+
 class VCDWriter:
-    def __init__(self, filename):
+    """Streaming VCD writer
+
+    Signals get their codes and formatters once. Value changes are
+    accumulated in a buffer that is written to the file in large chunks,
+    the header being written with the first chunk: it also declares the
+    signals that were not passed to ``init`` but were set before (such as
+    signals only accessed by the generators, in the first cycles). Signals
+    first set after the header was written are still traced, but the file
+    is then rewritten with a new header when it is closed (these signals
+    are listed in ``late_signals``).
+
+    Only the signals accepted by ``signal_filter`` (if given) are traced.
+    Recording can be paused with ``stop`` and resumed with ``start``: in
+    between, the value changes of the last ``history`` time units are kept
+    in memory, and are written when recording resumes.
+    """
+    def __init__(self, filename, buffer_size=4096, signal_filter=None,
+                 recording=True, history=0):
         self.filename = filename
         self.out_file = None
-        self.buffer_file = tempfile.TemporaryFile(
-            dir=os.path.dirname(filename), mode="w+")
-        self.initialized = False
         self.codegen = vcd_codes()
-        self.codes = OrderedDict()
-        self.signal_values = dict()
+        self.variables = OrderedDict()
+        self.late_signals = []
+        self.ignored = set()
+        self.signal_filter = signal_filter
+        self.buffer = []
+        self.buffer_size = buffer_size
+        self.header_written = False
+        self.body_start = 0
         self.t = 0
-
-    def _write_value(self, signal, value):
-        l = len(signal)
-        if value < 0:
-            value += 2**l
-        if l > 1:
-            fmtstr = "b{:0" + str(l) + "b} {}\n"
-        else:
-            fmtstr = "{}{}\n"
-        try:
-            code = self.codes[signal]
-        except KeyError:
-            code = next(self.codegen)
-            self.codes[signal] = code
-            self.init(self.codes.keys())
-
-        return fmtstr.format(value, code)
-
-    def _write(self, s):
-        self.out_file.write(s)
-        self.buffer_file.write(s)
-
-    def init(self, signals):
-        self.out_file = open(self.filename, "w")
-
-        # generate codes
-        for signal in signals:
-            try:
-                code = self.codes[signal]
-            except KeyError:
-                code = next(self.codegen)
-                self.codes[signal] = code
-
-        # write vcd header
+        self.recording = recording
+        self.history = history
+        # when not recording: values at the start of the kept history, and
+        # the (time, [(variable, value)]) steps since then
+        self.history_values = dict()
+        self.history_steps = collections.deque()
+
+    def _declare(self, signal):
+        if self.signal_filter is not None and not self.signal_filter(signal):
+            self.ignored.add(signal)
+            return None
+        variable = self.variables[signal] = _VCDVariable(signal, next(self.codegen))
+        return variable
+
+    def _header(self):
         header = ""
-        ns = build_namespace(self.codes.keys())
-        for signal, code in self.codes.items():
+        ns = build_namespace(self.variables.keys())
+        for signal, variable in self.variables.items():
             name = ns.get_name(signal)
-            header += "$var wire {len} {code} {name} $end\n".format(name=name, code=code, len=len(signal))
+            header += "$var wire {len} {code} {name} $end\n".format(
+                name=name, code=variable.code, len=len(signal))
         header += "$dumpvars\n"
-        for signal in self.codes.keys():
-            header += self._write_value(signal, signal.reset.value)
+        for signal, variable in self.variables.items():
+            header += variable.format(signal.reset.value)
         header += "$end\n"
-        self.out_file.write(header)
+        return header
 
-        if self.initialized:
-            self.buffer_file.seek(0)
-            shutil.copyfileobj(self.buffer_file, self.out_file)
-            self.buffer_file.seek(0, 2)
+    def init(self, signals):
+        for signal in signals:
+            if signal not in self.variables and signal not in self.ignored:
+                self._declare(signal)
+        self.out_file = open(self.filename, "w")
+        if self.recording:
+            self.buffer.append("#{}\n".format(self.t))
         else:
-            # init time
-            self._write("#0\n")
+            self.history_steps.append((self.t, []))
 
-        self.initialized = True
+    def _flush(self):
+        if not self.header_written:
+            self.out_file.write(self._header())
+            self.body_start = self.out_file.tell()
+            self.header_written = True
+        self.out_file.write("".join(self.buffer))
+        self.buffer.clear()
 
     def set(self, signal, value):
-        if (signal not in self.signal_values
-                or self.signal_values[signal] != value):
-            self._write(self._write_value(signal, value))
-            self.signal_values[signal] = value
+        try:
+            variable = self.variables[signal]
+        except KeyError:
+            if signal in self.ignored:
+                return
+            variable = self._declare(signal)
+            if variable is None:
+                return
+            if self.header_written:
+                self.late_signals.append(signal)
+        if variable.value != value:
+            variable.value = value
+            if self.recording:
+                self.buffer.append(variable.format(value))
+            else:
+                self.history_steps[-1][1].append((variable, value))
 
     def delay(self, delay):
         self.t += delay
-        self._write("#{}\n".format(self.t))
+        if self.recording:
+            self.buffer.append("#{}\n".format(self.t))
+            if len(self.buffer) >= self.buffer_size:
+                self._flush()
+        else:
+            steps = self.history_steps
+            steps.append((self.t, []))
+            while steps[0][0] < self.t - self.history:
+                t, changes = steps.popleft()
+                self.history_values.update(changes)
+
+    def start(self):
+        """Resumes recording, starting with the kept history"""
+        if self.recording:
+            return
+        steps = self.history_steps
+        t, changes = steps.popleft()
+        values = self.history_values
+        values.update(changes)
+        self.buffer.append("#{}\n".format(t))
+        for variable, value in values.items():
+            self.buffer.append(variable.format(value))
+        for t, changes in steps:
+            self.buffer.append("#{}\n".format(t))
+            for variable, value in changes:
+                self.buffer.append(variable.format(value))
+        values.clear()
+        steps.clear()
+        self.recording = True
+
+    def stop(self):
+        """Pauses recording"""
+        if not self.recording:
+            return
+        self.history_values = {variable: variable.value
+                               for variable in self.variables.values()
+                               if variable.value is not None}
+        self.history_steps.append((self.t, []))
+        self.recording = False
 
     def close(self):
+        self._flush()
         self.out_file.close()
-        self.buffer_file.close()
+        if self.late_signals:
+            # fallback: declare the signals that appeared after the header
+            body_filename = self.filename + ".body"
+            os.replace(self.filename, body_filename)
+            with open(body_filename, "r") as body, open(self.filename, "w") as out:
+                out.write(self._header())
+                body.seek(self.body_start)
+                shutil.copyfileobj(body, out)
+            os.remove(body_filename)
+            self.late_signals.clear()
 
 
 class DummyVCDWriter:
-    def init(self):
+    def init(self, signals):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
         pass
 
     def set(self, signal, value):
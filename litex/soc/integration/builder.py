@@ -41,7 +41,8 @@ class Builder:
     def __init__(self, soc, output_dir=None,
                  compile_software=True, compile_gateware=True,
                  gateware_toolchain_path=None,
-                 csr_json=None, csr_csv=None):
+                 csr_json=None, csr_csv=None,
+                 build_cache=None):
         self.soc = soc
         if output_dir is None:
             output_dir = "soc_{}_{}".format(
@@ -55,6 +56,7 @@ class Builder:
         self.gateware_toolchain_path = gateware_toolchain_path
         self.csr_csv = csr_csv
         self.csr_json = csr_json
+        self.build_cache = build_cache
 
         self.software_packages = []
         for name in soc_software_packages:
@@ -193,6 +195,8 @@ class Builder:
 
         if "run" not in kwargs:
             kwargs["run"] = self.compile_gateware
+        if self.build_cache is not None:
+            kwargs.setdefault("build_cache", self.build_cache)
         vns = self.soc.build(build_dir=os.path.join(self.output_dir, "gateware"),
                              toolchain_path=toolchain_path, **kwargs)
         self.soc.do_exit(vns=vns)
@@ -218,6 +222,10 @@ def builder_args(parser):
     parser.add_argument("--csr-json", default=None,
                         help="store CSR map in JSON format into the "
                              "specified file")
+    parser.add_argument("--build-cache", nargs="?", const=True, default=None,
+                        help="reuse the gateware of previous builds with "
+                             "identical inputs, from the specified cache "
+                             "directory (default: ~/.cache/litex/build)")
 
 
 def builder_argdict(args):
@@ -226,5 +234,6 @@ def builder_argdict(args):
         "compile_software": not args.no_compile_software,
         "compile_gateware": not args.no_compile_gateware,
         "gateware_toolchain_path": args.gateware_toolchain_path,
-        "csr_csv": args.csr_csv
+        "csr_csv": args.csr_csv,
+        "build_cache": args.build_cache
     }
@@ -0,0 +1,139 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import os
+import sys
+import time
+import traceback
+import contextlib
+
+from litex.build.parallel import run_processes
+from litex.soc.integration.builder import Builder
+
+
+__all__ = ["BuildTarget", "BuildResult", "build_targets", "build_report"]
+
+
+class BuildTarget:
+    """SoC to build with ``build_targets``
+
+    ``soc_factory`` is called in the build process to create the SoC: it is
+    sent to that process and must be picklable (a class, a module-level
+    function or a ``functools.partial`` of those). ``memory`` is an estimate
+    of the peak memory of the build in bytes, used to respect the memory
+    budget of ``build_targets``.
+    """
+    def __init__(self, soc_factory, name=None, output_dir=None, memory=0,
+                 builder_kwargs={}, build_kwargs={}):
+        if name is None:
+            func = getattr(soc_factory, "func", soc_factory) # functools.partial
+            name = getattr(func, "__name__", func.__class__.__name__).lower()
+        self.soc_factory = soc_factory
+        self.name = name
+        self.output_dir = output_dir
+        self.memory = memory
+        self.builder_kwargs = builder_kwargs
+        self.build_kwargs = build_kwargs
+
+
+class BuildResult:
+    def __init__(self, name, output_dir, success, time, error=None):
+        self.name = name
+        self.output_dir = output_dir
+        self.success = success
+        self.time = time
+        self.error = error
+
+    def __repr__(self):
+        return "<BuildResult {} {} {:.1f}s>".format(
+            self.name, "passed" if self.success else "failed", self.time)
+
+
+@contextlib.contextmanager
+def _redirect_output(filename):
+    # redirect at the file descriptor level to also capture the toolchains
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    with open(filename, "w") as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+
+
+def _build_target(target, name, output_dir):
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    cwd = os.getcwd()
+    error = None
+    with _redirect_output(os.path.join(output_dir, "build.log")):
+        try:
+            soc = target.soc_factory()
+            builder = Builder(soc, output_dir=output_dir, **target.builder_kwargs)
+            builder.build(**target.build_kwargs)
+        except Exception:
+            error = traceback.format_exc()
+            print(error)
+        finally:
+            # toolchains change directory and do not restore it on errors
+            os.chdir(cwd)
+    return BuildResult(name, output_dir, error is None,
+        time.perf_counter() - start, error)
+
+
+def build_targets(targets, output_dir="build", jobs=None, memory=None, verbose=True):
+    """Builds ``targets`` concurrently on a pool of processes
+
+    Each target is built in its own process, in ``output_dir/<name>`` (unless
+    it has its own ``output_dir``) with its output logged to ``build.log``.
+    At most ``jobs`` targets (default: the number of CPUs) are built at the
+    same time and, when ``memory`` is given, targets are started in order
+    while the sum of their ``memory`` estimates fits in it (see
+    ``litex.build.parallel.run_processes``). Returns the ``BuildResult`` of
+    each target, in the order of ``targets``.
+    """
+    targets = [t if isinstance(t, BuildTarget) else BuildTarget(t) for t in targets]
+    # targets with the same name are numbered, without renaming the targets
+    names = [t.name for t in targets]
+    names = [name + "_" + str(names[:i].count(name)) if names.count(name) > 1 else name
+        for i, name in enumerate(names)]
+
+    tasks = []
+    for target, name in zip(targets, names):
+        target_dir = target.output_dir
+        if target_dir is None:
+            target_dir = os.path.join(output_dir, name)
+        tasks.append(((target, name, os.path.abspath(target_dir)), target.memory))
+
+    results = [None]*len(targets)
+    def done(index, future):
+        target, name, target_dir = tasks[index][0]
+        try:
+            result = future.result()
+        except Exception:
+            # the build process itself failed (crash, unpicklable factory)
+            result = BuildResult(name, target_dir, False, 0.0, traceback.format_exc())
+        results[index] = result
+        if verbose:
+            print("[{}] {} ({:.1f}s)".format(
+                "PASS" if result.success else "FAIL", result.name, result.time))
+    run_processes(_build_target, tasks, processes=jobs, memory=memory, done=done)
+    return results
+
+
+def build_report(results):
+    r = "{:>10}  {:6}  {}\n".format("time (s)", "status", "target")
+    for result in results:
+        r += "{:10.1f}  {:6}  {}\n".format(result.time,
+            "pass" if result.success else "FAIL", result.name)
+    failed = sum(not result.success for result in results)
+    r += "{} targets, {} failed\n".format(len(results), failed)
+    return r
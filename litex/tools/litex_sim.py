@@ -188,7 +188,11 @@ def main():
     builder_args(parser)
     soc_sdram_args(parser)
     parser.add_argument("--threads", default=1,
-                        help="set number of threads (default=1)")
+                        help="set number of threads of the Verilated model (default=1)")
+    parser.add_argument("--jobs", default=None,
+                        help="set number of parallel C++ compile jobs (default=number of CPUs)")
+    parser.add_argument("--output-split", default=20000,
+                        help="split Verilated C++ files every N statements, 0 to disable (default=20000)")
     parser.add_argument("--rom-init", default=None,
                         help="rom_init file")
     parser.add_argument("--ram-init", default=None,
@@ -209,6 +213,14 @@ def main():
                         help="cycle to end VCD tracing")
     parser.add_argument("--opt-level", default="O3",
                         help="compilation optimization level")
+    parser.add_argument("--savable", action="store_true",
+                        help="build a simulation that can be checkpointed")
+    parser.add_argument("--save-at", default=None,
+                        help="cycle to save a checkpoint at (implies --savable)")
+    parser.add_argument("--save-file", default=None,
+                        help="checkpoint file to save to (default=dut.ckpt in the gateware directory)")
+    parser.add_argument("--restore", default=None,
+                        help="checkpoint file to restore the simulation from (implies --savable)")
     args = parser.parse_args()
 
     soc_kwargs = soc_sdram_argdict(args)
@@ -246,14 +258,19 @@ def main():
         soc.add_constant("ROM_BOOT_ADDRESS", 0x40000000)
     builder_kwargs["csr_csv"] = "csr.csv"
     builder = Builder(soc, **builder_kwargs)
-    vns = builder.build(run=False, threads=args.threads, sim_config=sim_config,
+    build_kwargs = dict(threads=args.threads, sim_config=sim_config,
         opt_level=args.opt_level,
+        jobs=None if args.jobs is None else int(args.jobs),
+        output_split=int(args.output_split),
+        savable=args.savable or args.save_at is not None or args.restore is not None,
+        save_at=None if args.save_at is None else int(args.save_at),
+        save_file=args.save_file,
+        restore=args.restore,
         trace=args.trace, trace_start=int(args.trace_start), trace_end=int(args.trace_end))
+    vns = builder.build(run=False, **build_kwargs)
     if args.with_analyzer:
         soc.analyzer.export_csv(vns, "analyzer.csv")
-    builder.build(build=False, threads=args.threads, sim_config=sim_config,
-        opt_level=args.opt_level,
-        trace=args.trace, trace_start=int(args.trace_start), trace_end=int(args.trace_end))
+    builder.build(build=False, **build_kwargs)
 
 
 if __name__ == "__main__":
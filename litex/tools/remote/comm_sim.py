@@ -0,0 +1,154 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import queue
+import threading
+
+from migen.fhdl.bitcontainer import log2_int
+
+from litex.gen.sim import run_simulation
+
+
+class _Request:
+    def __init__(self, addr, datas=None, length=None):
+        self.addr = addr
+        self.datas = datas
+        self.length = length
+        self.result = None
+        self.exception = None
+        self.done = threading.Event()
+
+
+class CommSim:
+    """Comm backend driving a Wishbone master of a Python simulation
+
+    ``read``/``write`` can be called from any thread (for example the ones
+    of a ``RemoteServer``): they queue the request and wait for
+    ``generator()``, which must be one of the generators of the running
+    simulation, to perform it on ``bus``. All the requests queued when the
+    generator wakes up are performed back-to-back before it idles again.
+
+    Addresses are byte addresses, as for the other comm backends. When no
+    request is pending, the generator waits ``idle_wait`` seconds for one
+    before letting the simulation advance by one cycle; with ``None``
+    simulation time only advances while requests are performed.
+    """
+    def __init__(self, bus, idle_wait=None, debug=False):
+        self.bus = bus
+        self.idle_wait = idle_wait
+        self.debug = debug
+        self.requests = queue.Queue()
+        self.closed = threading.Event()
+        self.finished = threading.Event()
+        self.transactions = 0
+        self.batches = 0
+
+    def open(self):
+        self.closed.clear()
+
+    def close(self):
+        self.closed.set()
+
+    def _submit(self, request):
+        if self.closed.is_set():
+            raise IOError("Simulation is closed")
+        self.requests.put(request)
+        while not request.done.wait(0.1):
+            if self.finished.is_set() and not request.done.is_set():
+                raise IOError("Simulation is closed")
+        if request.exception is not None:
+            raise request.exception
+        return request.result
+
+    def read(self, addr, length=None):
+        length_int = 1 if length is None else length
+        datas = self._submit(_Request(addr, length=length_int))
+        if self.debug:
+            for i, value in enumerate(datas):
+                print("read {:08x} @ {:08x}".format(value, addr + 4*i))
+        return datas[0] if length is None else datas
+
+    def write(self, addr, datas):
+        datas = datas if isinstance(datas, list) else [datas]
+        self._submit(_Request(addr, datas=datas))
+        if self.debug:
+            for i, value in enumerate(datas):
+                print("write {:08x} @ {:08x}".format(value, addr + 4*i))
+
+    def _next_request(self):
+        # waits for a request, returns None when the simulation has to advance
+        if self.idle_wait is not None:
+            try:
+                return self.requests.get(timeout=self.idle_wait)
+            except queue.Empty:
+                return None
+        while not self.closed.is_set():
+            try:
+                return self.requests.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def generator(self):
+        bus = self.bus
+        shift = log2_int(len(bus.dat_w)//8)
+        batch = []
+        try:
+            while not (self.closed.is_set() and self.requests.empty()):
+                request = self._next_request()
+                if request is None:
+                    yield
+                    continue
+                batch = [request]
+                while True:
+                    try:
+                        batch.append(self.requests.get_nowait())
+                    except queue.Empty:
+                        break
+                self.batches += 1
+                for request in batch:
+                    adr = request.addr >> shift
+                    if request.datas is not None:
+                        for i, data in enumerate(request.datas):
+                            yield from bus.write(adr + i, data)
+                    else:
+                        request.result = []
+                        for i in range(request.length):
+                            request.result.append((yield from bus.read(adr + i)))
+                    self.transactions += 1
+                    request.done.set()
+        finally:
+            self.closed.set()
+            while True:
+                try:
+                    batch.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            for request in batch:
+                if not request.done.is_set():
+                    request.exception = IOError("Simulation is closed")
+                    request.done.set()
+            self.finished.set()
+
+
+def serve_simulation(dut, bus, generators=[], bind_ip="localhost", bind_port=1234,
+                     nthreads=4, idle_wait=None, **kwargs):
+    """Simulates ``dut`` and serves Etherbone accesses to ``bus`` on TCP
+
+    Tools connecting with ``RemoteClient`` (or through ``litex_server``) see
+    the simulated design as they would see hardware. The simulation runs
+    in the calling thread, with ``generators`` and ``kwargs`` passed to
+    ``run_simulation``, until interrupted.
+    """
+    from litex.tools.litex_server import RemoteServer
+
+    comm = CommSim(bus, idle_wait=idle_wait)
+    server = RemoteServer(comm, bind_ip, bind_port)
+    server.open()
+    server.start(nthreads)
+    try:
+        run_simulation(dut, [comm.generator()] + list(generators), **kwargs)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,100 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from migen import *
+
+from litex.build.cache import BuildCache, run_cached, toolchain_version
+from litex.gen.fhdl import verilog
+
+
+class TestBuildCache(unittest.TestCase):
+    def test_run_cached(self):
+        runs = []
+        def run():
+            runs.append(1)
+            with open("top.v") as f:
+                source = f.read()
+            with open("top.bit", "w") as f:
+                f.write("bitstream of " + source)
+            os.makedirs("impl", exist_ok=True)
+            with open(os.path.join("impl", "top.rpt"), "w") as f:
+                f.write("report")
+
+        def build(source, options={}):
+            with open("top.v", "w") as f:
+                f.write(source)
+            return run_cached(cache, run, ["top.v"], ["top.bit", "impl/*.rpt"], options)
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = BuildCache(os.path.join(tmp, "cache"))
+            os.makedirs(os.path.join(tmp, "build"))
+            os.chdir(os.path.join(tmp, "build"))
+            try:
+                self.assertFalse(build("module a;"))
+                os.remove("top.bit")
+                os.remove(os.path.join("impl", "top.rpt"))
+                # identical inputs: outputs restored without running
+                self.assertTrue(build("module a;"))
+                self.assertEqual(len(runs), 1)
+                with open("top.bit") as f:
+                    self.assertEqual(f.read(), "bitstream of module a;")
+                self.assertTrue(os.path.exists(os.path.join("impl", "top.rpt")))
+                # changed sources or options run the toolchain
+                self.assertFalse(build("module b;"))
+                self.assertFalse(build("module b;", {"opt": 1}))
+                self.assertEqual(len(runs), 3)
+                with open("top.bit") as f:
+                    self.assertEqual(f.read(), "bitstream of module b;")
+                # without a cache, always run
+                run_cached(None, run, ["top.v"], ["top.bit"])
+                self.assertEqual(len(runs), 4)
+            finally:
+                os.chdir(cwd)
+
+    def test_missing_outputs(self):
+        runs = []
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = BuildCache(os.path.join(tmp, "cache"))
+            os.chdir(tmp)
+            try:
+                with open("top.v", "w") as f:
+                    f.write("module a;")
+                # a failed run without outputs is not a cache entry
+                for i in range(2):
+                    self.assertFalse(run_cached(cache, lambda: runs.append(1), ["top.v"], ["top.bit"]))
+                self.assertEqual(len(runs), 2)
+                self.assertFalse(os.path.exists(os.path.join(tmp, "cache")))
+            finally:
+                os.chdir(cwd)
+
+    @unittest.skipIf(shutil.which("bash") is None, "bash is not installed")
+    def test_toolchain_settings(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tool = os.path.join(tmp, "bin", "litex_test_tool")
+            os.makedirs(os.path.dirname(tool))
+            with open(tool, "w") as f:
+                f.write("#!/bin/sh\necho version $1\n")
+            os.chmod(tool, 0o755)
+            settings = os.path.join(tmp, "settings64.sh")
+            with open(settings, "w") as f:
+                f.write("export PATH={}:$PATH\n".format(os.path.dirname(tool)))
+            # the tool is found in the environment of the settings script
+            self.assertEqual(toolchain_version(["litex_test_tool", "1"]),
+                "litex_test_tool: not found")
+            self.assertEqual(toolchain_version(["litex_test_tool", "1"], settings=settings),
+                "version 1\n")
+
+    def test_deterministic_generation(self):
+        def convert():
+            s = Signal(8, name="s")
+            module = Module()
+            module.sync += s.eq(s + 1)
+            return verilog.convert(module, {s}).main_source
+        self.assertEqual(convert(), convert())
@@ -0,0 +1,57 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import os
+import time
+import unittest
+
+from litex.build.parallel import run_processes
+
+
+def _stub_build(name, duration):
+    start = time.time()
+    if name == "broken":
+        raise ValueError(name)
+    time.sleep(duration)
+    return name, start, time.time()
+
+
+def _stub_pid():
+    return os.getpid()
+
+
+class TestParallel(unittest.TestCase):
+    def test_processes(self):
+        # each target is built in its own process, even when run one by one
+        futures = run_processes(_stub_pid, [((), 0)]*3, processes=1)
+        pids = [future.result() for future in futures]
+        self.assertEqual(len(set(pids)), 3)
+        self.assertNotIn(os.getpid(), pids)
+
+    def test_memory_budget(self):
+        # (name, duration, memory): "large" does not fit while "a" runs, the
+        # small targets behind it must not overtake it
+        targets = [("a", 1.0, 6), ("large", 0.5, 6), ("b", 0.1, 1), ("c", 0.1, 1)]
+        completed = []
+        futures = run_processes(_stub_build,
+            [((name, duration), memory) for name, duration, memory in targets],
+            processes=3, memory=10, done=lambda index, future: completed.append(index))
+        self.assertEqual(sorted(completed), [0, 1, 2, 3])
+        runs = [future.result() for future in futures]
+        self.assertEqual([name for name, start, end in runs], ["a", "large", "b", "c"])
+
+        # nothing starts before "a" completes
+        for name, start, end in runs[1:]:
+            self.assertGreaterEqual(start, runs[0][2])
+        # the memory budget is respected at the start of each target
+        for name, start, end in runs:
+            used = sum(memory for (_, s, e), (_, _, memory) in zip(runs, targets)
+                if s <= start < e)
+            self.assertLessEqual(used, 10)
+
+    def test_errors(self):
+        futures = run_processes(_stub_build, [(("ok", 0.0), 0), (("broken", 0.0), 0)],
+            processes=2)
+        self.assertEqual(futures[0].result()[0], "ok")
+        with self.assertRaises(ValueError):
+            futures[1].result()
@@ -0,0 +1,879 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import unittest
+import random
+import json
+import os
+import shutil
+import tempfile
+
+from migen import *
+from migen.genlib.fsm import FSM, NextState, NextValue
+from migen.sim import run_simulation as migen_run_simulation
+from migen.fhdl.structure import _Assign
+
+from litex.gen.sim import *
+from litex.gen.sim.vcd import VCDWriter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from litex.soc.interconnect import wishbone
+from litex.soc.interconnect.stream import SyncFIFO, Gearbox
+
+
+class ConstructsDUT(Module):
+    def __init__(self):
+        self.a = a = Signal(8)
+        self.b = b = Signal((8, True))
+        self.sel = sel = Signal(2)
+        self.outputs = []
+
+        def output(*args, **kwargs):
+            s = Signal(*args, **kwargs)
+            self.outputs.append(s)
+            return s
+
+        # operators, slices, concatenations, replications
+        arith = output((10, True))
+        self.comb += arith.eq(a + b - (a*3) + (-b))
+        logic = output(16)
+        self.comb += logic.eq(Cat(~a, a[2:6] ^ b[0:4], Replicate(a[0], 4)) | (a << 3))
+        compare = output(6)
+        self.comb += compare.eq(Cat(a < b, a <= b, a == b, a != b, a > b, a >= b))
+        mux = output(8)
+        self.comb += mux.eq(Mux(a[7], a >> 2, b))
+
+        # arrays, slice and concatenation targets
+        array = Array(output(8, name="array{}".format(i)) for i in range(3))
+        self.sync += array[sel].eq(a)
+        read = output(8)
+        self.comb += read.eq(array[sel])
+        cat_lo, cat_hi = output(3), output(5)
+        self.comb += Cat(cat_lo, cat_hi).eq(b)
+        part = output(8)
+        self.sync += [
+            part[0:4].eq(a[4:8]),
+            part[6:8].eq(b),
+        ]
+
+        # control flow
+        counter = output(8)
+        self.sync += [
+            If(a[0],
+                counter.eq(counter + 1)
+            ).Elif(a[1],
+                counter.eq(counter - 1)
+            ).Elif(a[2],
+                counter.eq(0)
+            ).Else(
+                counter.eq(counter + b)
+            )
+        ]
+        decoded = output(4)
+        self.comb += Case(sel, {
+            0: decoded.eq(1),
+            1: decoded.eq(2),
+            "default": decoded.eq(8),
+        })
+        fsm_out = output(8)
+        self.submodules.fsm = fsm = FSM()
+        fsm.act("IDLE",
+            If(a[3], NextState("RUN"), NextValue(fsm_out, a))
+        )
+        fsm.act("RUN",
+            If(a[4], NextState("IDLE")),
+            NextValue(fsm_out, fsm_out + 1)
+        )
+        self.outputs.append(fsm.ongoing("RUN"))
+
+
+class MemoryDUT(Module):
+    def __init__(self):
+        self.mem = Memory(16, 8, init=[i*0x101 for i in range(8)])
+        self.specials += self.mem
+        self.ports = [
+            self.mem.get_port(write_capable=True, we_granularity=8),
+            self.mem.get_port(async_read=True),
+            self.mem.get_port(write_capable=True, mode=WRITE_FIRST),
+            self.mem.get_port(write_capable=True, mode=NO_CHANGE, has_re=True),
+        ]
+        self.specials += self.ports
+        self.inputs = [getattr(p, name) for p in self.ports
+            for name in ("adr", "we", "dat_w", "re") if getattr(p, name) is not None]
+        self.outputs = [p.dat_r for p in self.ports]
+
+
+def memory_generator(dut, trace, seed=42):
+    prng = random.Random(seed)
+    for i in range(256):
+        for signal in dut.inputs:
+            yield signal.eq(prng.randrange(2**len(signal)))
+        yield
+        trace.append((yield dut.outputs))
+
+
+def run_memory(run):
+    dut = MemoryDUT()
+    trace = []
+    run(dut, memory_generator(dut, trace))
+    return trace
+
+
+class MemoryLocationDUT(Module):
+    def __init__(self):
+        self.mem = Memory(8, 4, name="mem")
+        self.port = self.mem.get_port(write_capable=True)
+        self.specials += self.mem, self.port
+        self.o = Signal(8, name="o")
+        # read without a port, through a memory location
+        self.comb += self.o.eq(self.mem[2])
+
+
+def run_memory_location(run):
+    dut = MemoryLocationDUT()
+    results = []
+
+    def generator():
+        yield dut.port.adr.eq(2)
+        yield dut.port.dat_w.eq(42)
+        yield dut.port.we.eq(1)
+        yield
+        yield dut.port.we.eq(0)
+        yield
+        yield
+        results.append((yield dut.o))
+
+    run(dut, generator())
+    return results
+
+
+def constructs_generator(dut, trace, seed=42):
+    prng = random.Random(seed)
+    for i in range(256):
+        yield dut.a.eq(prng.randrange(2**8))
+        yield dut.b.eq(prng.randrange(-2**7, 2**7))
+        yield dut.sel.eq(prng.randrange(4))
+        yield
+        trace.append((yield dut.outputs))
+
+
+def run_constructs(compiled, **kwargs):
+    dut = ConstructsDUT()
+    trace = []
+    run_simulation(dut, constructs_generator(dut, trace), compiled=compiled, **kwargs)
+    return trace
+
+
+def fifo_factory(depth):
+    return SyncFIFO([("data", 8)], depth)
+
+
+def fifo_generators(fifo):
+    datas = [random.randrange(2**8) for i in range(16)]
+
+    def producer():
+        for data in datas:
+            yield fifo.sink.valid.eq(1)
+            yield fifo.sink.data.eq(data)
+            yield
+            while not (yield fifo.sink.ready):
+                yield
+        yield fifo.sink.valid.eq(0)
+
+    def consumer():
+        received = []
+        yield fifo.source.ready.eq(1)
+        while len(received) < len(datas):
+            yield
+            if (yield fifo.source.valid):
+                received.append((yield fifo.source.data))
+        return received == datas, received
+
+    return [producer(), consumer()]
+
+
+def failing_generators(fifo):
+    raise ValueError("failing job")
+
+
+class TestSim(unittest.TestCase):
+    def test_compiled_matches_interpreter(self):
+        self.assertEqual(run_constructs(compiled=True), run_constructs(compiled=False))
+
+    def test_comb_chain(self):
+        for compiled in (True, False):
+            dut = Module()
+            chain = [Signal(8) for i in range(32)]
+            # declared in reverse to check that units are levelized
+            for a, b in reversed(list(zip(chain, chain[1:]))):
+                dut.comb += b.eq(a + 1)
+            results = []
+
+            def generator():
+                for i in range(4):
+                    yield chain[0].eq(i)
+                    yield
+                    results.append((yield chain[-1]))
+
+            sim = Simulator(dut, generator(), compiled=compiled)
+            executions = []
+            for i, function in enumerate(sim.comb_functions):
+                def counted(function=function):
+                    executions.append(function)
+                    function()
+                sim.comb_functions[i] = counted
+            sim.run()
+            self.assertEqual(results, [i + 31 for i in range(4)])
+            # statements only run when their inputs change, instead of
+            # one pass over all of them per changed signal
+            self.assertLess(len(executions), 31*8)
+
+    def test_signal_slots(self):
+        dut = Module()
+        a, b = Signal(8, reset=3), Signal(8)
+        dut.sync += b.eq(a)
+        outside = Signal(4, reset=5)
+        results = []
+
+        def generator():
+            results.append((yield outside))
+            yield outside.eq(0x1f)
+            yield a.eq(7)
+            yield
+            yield
+            results.append((yield outside))
+            results.append((yield b))
+
+        sim = Simulator(dut, generator())
+        slots = sim.evaluator.slots
+        self.assertEqual(sorted(slots.values()), list(range(len(slots))))
+        self.assertNotIn(outside, slots)
+        sim.run()
+        self.assertEqual(results, [5, 0xf, 7])
+        self.assertIn(outside, slots)
+
+    def test_memory_matches_lowered(self):
+        reference = run_memory(migen_run_simulation)
+        self.assertEqual(run_memory(run_simulation), reference)
+        self.assertEqual(run_memory(lambda *args: run_simulation(*args, compiled=False)), reference)
+
+    def test_memory_access(self):
+        dut = MemoryDUT()
+        results = []
+
+        def generator():
+            results.append((yield dut.mem[2]))
+            yield dut.mem[3].eq(0xbeef)
+            yield dut.ports[1].adr.eq(3)
+            yield
+            results.append((yield dut.mem[3]))
+            results.append((yield dut.ports[1].dat_r))
+
+        run_simulation(dut, generator(), memory_init={dut.mem: [0x1234]*8})
+        self.assertEqual(results, [0x1234, 0xbeef, 0xbeef])
+
+    def test_memory_location_comb_read(self):
+        # comb statements reading a memory location are run again when the
+        # memory is written
+        self.assertEqual(run_memory_location(run_simulation), [42])
+        self.assertEqual(run_memory_location(lambda *args: run_simulation(*args, compiled=False)), [42])
+        if shutil.which(os.environ.get("CC", "cc")) is not None:
+            from litex.gen.sim.csim import run_c_simulation
+            with tempfile.TemporaryDirectory() as cache_dir:
+                self.assertEqual(run_memory_location(
+                    lambda *args: run_c_simulation(*args, cache_dir=cache_dir)), [42])
+
+    def test_snapshot_restore_fork(self):
+        def scenario(dut, results, value):
+            for i in range(8):
+                yield dut.ports[0].adr.eq(i)
+                yield dut.ports[0].dat_w.eq(value + i)
+                yield dut.ports[0].we.eq(0b11 if i % 2 else 0)
+                yield
+                results.append((yield dut.ports[0].dat_r))
+
+        def warmup(dut):
+            yield from scenario(dut, [], 0x100)
+
+        dut = MemoryDUT()
+        sim = Simulator(dut, warmup(dut))
+        sim.run()
+        snapshot = sim.snapshot()
+
+        results = {}
+        for value in (0x200, 0x300):
+            results[value] = []
+            sim.restore(snapshot, scenario(dut, results[value], value))
+            sim.run()
+        forked = []
+        sim.fork(scenario(dut, forked, 0x300), snapshot).run()
+
+        # reference, simulating the warmup again for each scenario
+        for value in (0x200, 0x300):
+            dut = MemoryDUT()
+            reference = []
+
+            def generator():
+                yield from warmup(dut)
+                yield from scenario(dut, reference, value)
+
+            run_simulation(dut, generator())
+            self.assertEqual(results[value], reference)
+        self.assertEqual(forked, results[0x300])
+
+    def test_wait_commands(self):
+        def run(waiter):
+            dut = Module()
+            counter = Signal(8)
+            strobe = Signal()
+            dut.sync += counter.eq(counter + 1)
+            dut.comb += strobe.eq(counter[2])
+            events = []
+
+            def generator():
+                for i in range(3):
+                    yield from waiter(counter, strobe)
+                    events.append((yield counter))
+
+            run_simulation(dut, generator())
+            return events
+
+        def cycles(counter, strobe):
+            for i in range(3):
+                yield
+        self.assertEqual(run(lambda counter, strobe: [(yield Wait(3))]), run(cycles))
+
+        def until(counter, strobe):
+            while not (yield counter[0:2] == 3):
+                yield
+        self.assertEqual(run(lambda counter, strobe: [(yield WaitUntil(counter[0:2] == 3))]),
+                         run(until))
+        self.assertEqual(run(until), [3, 3, 3])
+
+        def edge(counter, strobe):
+            previous = yield strobe
+            while True:
+                yield
+                value = yield strobe
+                if previous == 0 and value:
+                    break
+                previous = value
+        self.assertEqual(run(lambda counter, strobe: [(yield WaitEdge(strobe))]), run(edge))
+        self.assertEqual(run(edge), [4, 12, 20])
+        self.assertEqual(run(lambda counter, strobe: [(yield WaitEdge(strobe, "falling"))]),
+                         [8, 16, 24])
+
+    def test_wait_until_parks_generator(self):
+        dut = Module()
+        counter = Signal(16)
+        dut.sync += counter.eq(counter + 1)
+        resumed = []
+
+        def generator():
+            for i in range(4):
+                yield WaitUntil(counter == 100*(i + 1))
+                resumed.append((yield counter))
+
+        class CountedGenerator:
+            def __init__(self, generator):
+                self.generator = generator
+                self.sends = 0
+
+            def send(self, value):
+                self.sends += 1
+                return self.generator.send(value)
+
+        counted = CountedGenerator(generator())
+        run_simulation(dut, [counted])
+        self.assertEqual(resumed, [100, 200, 300, 400])
+        # two requests per wake up, instead of one resumption per cycle
+        self.assertLess(counted.sends, 16)
+
+    def test_vcd(self):
+        dut = Module()
+        counter = Signal(4)
+        dut.sync += counter.eq(counter + 1)
+        late = Signal(3)
+
+        def generator():
+            for i in range(4):
+                yield
+            yield late.eq(5)
+            yield
+
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, "sim.vcd")
+            run_simulation(dut, generator(), vcd_name=filename)
+            with open(filename) as f:
+                lines = f.read().splitlines()
+        variables = [line.split() for line in lines if line.startswith("$var")]
+        codes = {len(counter): None, len(late): None}
+        for var, wire, nbits, code, name, end in variables:
+            codes[int(nbits)] = code
+        self.assertEqual(len(variables), 3)
+        self.assertEqual(lines.count("$dumpvars"), 1)
+        self.assertIn("b0011 " + codes[4], lines)
+        self.assertIn("b101 " + codes[3], lines)
+        times = [int(line[1:]) for line in lines if line.startswith("#")]
+        self.assertEqual(times, sorted(times))
+
+    def test_vcd_late_signals(self):
+        a = Signal(4, name="a")
+        early = Signal(name="early")
+        late = Signal(2, name="late")
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, "sim.vcd")
+            vcd = VCDWriter(filename, buffer_size=8)
+            vcd.init([a])
+            # set before the header is written: declared in it
+            vcd.set(early, 1)
+            for i in range(16):
+                vcd.set(a, i)
+                vcd.delay(1)
+            self.assertEqual(vcd.late_signals, [])
+            # set after the header is written: the file is rewritten on close
+            vcd.set(late, 2)
+            self.assertEqual(vcd.late_signals, [late])
+            vcd.delay(1)
+            vcd.close()
+            with open(filename) as f:
+                lines = f.read().splitlines()
+        codes = {name: code for var, wire, nbits, code, name, end
+                 in (line.split() for line in lines if line.startswith("$var"))}
+        self.assertEqual(sorted(codes), ["a", "early", "late"])
+        self.assertEqual(lines.count("$dumpvars"), 1)
+        self.assertIn("1" + codes["early"], lines)
+        self.assertIn("b1111 " + codes["a"], lines)
+        self.assertIn("b10 " + codes["late"], lines)
+        times = [int(line[1:]) for line in lines if line.startswith("#")]
+        self.assertEqual(times, list(range(18)))
+
+    def test_trace_filters(self):
+        def trace(**kwargs):
+            dut = Module()
+            counter = Signal(8, name="counter")
+            other = Signal(8, name="other")
+            dut.sync += counter.eq(counter + 1), other.eq(counter)
+            with tempfile.TemporaryDirectory() as d:
+                filename = os.path.join(d, "sim.vcd")
+                run_simulation(dut, (None for i in range(64)), vcd_name=filename,
+                               trace_trigger=counter == 32 if kwargs.pop("trigger", False) else None,
+                               **kwargs)
+                with open(filename) as f:
+                    lines = f.read().splitlines()
+            names = [line.split()[4] for line in lines if line.startswith("$var")]
+            times = [int(line[1:]) for line in lines if line.startswith("#")]
+            return names, times
+
+        names, times = trace(trace_signals=["counter", "sys_*"])
+        self.assertEqual(sorted(names), ["counter", "sys_clk"])
+        self.assertEqual(times[-1], 64*10 + 5)
+
+        names, times = trace(trace_start=10, trace_end=20)
+        self.assertEqual(set(names), {"counter", "other", "sys_clk"})
+        self.assertEqual((times[0], times[-1]), (10*10, 20*10))
+
+        names, times = trace(trigger=True, trace_depth=(4, 2))
+        # counter is 32 from 315 to 325
+        self.assertEqual(times[0], 32*10 - 5 - 4*10)
+        self.assertEqual(times[-1], 32*10 + 5 + 2*10)
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, "profile.json")
+            self.assertEqual(run_constructs(compiled=True, profile=filename),
+                             run_constructs(compiled=True))
+            with open(filename) as f:
+                profile = json.load(f)
+        kinds = {statement["kind"] for statement in profile["statements"]}
+        self.assertEqual(kinds, {"comb", "sync", "generator"})
+        self.assertIn("top.fsm", [m["module"] for m in profile["modules"]])
+        self.assertGreater(profile["propagations"]["count"], 2*256)
+
+    def test_elaboration_cache(self):
+        from litex.gen.sim.cache import ElaborationCache
+
+        cache = ElaborationCache()
+        for dut_class, generator in ((ConstructsDUT, constructs_generator),
+                                     (MemoryDUT, memory_generator)):
+            for seed in range(3):
+                dut = dut_class()
+                reference = []
+                run_simulation(dut, generator(dut, reference, seed))
+                dut = dut_class()
+                trace = []
+                run_simulation(dut, generator(dut, trace, seed), cache=cache)
+                self.assertEqual(trace, reference)
+        self.assertEqual((cache.misses, cache.hits), (2, 4))
+
+        # memories of the new design are aliased to the cached ones
+        dut = MemoryDUT()
+        results = []
+        def generator():
+            yield dut.ports[1].adr.eq(3)
+            yield
+            results.append((yield dut.ports[1].dat_r))
+            results.append((yield dut.mem[3]))
+        run_simulation(dut, generator(), memory_init={dut.mem: [0x1234]*8}, cache=cache)
+        self.assertEqual(results, [0x1234, 0x1234])
+        self.assertEqual(cache.hits, 5)
+
+        # a different structure is a miss
+        class Counter(Module):
+            def __init__(self, step):
+                self.count = Signal(8, name="count")
+                self.sync += self.count.eq(self.count + step)
+        counts = []
+        for step in (1, 2, 1):
+            dut = Counter(step)
+            def generator():
+                for i in range(4):
+                    yield
+                counts.append((yield dut.count))
+            run_simulation(dut, generator(), cache=cache)
+        self.assertEqual(counts, [4, 8, 4])
+        self.assertEqual((cache.misses, cache.hits), (4, 6))
+
+    def test_run_simulations(self):
+        from functools import partial
+
+        jobs = [SimJob(partial(fifo_factory, depth), fifo_generators, name=str(depth))
+                for depth in (2, 4, 8, 16)]
+        jobs.append(SimJob(partial(fifo_factory, 4), failing_generators, name="failing"))
+        report = run_simulations(jobs, processes=2, seed=1)
+        self.assertEqual([r.name for r in report.failed], ["failing"])
+        self.assertIsInstance(report.failed[0].exception, ValueError)
+        self.assertRaises(RuntimeError, report.check)
+        for value in report.values[:4]:
+            self.assertEqual(value[0], None)
+            self.assertTrue(value[1][0])
+        self.assertIn("5 simulations, 1 failed", report.report())
+
+        # seeds only depend on the job index
+        serial = run_simulations(jobs, processes=1, seed=1)
+        self.assertEqual(serial.values[:4], report.values[:4])
+        self.assertNotEqual(run_simulations(jobs[:1], seed=2).values, report.values[:1])
+
+    def test_optimize(self):
+        dut = ConstructsDUT()
+        trace = []
+        run_simulation(dut, constructs_generator(dut, trace), optimize=True, keep=dut.outputs)
+        self.assertEqual(trace, run_constructs(True))
+
+        class Folded(Module):
+            def __init__(self):
+                self.enable = Signal(name="enable")
+                self.x = Signal(8, name="x")
+                self.y = Signal(8, name="y")
+                self.unused = Signal(8, name="unused")
+                self.comb += [
+                    self.enable.eq(1),
+                    self.y.eq(Cat(self.x[0:4], self.x[4:8]))
+                ]
+                self.sync += [
+                    If(self.enable, self.x.eq(self.x + Replicate(C(1, 1), 2))),
+                    self.unused.eq(self.unused + self.x)
+                ]
+
+        dut = Folded()
+        results = []
+        def generator():
+            for i in range(4):
+                yield
+            results.append((yield dut.y))
+            yield dut.unused
+
+        sim = Simulator(dut, generator(), optimize=True, keep=[dut.y])
+        with self.assertRaises(ValueError):
+            sim.run()
+        self.assertEqual(results, [12])
+        self.assertIn(dut.unused, sim.evaluator.pruned)
+        self.assertEqual(sim.fragment.comb[-1].r, dut.x)
+        self.assertIsInstance(sim.fragment.sync["sys"][0], _Assign)
+
+    def test_optimize_memory_writes(self):
+        def run(read_port, **kwargs):
+            dut = Module()
+            mem = Memory(8, 4, name="mem")
+            dut.specials += mem
+            o = Signal(8, name="o")
+            if read_port:
+                port = mem.get_port(async_read=True)
+                dut.specials += port
+                dut.comb += port.adr.eq(1), o.eq(port.dat_r)
+            else:
+                dut.comb += o.eq(mem[1])
+            unread = Memory(8, 4, name="unread")
+            dut.specials += unread
+            dut.sync += mem[1].eq(42), unread[1].eq(42)
+            results = []
+
+            def generator():
+                for i in range(3):
+                    yield
+                results.append((yield o))
+
+            sim = Simulator(dut, generator(), keep=[o], **kwargs)
+            sim.run()
+            return results, sim.fragment.sync["sys"]
+
+        for read_port in (True, False):
+            self.assertEqual(run(read_port)[0], [42])
+            # memory writes are kept when the memory is read by a port or a
+            # kept statement, and removed otherwise
+            results, statements = run(read_port, optimize=True)
+            self.assertEqual(results, [42])
+            self.assertEqual(len(statements), 1)
+
+    def test_coverage(self):
+        with tempfile.TemporaryDirectory() as d:
+            reports = []
+            for compiled in (True, False):
+                filename = os.path.join(d, "coverage{}.json".format(len(reports)))
+                self.assertEqual(run_constructs(compiled, coverage=filename), run_constructs(True))
+                with open(filename) as f:
+                    reports.append(json.load(f))
+
+        report = reports[0]
+        self.assertEqual(report["toggle"]["top.sys_clk"], {"width": 1, "rose": 1, "fell": 1})
+        self.assertIn({"width": 8, "rose": 0xff, "fell": 0xff}, report["toggle"].values())
+        fsm = report["fsm"]["top.fsm"]
+        self.assertEqual(set(fsm["states"]), {"IDLE", "RUN"})
+        self.assertGreater(fsm["states"]["RUN"], 0)
+        self.assertGreater(fsm["transitions"]["IDLE->RUN"], 0)
+        decoded = report["cases"]["top:case0"]
+        self.assertEqual(set(decoded), {"0", "1", "default"})
+        self.assertTrue(all(decoded.values()))
+        self.assertEqual(reports[1], report)
+
+        merged = merge_coverage(*reports)
+        self.assertEqual(merged["toggle"], report["toggle"])
+        self.assertEqual(merged["fsm"]["top.fsm"]["states"]["RUN"], 2*fsm["states"]["RUN"])
+        self.assertEqual(set(merged["cases"]), set(report["cases"]))
+
+    def test_time_manager(self):
+        from litex.gen.sim.core import TimeManager
+
+        def reference(description, n):
+            # scans all clocks at each edge
+            clocks = TimeManager(description).clocks
+            state = {k: [cs.high, cs.half_period, cs.time_before_trans]
+                     for k, cs in clocks.items()}
+            for i in range(n):
+                dt = min(cs[2] for cs in state.values())
+                rising, falling = [], []
+                for k, cs in state.items():
+                    if cs[2] == dt:
+                        cs[0] = not cs[0]
+                        (rising if cs[0] else falling).append(k)
+                    cs[2] -= dt
+                    if not cs[2]:
+                        cs[2] += cs[1]
+                yield dt, tuple(rising), tuple(falling)
+
+        description = {"a": 10, "b": (6, 2), "c": 14, "d": (8, 5)}
+        expected = list(reference(description, 500))
+        for max_table in (4096, 0):
+            time = TimeManager(description, max_table=max_table)
+            self.assertEqual(time.table is None, max_table == 0)
+            self.assertEqual([time.tick() for i in range(500)], expected)
+
+        # switching the active clocks keeps their phase
+        time = TimeManager(description)
+        time.set_active(["a"])
+        ticks = [time.tick() for i in range(7)]
+        self.assertEqual([dt for dt, rising, falling in ticks], [5]*7)
+        time.set_active(description.keys())
+        t = time.t
+        for dt, rising, falling in reference(description, 500):
+            t -= dt
+            if t < 0:
+                self.assertEqual(time.tick(), (-t, rising, falling))
+                break
+
+    def test_inactive_clocks_skipped(self):
+        dut = Module()
+        counter = Signal(8, name="counter")
+        dut.sync += counter.eq(counter + 1)
+        dut.clock_domains += ClockDomain("idle")
+        results = []
+
+        def generator():
+            for i in range(10):
+                yield
+            results.append((yield counter))
+
+        sim = Simulator(dut, generator(), clocks={"sys": 10, "idle": 3})
+        sim.run()
+        self.assertEqual(sim.time.active, ("sys",))
+        self.assertEqual(results, [10])
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_batch_comb_only(self):
+        from litex.gen.sim.batch import run_batch_simulation
+
+        dut = Module()
+        a = Signal(8, name="a")
+        b = Signal(8, name="b")
+        dut.comb += b.eq(a + 1)
+        results = [[] for lane in range(3)]
+
+        def generator(lane):
+            for i in range(4):
+                yield a.eq(lane*10 + i)
+                yield
+                results[lane].append((yield b))
+
+        run_batch_simulation(dut, [generator(lane) for lane in range(3)])
+        self.assertEqual(results, [[lane*10 + i + 1 for i in range(4)] for lane in range(3)])
+
+    def test_comm_sim(self):
+        import socket
+        import threading
+        from litex.tools.remote.comm_sim import CommSim
+        from litex.tools.litex_server import RemoteServer
+        from litex.tools.litex_client import RemoteClient
+
+        sram = wishbone.SRAM(64)
+        comm = CommSim(sram.bus)
+        thread = threading.Thread(target=run_simulation, args=(sram, comm.generator()))
+        thread.start()
+        try:
+            comm.write(0x10, [1, 2, 3])
+            self.assertEqual(comm.read(0x10, 3), [1, 2, 3])
+            self.assertEqual(comm.read(0x14), 2)
+
+            with socket.socket() as s:
+                s.bind(("localhost", 0))
+                port = s.getsockname()[1]
+            server = RemoteServer(comm, "localhost", port)
+            server.open()
+            server.start(2)
+            client = RemoteClient(port=port, csr_csv=None, csr_data_width=32)
+            client.open()
+            client.write(0x20, [0x12345678, 0xdeadbeef])
+            self.assertEqual(client.read(0x20, 2), [0x12345678, 0xdeadbeef])
+            self.assertEqual(client.read(0x14), 2)
+            client.close()
+            server.close()
+        finally:
+            comm.close()
+            thread.join()
+        self.assertGreaterEqual(comm.transactions, 5)
+        self.assertRaises(IOError, comm.read, 0)
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_batch_matches_scalar(self):
+        from litex.gen.sim.batch import run_batch_simulation
+
+        for dut_class, generator in ((ConstructsDUT, constructs_generator),
+                                     (MemoryDUT, memory_generator)):
+            references = []
+            for seed in range(4):
+                dut = dut_class()
+                references.append([])
+                run_simulation(dut, generator(dut, references[-1], seed))
+            dut = dut_class()
+            traces = [[] for seed in range(4)]
+            run_batch_simulation(dut, [generator(dut, traces[seed], seed) for seed in range(4)])
+            self.assertEqual(traces, references)
+
+    @unittest.skipIf(shutil.which(os.environ.get("CC", "cc")) is None, "no C compiler")
+    def test_c_matches_python(self):
+        from litex.gen.sim.csim import run_c_simulation
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for dut_class, generator in ((ConstructsDUT, constructs_generator),
+                                         (MemoryDUT, memory_generator)):
+                for seed in range(2):
+                    dut = dut_class()
+                    reference = []
+                    run_simulation(dut, generator(dut, reference, seed))
+                    dut = dut_class()
+                    trace = []
+                    run_c_simulation(dut, generator(dut, trace, seed), cache_dir=cache_dir)
+                    self.assertEqual(trace, reference)
+            self.assertEqual(len([f for f in os.listdir(cache_dir) if f.endswith(".so")]), 2)
+
+            dut = wishbone.SRAM(256, init=[0x01234567, 0x89abcdef])
+            results = []
+
+            def sram_generator():
+                results.append((yield from dut.bus.read(0)))
+                yield from dut.bus.write(2, 0xdeadbeef, sel=0b0101)
+                results.append((yield from dut.bus.read(2)))
+                yield Wait(3)
+                results.append((yield dut.bus.ack))
+
+            run_c_simulation(dut, sram_generator(), cache_dir=cache_dir)
+            self.assertEqual(results, [0x01234567, 0x00ad00ef, 0])
+
+    def test_compiled_fifo(self):
+        dut = SyncFIFO([("data", 8)], 4)
+        datas = [random.Random(1).randrange(2**8) for i in range(32)]
+        received = []
+
+        def producer():
+            for data in datas:
+                yield dut.sink.valid.eq(1)
+                yield dut.sink.data.eq(data)
+                yield
+                while not (yield dut.sink.ready):
+                    yield
+            yield dut.sink.valid.eq(0)
+
+        def consumer():
+            yield dut.source.ready.eq(1)
+            while len(received) < len(datas):
+                yield
+                if (yield dut.source.valid):
+                    received.append((yield dut.source.data))
+
+        run_simulation(dut, [producer(), consumer()])
+        self.assertEqual(received, datas)
+
+    def test_compiled_gearbox(self):
+        def run_gearbox(run):
+            dut = Gearbox(8, 12)
+            datas = [(7*i + 3) % 2**8 for i in range(48)]
+            received = []
+
+            def producer():
+                for data in datas:
+                    yield dut.sink.valid.eq(1)
+                    yield dut.sink.data.eq(data)
+                    yield
+                    while not (yield dut.sink.ready):
+                        yield
+
+            def consumer():
+                yield dut.source.ready.eq(1)
+                while len(received) < len(datas)*8//12 - 2:
+                    yield
+                    if (yield dut.source.valid):
+                        received.append((yield dut.source.data))
+
+            run(dut, [producer(), consumer()])
+            return received
+
+        reference = run_gearbox(migen_run_simulation)
+        self.assertEqual(len(reference), 30)
+        self.assertEqual(run_gearbox(run_simulation), reference)
+        self.assertEqual(run_gearbox(lambda *args: run_simulation(*args, compiled=False)), reference)
+
+    def test_compiled_sram(self):
+        dut = wishbone.SRAM(256, init=[0x01234567, 0x89abcdef])
+        results = []
+
+        def generator():
+            results.append((yield from dut.bus.read(0)))
+            results.append((yield from dut.bus.read(1)))
+            yield from dut.bus.write(2, 0xdeadbeef, sel=0b0101)
+            results.append((yield from dut.bus.read(2)))
+
+        run_simulation(dut, generator())
+        self.assertEqual(results, [0x01234567, 0x89abcdef, 0x00ad00ef])
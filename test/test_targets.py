@@ -4,24 +4,28 @@
 
 import subprocess
 import unittest
+import tempfile
 import os
 
 from migen import *
 
 from litex.soc.integration.builder import *
+from litex.soc.integration.parallel_builder import *
 
 
 RUNNING_ON_TRAVIS = (os.getenv('TRAVIS', 'false').lower() == 'true')
 
 
 def build_test(socs):
-    errors = 0
-    for soc in socs:
-        os.system("rm -rf build")
-        builder = Builder(soc, output_dir="./build", compile_software=False, compile_gateware=False)
-        builder.build()
-        errors += not os.path.isfile("./build/gateware/top.v")
-    os.system("rm -rf build")
+    with tempfile.TemporaryDirectory() as build_dir:
+        targets = [BuildTarget(soc, builder_kwargs=dict(compile_software=False, compile_gateware=False))
+            for soc in socs]
+        results = build_targets(targets, output_dir=build_dir, verbose=False)
+        errors = 0
+        for result in results:
+            if not result.success:
+                print(result.error)
+            errors += not os.path.isfile(os.path.join(result.output_dir, "gateware", "top.v"))
     return errors
 
 
@@ -29,64 +33,64 @@ class TestTargets(unittest.TestCase):
     # Altera boards
     def test_de0nano(self):
         from litex.boards.targets.de0nano import BaseSoC
-        errors = build_test([BaseSoC()])
+        errors = build_test([BaseSoC])
         self.assertEqual(errors, 0)
 
     # Xilinx boards
     # Spartan-6
     def test_minispartan6(self):
         from litex.boards.targets.minispartan6 import BaseSoC
-        errors = build_test([BaseSoC()])
+        errors = build_test([BaseSoC])
         self.assertEqual(errors, 0)
 
     # Artix-7
     def test_arty(self):
         from litex.boards.targets.arty import BaseSoC, EthernetSoC
-        errors = build_test([BaseSoC(), EthernetSoC()])
+        errors = build_test([BaseSoC, EthernetSoC])
         self.assertEqual(errors, 0)
 
     def test_netv2(self):
         from litex.boards.targets.netv2 import BaseSoC, EthernetSoC
-        errors = build_test([BaseSoC(), EthernetSoC()])
+        errors = build_test([BaseSoC, EthernetSoC])
         self.assertEqual(errors, 0)
 
     def test_nexys4ddr(self):
         from litex.boards.targets.nexys4ddr import BaseSoC
-        errors = build_test([BaseSoC()])
+        errors = build_test([BaseSoC])
         self.assertEqual(errors, 0)
 
     def test_nexys_video(self):
         from litex.boards.targets.nexys_video import BaseSoC, EthernetSoC
-        errors = build_test([BaseSoC(), EthernetSoC()])
+        errors = build_test([BaseSoC, EthernetSoC])
         self.assertEqual(errors, 0)
 
     # Kintex-7
     def test_genesys2(self):
         from litex.boards.targets.genesys2 import BaseSoC, EthernetSoC
-        errors = build_test([BaseSoC(), EthernetSoC()])
+        errors = build_test([BaseSoC, EthernetSoC])
         self.assertEqual(errors, 0)
 
     def test_kc705(self):
         from litex.boards.targets.kc705 import BaseSoC, EthernetSoC
-        errors = build_test([BaseSoC(), EthernetSoC()])
+        errors = build_test([BaseSoC, EthernetSoC])
         self.assertEqual(errors, 0)
 
     # Kintex-Ultrascale
     def test_kcu105(self):
         from litex.boards.targets.kcu105 import BaseSoC
-        errors = build_test([BaseSoC()])
+        errors = build_test([BaseSoC])
         self.assertEqual(errors, 0)
 
     # Lattice boards
     # ECP5
     def test_versa_ecp5(self):
         from litex.boards.targets.versa_ecp5 import BaseSoC
-        errors = build_test([BaseSoC()])
+        errors = build_test([BaseSoC])
         self.assertEqual(errors, 0)
 
     def test_ulx3s(self):
         from litex.boards.targets.ulx3s import BaseSoC
-        errors = build_test([BaseSoC()])
+        errors = build_test([BaseSoC])
         self.assertEqual(errors, 0)
 
     # Build simple design for all platforms
@@ -0,0 +1,224 @@
+# This file is Copyright (c) 2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# License: BSD
+
+import io
+import os
+import json
+import time
+import tempfile
+import unittest
+import contextlib
+from functools import reduce
+from operator import xor
+
+from migen import *
+
+from litex.gen.fhdl import verilog
+from litex.build.generic_platform import GenericPlatform, Pins
+
+
+class Block(Module):
+    def __init__(self, n):
+        self.a = a = Signal(32, name="a")
+        self.b = b = Signal(32, name="b")
+        c = Signal(32, name="c")
+        d = Signal(8, name="d")
+        self.sync += [
+            If(a[0],
+                b.eq(b + a)
+            ).Elif(a[1],
+                b.eq(b - 1)
+            ).Else(
+                b.eq(Cat(a[16:], a[:16]))
+            ),
+            d.eq(c[:8])
+        ]
+        self.comb += Case(d, {k: c.eq(a ^ k) for k in range(16)})
+        self.specials += Memory(32, 16, init=list(range(16)), name="mem{}".format(n))
+
+
+class LargeDesign(Module):
+    def __init__(self, n):
+        blocks = [Block(i) for i in range(n)]
+        self.submodules += blocks
+        self.o = Signal(32, name="o")
+        self.comb += self.o.eq(reduce(xor, [block.b for block in blocks]))
+
+
+class Counter(Module):
+    def __init__(self, width):
+        self.en = Signal(name="en")
+        self.value = Signal(width, name="value")
+        self.sync += If(self.en, self.value.eq(self.value + 1))
+
+
+class HierarchicalDesign(Module):
+    def __init__(self):
+        self.i = Signal(name="i")
+        self.o = Signal(8, name="o")
+        self.submodules.c0 = Counter(8)
+        self.submodules.c1 = Counter(8)
+        self.submodules.c2 = Counter(4)
+        self.comb += [
+            self.c0.en.eq(self.i),
+            self.c1.en.eq(self.c0.value[0]),
+            self.c2.en.eq(1)
+        ]
+        self.sync += self.o.eq(self.c0.value + self.c1.value + self.c2.value)
+        # a signal driven from two modules
+        self.x = Signal(2, name="x")
+        self.comb += self.x[0].eq(self.i)
+        self.submodules.driver = driver = Module()
+        driver.comb += self.x[1].eq(self.o[0])
+
+
+def _strip_banner(source):
+    return source.split("\n", 3)[3]
+
+
+def _convert_time(n):
+    best = None
+    for i in range(2):
+        fragment = LargeDesign(n).get_fragment()
+        start = time.perf_counter()
+        verilog.convert(fragment)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class TestVerilog(unittest.TestCase):
+    def test_streamed(self):
+        dut = LargeDesign(4)
+        source = verilog.convert(dut, {dut.o}).main_source
+        with tempfile.TemporaryDirectory() as build_dir:
+            filename = os.path.join(build_dir, "top.v")
+            dut = LargeDesign(4)
+            output = verilog.convert(dut, {dut.o}, filename=filename)
+            with open(filename) as f:
+                streamed = f.read()
+            self.assertEqual(_strip_banner(streamed), _strip_banner(source))
+            self.assertEqual(output.main_source, streamed)
+            self.assertIn("endmodule", streamed)
+            cwd = os.getcwd()
+            os.chdir(build_dir)
+            try:
+                output.write("top.v")
+                output.write("copy.v")
+                with open("copy.v") as f:
+                    self.assertEqual(f.read(), streamed)
+                self.assertTrue(output.data_files)
+                self.assertTrue(all(os.path.exists(data_file) for data_file in output.data_files))
+            finally:
+                os.chdir(cwd)
+
+    def test_hierarchical(self):
+        dut = HierarchicalDesign()
+        source = verilog.convert(dut, {dut.i, dut.o}, hierarchical=True).main_source
+        modules = [l for l in source.splitlines() if l.startswith("module ")]
+        # identical counters share their module
+        self.assertEqual(modules, ["module top_counter(", "module top_counter_1(", "module top("])
+        self.assertEqual(source.count("top_counter c"), 2)
+        self.assertEqual(source.count("top_counter_1 c"), 1)
+        self.assertIn("\tinput en,\n\toutput reg [7:0] value = 8'd0,", source)
+        # the module driving x is inlined into its parent
+        self.assertNotIn(" driver(", source)
+        self.assertIn("x[1] <= o[0];", source)
+
+        # modules finalized before the conversion give the same output
+        dut = HierarchicalDesign()
+        dut.finalize()
+        finalized = verilog.convert(dut, {dut.i, dut.o}, hierarchical=True).main_source
+        self.assertEqual(_strip_banner(finalized), _strip_banner(source))
+
+    def test_hierarchical_names(self):
+        class CRG(Module):
+            def __init__(self):
+                self.clock_domains.cd_sys = ClockDomain("sys")
+                self.clk = Signal(name="clk")
+                self.toggle = Signal(name="toggle")
+                self.comb += self.cd_sys.clk.eq(self.clk)
+                self.sync += self.toggle.eq(~self.toggle)
+
+        class Top(Module):
+            def __init__(self):
+                self.clk = Signal(name="clk")
+                self.o = Signal(name="o")
+                self.submodules.crg = crg = CRG()
+                self.comb += crg.clk.eq(self.clk)
+                self.sync += self.o.eq(~self.o)
+
+        dut = Top()
+        r = verilog.convert(dut, {dut.clk, dut.o}, hierarchical=True)
+        # signals of submodules are named by their hierarchical path
+        self.assertEqual(r.ns.get_name(dut.o), "o")
+        name = r.ns.get_name(dut.crg.toggle)
+        instance, signal = name.split("/")
+        self.assertIn(" " + instance + "(", r.main_source)
+        self.assertIn("reg " + signal + " = 1'd0;", r.main_source)
+        self.assertEqual(r.ns.get_name(ClockSignal("sys")), r.ns.get_name(dut.crg.cd_sys.clk))
+
+    def test_profile(self):
+        dut = LargeDesign(2)
+        profile = verilog.convert(dut, {dut.o}).profile
+        passes = list(profile.entries.keys())
+        self.assertEqual(passes[:6], ["get_fragment", "lower_complex_slices",
+            "insert_resets", "lower_basics", "lower_specials", "lower_basics_specials"])
+        self.assertIn("build_namespace", passes)
+        self.assertIn("print_comb", passes)
+        # counts are only collected on request
+        self.assertIsNone(profile.entries["lower_basics"].nodes)
+
+        with tempfile.TemporaryDirectory() as build_dir:
+            filename = os.path.join(build_dir, "profile.json")
+            dut = LargeDesign(2)
+            profile = verilog.convert(dut, {dut.o}, profile=filename).profile
+            self.assertGreater(profile.entries["lower_basics"].nodes, 0)
+            self.assertGreater(profile.entries["lower_basics"].signals, 0)
+            with open(filename) as f:
+                report = json.load(f)
+            self.assertEqual([p["name"] for p in report["passes"]], list(profile.entries.keys()))
+            self.assertAlmostEqual(report["time"], profile.time)
+            self.assertIn("lower_specials", profile.report())
+
+        dut = HierarchicalDesign()
+        profile = verilog.convert(dut, {dut.i, dut.o}, hierarchical=True).profile
+        self.assertEqual(profile.entries["lower"].calls, 5)
+
+    def test_platform_profile(self):
+        def get_verilog(**kwargs):
+            platform = GenericPlatform("device", [("o", 0, Pins("X"))], name="test")
+            dut = Module()
+            o = platform.request("o")
+            dut.comb += o.eq(1)
+            return platform.get_verilog(dut, **kwargs)
+
+        # the profile is printed once, including the platform passes
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            profile = get_verilog(profile=True).profile
+        self.assertEqual(output.getvalue().count("Verilog conversion profile"), 1)
+        self.assertIn("get_io_signals", profile.entries)
+
+        with tempfile.TemporaryDirectory() as build_dir:
+            filename = os.path.join(build_dir, "profile.txt")
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                get_verilog(profile=filename, filename=os.path.join(build_dir, "top.v"))
+            self.assertEqual(output.getvalue(), "")
+            with open(filename) as f:
+                self.assertEqual(f.read().count("Verilog conversion profile"), 1)
+
+        # without profile, nothing is printed or written next to the sources
+        with tempfile.TemporaryDirectory() as build_dir:
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                get_verilog(filename=os.path.join(build_dir, "top.v"))
+            self.assertEqual(output.getvalue(), "")
+            self.assertEqual(os.listdir(build_dir), ["top.v"])
+
+    def test_conversion_benchmark(self):
+        # conversion time must scale linearly with the size of the design
+        small = _convert_time(25)
+        large = _convert_time(100)
+        self.assertLess(large, 10*small)